@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+"""
+WTA Cleaning Benchmark
+Author: Joseph DeGregorio
+
+Description:  This python script compares the cleaning utilities in cleanpy
+against the row by row code they replaced, on synthetic tables large enough
+to show how each scales.  Each case checks that both versions give the same
+result before their run times are reported.
+
+"""
+# =============================================================================
+#                                   Setup
+# =============================================================================
+
+# Load Libraries
+import contextlib
+import io
+import time
+import numpy as np
+import pandas as pd
+import cleanpy
+import WTA_Cleaning_Parity
+
+# Set number of synthetic rows
+n_rows = 200000
+
+# Set number of rows the original versions are run on (the row by row code
+# slows down faster than linearly, so it is timed and checked on a sample)
+n_original = 20000
+
+# Set number of timed runs of each new version (best run is reported)
+repeats = 3
+
+# =============================================================================
+#                                 Build Data
+# =============================================================================
+print('Building Data...', end='')
+
+def makehikes( n ):
+    # Generate n synthetic hikes with Region, Location and Trailhead as scraped
+    # (Location repeats its Region and Trailhead repeats its Location)
+    rng = np.random.default_rng(0)
+    regions = ['Central Cascades', 'Issaquah Alps', 'Mount Rainier Area', 'North Cascades',
+               'Olympic Peninsula', 'Puget Sound and Islands', 'Snoqualmie Region']
+    region = rng.choice(regions, n).astype(object)
+    location = np.array(['%s -- Area %d' % (r, k) for r, k in zip(region, rng.integers(0, 20, n))], dtype = object)
+    trailhead = np.array(['%s Trailhead %d See weather forecast' % (l, k) for l, k in zip(location, rng.integers(0, 100, n))], dtype = object)
+
+    # Missing values (only where the original loop does not fail on them)
+    missing = rng.random(n) < 0.05
+    region[missing] = np.nan
+    location[missing & (rng.random(n) < 0.5)] = np.nan
+    trailhead[pd.isnull(location) & (rng.random(n) < 0.5)] = np.nan
+
+    return pd.DataFrame({'Region': region, 'Location': location, 'Trailhead': trailhead})
+
+def makeconditions( n , n_cols = 80):
+    # Generate n synthetic reports with pivoted Cond_/Feat_ columns, a few of
+    # which repeat another column (columns share one null ordering, so equal
+    # null counts are in the same rows, as the original code requires)
+    rng = np.random.default_rng(0)
+    order = rng.permutation(n)
+    cols = {}
+    for j in range(n_cols):
+        if (j > 0) and (rng.random() < 0.2):
+            col = cols[rng.choice(list(cols))].copy()
+        elif j % 2:
+            col = pd.Series(rng.choice(['Snow free', 'Patchy snow', 'Icy'], n), dtype = object)
+            col = col.where(order >= rng.integers(0, n)).values
+        else:
+            col = pd.Series(rng.random(n) < 0.5, dtype = object)
+            col = col.where(order >= rng.integers(0, n)).values
+        cols['%s_%d' % (['Feat', 'Cond'][j % 2], j)] = col
+    return pd.DataFrame(cols)
+
+df_hikes = makehikes(n_rows)
+df_conditions = makeconditions(n_rows)
+
+print('Complete')
+# =============================================================================
+#                                Cases
+# =============================================================================
+
+def striploop( df_hikes ):
+    # Strip repeated text from Location and Trailhead (original hike cleaning loop)
+    pd.options.mode.chained_assignment = None
+    for i in list(range(0,df_hikes.shape[0])):
+        #Clean Trailhead
+        if type(df_hikes.Location[i]) == str:
+            pat = df_hikes.Location[i]
+            df_hikes.Trailhead[i] = df_hikes.Trailhead[i].replace(pat, '').strip()
+        #Clean Location
+        if type(df_hikes.Region[i]) == str:
+            pat = df_hikes.Region[i] + ' -- '
+            df_hikes.Location[i] = df_hikes.Location[i].replace(pat, '').strip()
+    pd.options.mode.chained_assignment = 'warn'
+    return df_hikes
+
+def stripvector( df_hikes ):
+    # Strip repeated text from Location and Trailhead (cleanpy.stripsubstrings)
+    cleanpy.stripsubstrings(df_hikes, 'Trailhead', 'Location', inplace = True)
+    cleanpy.stripsubstrings(df_hikes, 'Location', 'Region', suffix = ' -- ', inplace = True)
+    return df_hikes
+
+def dropdupcolpairs( df ):
+    # Drop duplicate columns (original dropdupcol, compares every pair of columns)
+    with contextlib.redirect_stdout(io.StringIO()):
+        WTA_Cleaning_Parity.dropdupcolpairs(df)
+    return df
+
+def dropdupcolhash( df ):
+    # Drop duplicate columns (cleanpy.dropdupcol)
+    with contextlib.redirect_stdout(io.StringIO()):
+        cleanpy.dropdupcol(df)
+    return df
+
+# Define cases as [data, original version, new version]
+cases = {'Location/Trailhead de-duplication': [df_hikes, striploop, stripvector],
+         'Duplicate columns': [df_conditions, dropdupcolpairs, dropdupcolhash]}
+
+# =============================================================================
+#                                 Benchmark
+# =============================================================================
+print('Benchmarking...')
+
+def timeversion( func , df , repeats = 1 ):
+    # Best run time and result of func over repeated runs on copies of df
+    seconds = []
+    for _ in range(repeats):
+        df_run = df.copy(deep = True)
+        start = time.perf_counter()
+        result = func(df_run)
+        seconds.append(time.perf_counter() - start)
+    return min(seconds), result
+
+for case, (df, original, new) in cases.items():
+    df_sample = df.head(n_original)
+
+    # Check results on the sample, then time the new version on every row
+    seconds_original, result_original = timeversion(original, df_sample)
+    seconds_sample, result_sample = timeversion(new, df_sample)
+    seconds_new, result_new = timeversion(new, df, repeats)
+
+    print('\n%s' % case)
+    print('          Results match:  %s' % (result_original.equals(result_sample)))
+    print('          Original rows:  %d' % (df_sample.shape[0]))
+    print('   Original time (secs):  %f' % (seconds_original))
+    print('               New rows:  %d' % (df.shape[0]))
+    print('        New time (secs):  %f' % (seconds_new))
+    print('  Speedup (per row time):  %f' % ((seconds_original/df_sample.shape[0])/(seconds_new/df.shape[0])))
@@ -0,0 +1,714 @@
+# -*- coding: utf-8 -*-
+"""
+WTA Cleaning Parity Check
+Author: Joseph DeGregorio
+
+Description:  This python script checks that the faster cleaning utilities
+in cleanpy give the same results as the code they replaced.  Randomized
+series and tables (shared prefixes and suffixes, missing values, booleans,
+short and long strings) are run through both versions with a range of
+settings, and every mismatch is reported.
+
+"""
+# =============================================================================
+#                                   Setup
+# =============================================================================
+
+# Load Libraries
+import contextlib
+import io
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+import cleanpy
+
+sys.path.append('../Scraper')
+import extractpy
+import standinpy
+
+# Set number of random series and tables to check
+n_series = 3000
+n_tables = 100
+
+# Set number of random tables to check for duplicate columns
+n_wide = 1000
+
+# Set number of random molten tables to check pivots on
+n_molten = 1000
+
+# Set number of stand-in hikes cleaned in full and in incremental runs (and
+# the number of them changed or added by the incremental run)
+n_hikes = 120
+n_changed = 15
+
+# Set length of the long text series that are timed
+n_long = 20000
+
+# =============================================================================
+#                            Original Versions
+# =============================================================================
+
+def chopseriesloop( s , search = 'end', nuq_min = 1, nuq_max = 5, thres = 0.3, char_min = 4):
+    # Original chopseries (counts the unique patterns at every chop length)
+    chop_locs = []
+    chop_loc = 0
+    patterns = []
+
+    if s.dtype != 'object':
+        return chop_loc, patterns
+
+    unique = list(s[s.notnull()].unique())
+    if True in unique:
+        unique.remove(True)
+    if False in unique:
+        unique.remove(False)
+
+    if len(unique) == 0:
+        return chop_loc, patterns
+
+    len_min = len(min(unique, key=len))
+    iter_list = list(reversed(range(char_min, len_min)))
+
+    for i in iter_list:
+        if search == 'start':
+            n_unique = s[s.notnull()].str[:i].nunique()
+        elif search == 'end':
+            n_unique = s[s.notnull()].str[-i:].nunique()
+        else:
+            print('Error:  Enter Valid Search Direction')
+            return chop_loc, patterns
+
+        if (n_unique >= nuq_min) & (n_unique <= nuq_max) & (n_unique/len(unique) <= thres):
+            chop_locs.append(i)
+
+    if len(chop_locs) > 0:
+        chop_loc = max(chop_locs)
+        if search == 'start':
+            patterns = list(s[s.notnull()].str[:chop_loc].unique())
+        elif search == 'end':
+            patterns = list(s[s.notnull()].str[-chop_loc:].unique())
+        else:
+            print('Error:  Enter Valid Search Direction')
+
+    return chop_loc, patterns
+
+def dropdupcolpairs( df ):
+    # Original dropdupcol (compares every pair of columns)
+    cols = list(df.columns)
+    cols_drop = []
+    for col_1 in cols:
+        for col_2 in cols:
+            if cols.index(col_1) >= cols.index(col_2):
+                continue
+            if df[col_1].isnull().sum() != df[col_2].isnull().sum():
+                continue
+            index_na_1 = df[col_1].index[df[col_1].isnull()]
+            index_na_2 = df[col_2].index[df[col_2].isnull()]
+            test_na = list(~(index_na_1 == index_na_2))
+            test_vals = list(~(df[col_1][df[col_1].notna()] == df[col_2][df[col_2].notna()]))
+            if (sum(test_na) + sum(test_vals)) == 0:
+                print('Duplicate Columns: %s, %s' % (col_1, col_2))
+                cols_drop.append(col_2)
+
+    cols_drop = list(set(cols_drop))
+    print('\nDropping Columns:  ')
+    for col in cols_drop:
+        print('    %s' % col)
+        df.drop(columns = col, inplace=True)
+
+    return
+
+def chopsubstringscopy( pddf , exclude = None, inplace = False):
+    # Original chopsubstrings (copies the frame, chops each end separately)
+
+    #Gather Columns
+    df  = pddf.copy(deep = True)
+    cols = list(df.select_dtypes('object').columns)
+
+    #Remove excluded columns
+    if exclude != None:
+        for exclusion in exclude:
+            cols.remove(exclusion)
+
+    #Iterate through columns
+    for col in cols:
+
+        #Set Intial Values
+        chop_start_text = ''
+        chop_end_text = ''
+
+        #Define Series
+        s = df[col]
+
+        #Find chop location and patterns from START
+        chop_start_loc, patterns_start = chopseriesloop(s,
+                                                    search = 'start',
+                                                    nuq_min = 1,
+                                                    nuq_max = 1,
+                                                    char_min = 1,
+                                                    thres = 1
+                                                    )
+
+        #Define the start text that is being chopped
+        if len(patterns_start) > 0:
+            chop_start_text = patterns_start[0]
+
+        #Find chop location and patterns from END
+        chop_end_loc, patterns_end = chopseriesloop(s,
+                                                search = 'end',
+                                                nuq_min = 1,
+                                                nuq_max = 1,
+                                                char_min = 1,
+                                                thres = 1
+                                                )
+
+        #Define the text that is being chopped
+        if len(patterns_end) > 0:
+            chop_end_text = patterns_end[0]
+
+        #Print result header
+        if (len(chop_start_text) > 0) | (len(chop_end_text) > 0):
+            print('\nModifying Column:  %s' % col)
+
+        #Chop Start
+        if len(chop_start_text) > 0:
+            print('   Removing "%s" from start' % chop_start_text)
+            if inplace:
+                pddf[col] = pddf[col].str[chop_start_loc:]
+            else:
+                df[col] = df[col].str[chop_start_loc:]
+
+        #Chop End
+        if len(chop_end_text) > 0:
+            print('   Removing "%s" from end' % chop_end_text)
+            if inplace:
+                pddf[col] = pddf[col].str[:-chop_end_loc]
+            else:
+                df[col] = df[col].str[:-chop_end_loc]
+
+    if not inplace:
+        return df
+
+def splitsubstringscopy( pddf , exclude = None, nuq_max = 5, inplace = False):
+    # Original splitsubstrings (copies the frame, re-slices the column for
+    # every pattern)
+
+    #Import
+    import numpy as np
+
+    #Gather Columns
+    df  = pddf.copy(deep = True)
+    cols = list(df.select_dtypes('object').columns)
+
+    #Remove excluded columns
+    if exclude != None:
+        for exclusion in exclude:
+            cols.remove(exclusion)
+
+    #Iterate through columns
+    for col in cols:
+
+        #Define Series
+        s = df[col]
+
+        #Find chop location and patterns
+        for srch in ['start', 'end']:
+            chop_loc, patterns = chopseriesloop(s,
+                                            search = srch,
+                                            nuq_min = 2,
+                                            nuq_max = nuq_max,
+                                            char_min = 5,
+                                            thres = 0.5
+                                            )
+
+            if chop_loc > 0:
+                print('\nSplitting %s of column "%s", unique substrings:' % (srch, col))
+
+                #Create reference column for matching
+                if inplace:
+                    pddf['ref'] = pddf[col]
+                else:
+                    df['ref'] = df[col]
+
+                #Create new column for new categorical variable
+                col_new = col + '_' + srch
+                if inplace:
+                    pddf[col_new] = np.nan
+                else:
+                    df[col_new] = np.nan
+
+                #Iterate through sub-patterns
+                for pat in patterns:
+                    if srch == 'start':
+                        s_sub = s[s.str[:chop_loc] == pat]
+                    if srch == 'end':
+                        s_sub = s[s.str[-chop_loc:] == pat]
+
+                    #Find sub-chop location and patterns
+                    chop_loc_sub, patterns_sub = chopseriesloop(s_sub,
+                                                            search = srch,
+                                                            nuq_min = 1,
+                                                            nuq_max = 1,
+                                                            char_min = 5,
+                                                            thres = 1
+                                                            )
+
+                    pat_sub = patterns_sub[0]
+                    print('    "%s"' % pat_sub)
+
+                    if srch == 'start':
+                        #Strip from start
+                        s_new = s.str[chop_loc_sub:]
+                        if inplace:
+                            pddf[col_new] = np.where(pddf['ref'].str[:chop_loc] == pat_sub, pat_sub, pddf[col_new])
+                            pddf[col][pddf[col].str[:chop_loc] == pat] = s_new
+
+                        else:
+                            df[col_new] = np.where(df['ref'].str[:chop_loc] == pat_sub, pat_sub, df[col_new])
+                            df[col][df[col].str[:chop_loc] == pat] = s_new
+
+                    if srch == 'end':
+                        #Strip from end
+                        s_new = s.str[:-chop_loc_sub]
+                        if inplace:
+                            pddf[col_new] = np.where(pddf['ref'].str[-chop_loc_sub:] == pat_sub, pat_sub, pddf[col_new])
+                            pddf[col][pddf[col].str[-chop_loc:] == pat] = s_new
+                        else:
+                            df[col_new] = np.where(df['ref'].str[-chop_loc_sub:] == pat_sub, pat_sub, df[col_new])
+                            df[col][df[col].str[-chop_loc:] == pat] = s_new
+
+    #Remove REF column
+    if inplace:
+        pddf.drop(columns = 'ref', inplace = True)
+    else:
+        df.drop(columns = 'ref', inplace = True)
+
+    if not inplace:
+        return df
+
+    return
+
+def hazardsreplace( s , rename ):
+    # Split trail conditions into condition and hazard flags (original report
+    # cleaning steps)
+    df_tc = s.str.split(':', expand=True)
+    cond = df_tc[0]
+    df_tc = df_tc[1].str.strip()
+    df_tc = df_tc.str.replace('.', '', regex = False)
+    df_tc = df_tc.str.replace(' ', '', regex = False)
+    df_tc = df_tc.str.replace('/', '', regex = False)
+    df_tc = df_tc.str.replace('(', '', regex = False)
+    df_tc = df_tc.str.replace(')', '', regex = False)
+    df_tc = df_tc.str.get_dummies(',    ')
+    df_tc.rename(columns = rename, inplace=True)
+    return cond, df_tc == 1
+
+# =============================================================================
+#                                 Build Data
+# =============================================================================
+
+rng = np.random.default_rng(0)
+letters = list('abcde -')
+
+def makeword( n ):
+    # Random string of n characters from a small alphabet (so patterns repeat)
+    return ''.join(rng.choice(letters, n))
+
+def makeseries( n ):
+    # Random series of n strings sharing a few prefixes/suffixes, with
+    # duplicates, missing values and booleans mixed in
+    starts = [makeword(rng.integers(0, 8)) for _ in range(rng.integers(1, 5))]
+    ends = [makeword(rng.integers(0, 8)) for _ in range(rng.integers(1, 5))]
+    values = [starts[rng.integers(0, len(starts))] + makeword(rng.integers(0, 6)) + ends[rng.integers(0, len(ends))]
+              for _ in range(n)]
+    values = values + [values[rng.integers(0, n)] for _ in range(rng.integers(0, 3))]
+    if rng.random() < 0.3:
+        values = values + [np.nan, None]
+    if rng.random() < 0.2:
+        values = values + [True, False][:rng.integers(1, 3)]
+    rng.shuffle(values)
+    return pd.Series(values, dtype = object)
+
+def makelong( n , words ):
+    # Series of n long text records with a repeated start and end
+    body = [' '.join(rng.choice(words, 60)) for _ in range(n)]
+    return pd.Series(['Directions:  ' + b + '  Read more' for b in body], dtype = object)
+
+def makewide( n ):
+    # Random table of n rows with columns copied from each other in another
+    # type (int, float, bool, string), with the first one or two values
+    # missing (the original fails on equal null counts in other positions)
+    base = pd.DataFrame({'a': rng.integers(0, 3, n),
+                         'b': rng.choice(['x', 'y', 'True'], n).astype(object),
+                         'c': rng.integers(0, 2, n).astype(bool)})
+    cols = {}
+    for j in range(rng.integers(2, 10)):
+        col = base[rng.choice(list(base.columns))]
+        kind = rng.integers(0, 4)
+        if kind == 1:
+            col = col.astype(float) if col.dtype != object else col
+        if kind == 2:
+            col = col.astype(object)
+        if kind == 3:
+            col = col.where(np.arange(n) >= rng.integers(1, 3))
+        cols['col%d' % j] = col.values
+    return pd.DataFrame(cols)
+
+def makesplit( n ):
+    # Random series of n records that start/end with one of a few categories
+    # (e.g. distance type), with missing values mixed in
+    starts = [makeword(rng.integers(5, 9)) for _ in range(rng.integers(1, 4))]
+    ends = [makeword(rng.integers(5, 9)) for _ in range(rng.integers(1, 4))]
+    values = [starts[rng.integers(0, len(starts))] + makeword(rng.integers(1, 6)) + ends[rng.integers(0, len(ends))]
+              for _ in range(n)]
+    values = [value if rng.random() > 0.1 else np.nan for value in values]
+    return pd.Series(values, dtype = object)
+
+def makeconditions( n ):
+    # Random series of n trail conditions listing known and unknown hazards
+    # (with uneven spacing and case), and the count of each unknown hazard
+    known = ['Bridge out', 'Difficult stream crossings', 'Mud/Rockslide or washout',
+             'Muddy or wet trail', 'Overgrown in places', 'Trees down across trail']
+    other = ['Snow on trail', 'Washed out road']
+    values = []
+    unknown = {}
+    for _ in range(n):
+        if rng.random() < 0.1:
+            values.append(np.nan)
+            continue
+        hazards = list(rng.choice(known + other, rng.integers(0, 4), replace = False))
+        for hazard in set(hazards) & set(other):
+            unknown[hazard] = unknown.get(hazard, 0) + 1
+        if rng.random() < 0.2:
+            hazards = [h if h in other else h.upper() if rng.random() < 0.5 else h.replace(' ', '  ') for h in hazards]
+        value = rng.choice(['Trail in good condition', 'Snow', 'Trail in bad condition'])
+        if hazards:
+            value = value + ':' + ' '*rng.integers(0, 5) + (',' + ' '*rng.integers(0, 5)).join(hazards)
+        values.append(value)
+    return pd.Series(values, dtype = object), unknown
+
+def cleanhikes( shards , runs ):
+    # Run the hike cleaning script on each list of molten shards in turn (in
+    # a copy of the repo layout, incremental after the first run) and return
+    # the hike table of the last run
+    tmp_dir = tempfile.mkdtemp(prefix = 'hikes_')
+    try:
+        os.makedirs(os.path.join(tmp_dir, 'Cleaning'))
+        os.makedirs(os.path.join(tmp_dir, 'Data', 'hike_data_molten'))
+        shutil.copy('cleanpy.py', os.path.join(tmp_dir, 'Cleaning'))
+        with open('WTA_Hike_Cleaning.py', encoding = 'utf-8') as f:
+            script = f.read().replace('\nincremental = False\n', '\nincremental = True\n')
+        with open(os.path.join(tmp_dir, 'Cleaning', 'WTA_Hike_Cleaning.py'), 'w', encoding = 'utf-8') as f:
+            f.write(script)
+
+        for run in runs:
+            for i in run:
+                shards[i].to_parquet(os.path.join(tmp_dir, 'Data', 'hike_data_molten', 'part-%05d.parquet' % (i)))
+            subprocess.run([sys.executable, 'WTA_Hike_Cleaning.py'], cwd = os.path.join(tmp_dir, 'Cleaning'),
+                           capture_output = True, check = True)
+
+        return pd.read_pickle(os.path.join(tmp_dir, 'Data', 'hikes.pkl'))
+    finally:
+        shutil.rmtree(tmp_dir)
+
+def samepatterns( a , b ):
+    # Compare pattern lists (missing values match each other)
+    return (len(a) == len(b)) and all((x == y) or (pd.isnull(x) and pd.isnull(y)) for x, y in zip(a, b))
+
+settings = [{'nuq_min': 1, 'nuq_max': 1, 'char_min': 1, 'thres': 1},
+            {'nuq_min': 2, 'nuq_max': 5, 'char_min': 5, 'thres': 0.5},
+            {'nuq_min': 1, 'nuq_max': 5, 'char_min': 4, 'thres': 0.3},
+            {'nuq_min': 1, 'nuq_max': 3, 'char_min': 0, 'thres': 1},
+            {'nuq_min': 1, 'nuq_max': 2, 'char_min': -3, 'thres': 0.8},
+            {'nuq_min': 3, 'nuq_max': 10, 'char_min': 2, 'thres': 0.6}]
+
+# =============================================================================
+#                               Parity Check
+# =============================================================================
+
+# Checks only run as a script (the original versions are imported by the
+# cleaning benchmark)
+if __name__ == '__main__':
+
+    print('Checking chopseries...')
+
+    mismatches = 0
+    checks = 0
+
+    # Edge cases (empty, non-object, boolean only, missing only, one value)
+    series = [pd.Series([], dtype = object),
+              pd.Series([1.5, 2.5]),
+              pd.Series([True, False, np.nan], dtype = object),
+              pd.Series([np.nan, None], dtype = object),
+              pd.Series(['abcdef'], dtype = object),
+              pd.Series(['abcdef', 'abcdef', True], dtype = object)]
+    series = series + [makeseries(rng.integers(1, 40)) for _ in range(n_series)]
+
+    for s in series:
+        for search in ['start', 'end', 'middle']:
+            for kwargs in settings:
+                with contextlib.redirect_stdout(io.StringIO()) as out_base:
+                    chop_base, patterns_base = chopseriesloop(s, search = search, **kwargs)
+                with contextlib.redirect_stdout(io.StringIO()) as out_new:
+                    chop_new, patterns_new = cleanpy.chopseries(s, search = search, **kwargs)
+
+                checks = checks + 1
+                if (chop_base != chop_new) or not samepatterns(patterns_base, patterns_new) or (out_base.getvalue() != out_new.getvalue()):
+                    mismatches = mismatches + 1
+                    print('\nMismatch (%s, %s):  %s' % (search, kwargs, list(s)))
+                    print('    - %s %s' % (chop_base, patterns_base))
+                    print('    + %s %s' % (chop_new, patterns_new))
+
+    print('                Checks:  %d' % (checks))
+    print('            Mismatches:  %d' % (mismatches))
+
+    print('\nChecking chopsubstrings/splitsubstrings...')
+
+    table_mismatches = 0
+    table_failed = 0
+
+    for _ in range(n_tables):
+        df = pd.DataFrame({'col%d' % j: makeseries(30).head(30).values for j in range(2)})
+        for j in range(2, 5):
+            df['col%d' % j] = makesplit(30).values
+
+        for func_base, func_new in [(chopsubstringscopy, cleanpy.chopsubstrings),
+                                    (splitsubstringscopy, cleanpy.splitsubstrings)]:
+
+            # Run the original in place (as the hike cleaning does)
+            df_base = df.copy()
+            with contextlib.redirect_stdout(io.StringIO()) as out_base:
+                try:
+                    func_base(df_base, inplace = True)
+                except Exception:
+                    table_failed = table_failed + 1
+                    continue
+
+            # Run the new version in place, as a copy, in a process pool, and
+            # replayed from its record
+            df_new = df.copy()
+            df_input = df.copy()
+            with contextlib.redirect_stdout(io.StringIO()) as out_new:
+                record = []
+                func_new(df_new, inplace = True, record = record)
+            with contextlib.redirect_stdout(io.StringIO()):
+                df_copy = func_new(df_input)
+            with contextlib.redirect_stdout(io.StringIO()) as out_pool:
+                df_pool = func_new(df, processes = 2)
+            df_replay = cleanpy.replaysubstrings(df, record)
+
+            results = [df_new, df_copy, df_pool, df_replay]
+            if not (all(df_base.equals(result) for result in results) and df_input.equals(df)) or not (out_base.getvalue() == out_new.getvalue() == out_pool.getvalue()):
+                table_mismatches = table_mismatches + 1
+                print('\nMismatch (%s):\n%s' % (func_new.__name__, df))
+
+    print('                Tables:  %d' % (n_tables))
+    print('       Original failed:  %d' % (table_failed))
+    print('            Mismatches:  %d' % (table_mismatches))
+
+    print('\nChecking dropdupcol...')
+
+    wide_mismatches = 0
+    wide_failed = 0
+
+    for n in rng.integers(0, 8, n_wide):
+        df = makewide(n)
+        df_base = df.copy()
+        df_new = df.copy()
+        with contextlib.redirect_stdout(io.StringIO()):
+            try:
+                dropdupcolpairs(df_base)
+            except ValueError:
+                wide_failed = wide_failed + 1
+                continue
+            cols_drop = cleanpy.dropdupcol(df_new)
+
+        if not df_base.equals(df_new) or (cols_drop != [col for col in df.columns if col not in df_base.columns]):
+            wide_mismatches = wide_mismatches + 1
+            print('\nMismatch:\n%s' % (df))
+            print('    - %s' % (list(df_base.columns)))
+            print('    + %s' % (list(df_new.columns)))
+
+    print('                Tables:  %d' % (n_wide))
+    print('       Original failed:  %d' % (wide_failed))
+    print('            Mismatches:  %d' % (wide_mismatches))
+
+    print('\nChecking pivotmolten...')
+
+    molten_mismatches = 0
+    molten_failed = 0
+
+    for n in rng.integers(0, 60, n_molten):
+        df = pd.DataFrame({'ID': rng.choice(['r%d' % i for i in range(8)] + [np.nan], n),
+                           'Key': rng.choice(['ReportDate', 'Cond_Snow', 'Feat_Hikedwithkids', 'HikeID', np.nan], n),
+                           'Value': rng.choice(['2018-08-01', 'True', 'Snow free', '12', np.nan], n)}).astype(object)
+
+        # Original (drop missing and duplicate rows, then pivot)
+        try:
+            df_base = df.dropna().drop_duplicates(subset = ['ID', 'Key']).pivot(index = 'ID', columns = 'Key', values = 'Value')
+        except ValueError:
+            molten_failed = molten_failed + 1
+            continue
+
+        # New (object and categorical ID/Key)
+        df_cat = df.astype({'ID': 'category', 'Key': 'category'})
+        for df_new in [cleanpy.pivotmolten(df), cleanpy.pivotmolten(df_cat)]:
+            same = df_base.equals(df_new) and df_base.index.equals(df_new.index) and df_base.columns.equals(df_new.columns)
+            same = same and (df_base.index.name == df_new.index.name) and (df_base.columns.name == df_new.columns.name)
+            if not same or (list(df_base.dtypes) != list(df_new.dtypes)):
+                molten_mismatches = molten_mismatches + 1
+                print('\nMismatch:\n%s' % (df))
+
+    print('                Tables:  %d' % (n_molten))
+    print('       Original failed:  %d' % (molten_failed))
+    print('            Mismatches:  %d' % (molten_mismatches))
+
+    print('\nChecking parsehazards...')
+
+    rename = {'Bridgeout':'Haz_BridgeOut',
+              'Difficultstreamcrossings':'Haz_DifStreamCrossing',
+              'MudRockslideorwashout':'Haz_Washout',
+              'Muddyorwettrail':'Haz_Muddy',
+              'Overgrowninplaces':'Haz_Overgrown',
+              'Treesdownacrosstrail':'Haz_DownTrees'
+              }
+    hazards = {'Bridge out':'Haz_BridgeOut',
+               'Difficult stream crossings':'Haz_DifStreamCrossing',
+               'Mud/Rockslide or washout':'Haz_Washout',
+               'Muddy or wet trail':'Haz_Muddy',
+               'Overgrown in places':'Haz_Overgrown',
+               'Trees down across trail':'Haz_DownTrees'
+               }
+
+    hazard_mismatches = 0
+    hazard_missed = 0
+    hazard_failed = 0
+
+    for n in rng.integers(0, 60, n_tables):
+        s, unknown = makeconditions(n)
+        unknown_new = {}
+        cond_new, df_new = cleanpy.parsehazards(s, hazards, unknown = unknown_new)
+
+        # Original (only finds a single hazard, as written on the WTA page)
+        try:
+            cond_base, df_base = hazardsreplace(s, rename)
+        except (KeyError, AttributeError):
+            hazard_failed = hazard_failed + 1
+            continue
+        df_base = df_base.reindex(columns = df_new.columns, fill_value = False)
+        single = (s.str.count(',').fillna(0) == 0) & ~s.str.contains('[A-Z]{2}').fillna(False)
+        hazard_missed = hazard_missed + (df_new.any(axis = 1) & ~df_base.any(axis = 1)).sum()
+
+        same = cond_base.equals(cond_new) and df_base[single].equals(df_new[single]) and (unknown == unknown_new)
+        if not same:
+            hazard_mismatches = hazard_mismatches + 1
+            print('\nMismatch:\n%s' % (s))
+
+    print('                Series:  %d' % (n_tables))
+    print('       Original failed:  %d' % (hazard_failed))
+    print('  Rows original missed:  %d' % (hazard_missed))
+    print('            Mismatches:  %d' % (hazard_mismatches))
+
+    print('\nChecking incremental hike cleaning...')
+
+    # Molten table of the stand-in hike pages, as a first shard and a later
+    # shard of changed and new hikes (new trip report counts and descriptions)
+    pages, hikes, _ = standinpy.synthpages(n_hikes, 0, padding = 0)
+    df = pd.DataFrame([row for path in hikes for row in extractpy.extracthike(path, pages[path], missing = [])],
+                      columns = ['ID', 'Key', 'Value'])
+    ids = list(rng.choice(df.ID.unique(), n_changed, replace = False))
+    ids_new = ids[:n_changed//3]
+    df_change = df[df.ID.isin(ids)].copy()
+    rows = df_change.Key == 'Trip_Report_Cnt'
+    df_change.loc[rows, 'Value'] = [str(count) for count in rng.integers(0, 3000, rows.sum())]
+    rows = df_change.Key == 'Description'
+    df_change.loc[rows, 'Value'] = df_change.loc[rows, 'Value'] + ' Updated.'
+    shards = [df[~df.ID.isin(ids_new)], df_change]
+
+    # Clean both shards at once, and the first shard then the second
+    df_full = cleanhikes(shards, [[0, 1]])
+    df_inc = cleanhikes(shards, [[0], [1]])
+
+    print('                 Hikes:  %d full, %d incremental' % (df_full.shape[0], df_inc.shape[0]))
+    print('         Duplicate IDs:  %d' % (df_inc.ID.duplicated().sum()))
+    print('         Results match:  %s' % (df_full.equals(df_inc) and list(df_full.dtypes) == list(df_inc.dtypes)))
+
+    # =========================================================================
+    #                                Benchmark
+    # =========================================================================
+    print('\nTiming long text series...')
+
+    words = ['trail', 'snow', 'lake', 'views', 'muddy', 'bridge', 'summit', 'trees', 'creek', 'parking']
+    s = makelong(n_long, words)
+
+    for search in ['start', 'end']:
+        start = time.perf_counter()
+        result_base = chopseriesloop(s, search = search, nuq_min = 1, nuq_max = 1, char_min = 1, thres = 1)
+        seconds_base = time.perf_counter() - start
+
+        start = time.perf_counter()
+        result_new = cleanpy.chopseries(s, search = search, nuq_min = 1, nuq_max = 1, char_min = 1, thres = 1)
+        seconds_new = time.perf_counter() - start
+
+        print('\n%s (%d records)' % (search, n_long))
+        print('         Results match:  %s' % (result_base == result_new))
+        print('  Original time (secs):  %f' % (seconds_base))
+        print('       New time (secs):  %f' % (seconds_new))
+
+    print('\nTiming hike table...')
+
+    distance = pd.Series(['%.1f miles, %s' % (d, t) for d, t in zip(rng.integers(10, 200, n_long)/10,
+                          rng.choice(['roundtrip', 'one-way', 'of trails'], n_long))], dtype = object)
+    df = pd.DataFrame({'Distance': distance,
+                       'Directions': makelong(n_long, words),
+                       'Rating': ['%.2f out of 5' % (r) for r in rng.random(n_long)*5]})
+
+    for func_base, func_new in [(chopsubstringscopy, cleanpy.chopsubstrings),
+                                (splitsubstringscopy, cleanpy.splitsubstrings)]:
+        df_base = df.copy()
+        df_new = df.copy()
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            func_base(df_base, inplace = True)
+            seconds_base = time.perf_counter() - start
+
+            record = []
+            start = time.perf_counter()
+            func_new(df_new, inplace = True, record = record)
+            seconds_new = time.perf_counter() - start
+
+            start = time.perf_counter()
+            df_pool = func_new(df, processes = None)
+            seconds_pool = time.perf_counter() - start
+
+        start = time.perf_counter()
+        df_replay = cleanpy.replaysubstrings(df, record)
+        seconds_replay = time.perf_counter() - start
+
+        print('\n%s (%d records)' % (func_new.__name__, n_long))
+        print('         Results match:  %s' % (df_base.equals(df_new) and df_base.equals(df_pool) and df_base.equals(df_replay)))
+        print('  Original time (secs):  %f' % (seconds_base))
+        print('       New time (secs):  %f' % (seconds_new))
+        print('%23s:  %f' % ('Pool, %d cores (secs)' % (os.cpu_count()), seconds_pool))
+        print('    Replay time (secs):  %f' % (seconds_replay))
+
+    print('\nTiming trail conditions...')
+
+    s, unknown = makeconditions(n_long)
+
+    start = time.perf_counter()
+    cond_base, df_base = hazardsreplace(s, rename)
+    seconds_base = time.perf_counter() - start
+
+    start = time.perf_counter()
+    cond_new, df_new = cleanpy.parsehazards(s, hazards)
+    seconds_new = time.perf_counter() - start
+
+    print('\nparsehazards (%d records)' % (n_long))
+    print('  Original time (secs):  %f' % (seconds_base))
+    print('       New time (secs):  %f' % (seconds_new))
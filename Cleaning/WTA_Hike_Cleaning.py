@@ -5,7 +5,10 @@ Author: Joseph DeGregorio
 Created: 8/17/2018
 
 Description:  This python script takes the long format data table
-from scraping as input, pivots the data, and cleans each field.
+from scraping as input, pivots the data, and cleans each field.  In
+incremental mode only the hikes that are new or changed since the last run
+are cleaned (with the column changes found by that run), and the outputs of
+that run are updated.
 
 """
 # =============================================================================
@@ -13,144 +16,187 @@ from scraping as input, pivots the data, and cleans each field.
 # =============================================================================
 
 # Load Libraries
+import copy
+import os
 import pandas as pd
 import numpy as np
 import cleanpy
 import pandas_summary
 
-# =============================================================================
-#                                 Import Data
-# =============================================================================
-print('Importing Data...', end='')
+# Set number of processes used to find column patterns (all cores if None)
+processes = None
 
-# Import Hike Data (Molten State)
-df_hikes_molten = pd.read_csv('../Data/hike_data_molten.csv', encoding = "utf-8")
+# Set incremental mode (clean only the hikes that are new or changed since the
+# last run, and update its outputs)
+incremental = False
+state_path = '../Data/hikes_state.pkl'
+
+# Set output columns
+gp_core = ['ID', 'URL', 'Name']
+gp_area = ['Region', 'Location','Trailhead']
+gp_gps = ['Lat', 'Long', 'Coord_Type']
+gp_stats = ['Distance', 'Distance_Type', 'Elevation_Gain', 'Elevation_Peak']
+gp_text = ['Description', 'Directions']
+gp_pop = ['Rating', 'Rating_Cnt', 'Trip_Report_Cnt']
+gp_feat  = ['Dogs_Leashed', 'Dogs_None', 'Kid_Friendly', 'Campsites', 'Lakes', 'Rivers', 'Mountain_Views', 'Summits', 'Ridges_Passes', 'Old_Growth', 'Fall_Foliage', 'Flowers_Meadows', 'Wildlife']
+gp_other = ['Alerts', 'Permits']
 
-print('Complete')
 # =============================================================================
-#                                Basic Cleaning
+#                               Cleaning Steps
 # =============================================================================
-print('Basic Cleaning...', end='')
 
-# Remove Incomplete Records
-df_hikes_molten.dropna(inplace=True)
+def cleanhikes( df_hikes_molten , steps = None ):
+    # Pivot and clean the hikes of a molten table, before data types are set.
+    # The column changes (duplicate columns, substrings) are found and
+    # returned if steps is None, and the given steps are applied otherwise
 
-# Remove Duplicates
-df_hikes_molten.drop_duplicates(inplace=True)
+    # Remove Incomplete Records
+    df_hikes_molten = df_hikes_molten.dropna()
 
-# Combine/Fix Elevation Key Variables (scraped data resulted in 3 unique keys)
-df_hikes_molten.Key = np.where(df_hikes_molten.Value.str[:6] == 'Gain: ', 'Elevation_Gain', df_hikes_molten.Key)
-df_hikes_molten.Key = np.where(df_hikes_molten.Value.str[:15] == 'Highest Point: ', 'Elevation_Peak', df_hikes_molten.Key)
+    # Remove Duplicates
+    df_hikes_molten = df_hikes_molten.drop_duplicates()
 
-# Pivot Data to tidy/wide format
-df_hikes = df_hikes_molten.pivot(index = 'ID', columns = 'Key', values = 'Value')
-df_hikes.reset_index(inplace=True)
+    # Combine/Fix Elevation Key Variables (scraped data resulted in 3 unique keys)
+    df_hikes_molten.Key = np.where(df_hikes_molten.Value.str[:6] == 'Gain: ', 'Elevation_Gain', df_hikes_molten.Key)
+    df_hikes_molten.Key = np.where(df_hikes_molten.Value.str[:15] == 'Highest Point: ', 'Elevation_Peak', df_hikes_molten.Key)
 
-# Fix Column Names
-new_names = {
-    'Dogs allowed on leash': 'Dogs_Leashed',
-    'Dogs not allowed': 'Dogs_None',
-    'Established campsites': 'Campsites',
-    'Fall foliage': 'Fall_Foliage',
-    'Good for kids': 'Kid_Friendly',
-    'Mountain views': 'Mountain_Views',
-    'Old growth': 'Old_Growth',
-    'Ridges/passes': 'Ridges_Passes',
-    'Wildflowers/Meadows': 'Flowers_Meadows',
-    'Rating_Count':'Rating_Cnt'
-}
+    # Pivot Data to tidy/wide format
+    df_hikes = df_hikes_molten.pivot(index = 'ID', columns = 'Key', values = 'Value')
+    df_hikes.reset_index(inplace=True)
 
-df_hikes.rename(columns = new_names, inplace=True)
+    # Fix Column Names
+    new_names = {
+        'Dogs allowed on leash': 'Dogs_Leashed',
+        'Dogs not allowed': 'Dogs_None',
+        'Established campsites': 'Campsites',
+        'Fall foliage': 'Fall_Foliage',
+        'Good for kids': 'Kid_Friendly',
+        'Mountain views': 'Mountain_Views',
+        'Old growth': 'Old_Growth',
+        'Ridges/passes': 'Ridges_Passes',
+        'Wildflowers/Meadows': 'Flowers_Meadows',
+        'Rating_Count':'Rating_Cnt'
+    }
 
-# Add URL Column
-df_hikes['URL'] = 'https://www.wta.org/go-hiking/hikes/' + df_hikes['ID']
+    df_hikes.rename(columns = new_names, inplace=True)
+
+    # Add URL Column
+    df_hikes['URL'] = 'https://www.wta.org/go-hiking/hikes/' + df_hikes['ID']
+
+    if steps is None:
+        steps = {'columns': list(df_hikes.columns)}
+
+        #Remove any duplicate columns
+        steps['drop'] = cleanpy.dropdupcol(df_hikes)
+
+        #Remove text that appears at start/end of record within a column (not
+        #from ID, the key incremental runs update the last outputs by)
+        steps['record'] = []
+        cleanpy.chopsubstrings(df_hikes, exclude = ['ID', 'URL', 'Lat', 'Long'], inplace = True, record = steps['record'], processes = processes)
+
+        #Split/strip text that appears to be categorical from start/end each record in column
+        cleanpy.splitsubstrings(df_hikes, exclude = ['ID', 'URL'], nuq_max = 5, inplace = True, record = steps['record'], processes = processes)
+
+    else:
+        #Keep the columns of the run the steps were found in (as text columns
+        #of NaN where no hike has the key)
+        for col in steps['columns']:
+            if col not in df_hikes.columns:
+                df_hikes[col] = pd.Series(np.nan, index = df_hikes.index, dtype = object)
+        df_hikes = df_hikes[steps['columns']]
+
+        #Remove the duplicate columns and substrings found in that run
+        df_hikes = df_hikes.drop(columns = steps['drop'])
+        cleanpy.replaysubstrings(df_hikes, steps['record'], inplace = True)
+
+    df_hikes.drop(columns = 'Rating_Cnt_end', inplace = True)  #Drop useless column
+
+    #Rename and prettify new column
+    df_hikes.rename(columns = {'Distance_end':'Distance_Type'}, inplace = True)
+    df_hikes.Distance_Type.replace(['nan', ' miles, roundtrip', ' miles, one-way', ' miles of trails'],
+                                   [np.nan, 'Roundtrip', 'One-way', 'Total Trail'],
+                                   inplace = True)
+
+    #Strip repeated text from Location and Trailhead (Trailhead first, while Location still holds its Region)
+    cleanpy.stripsubstrings(df_hikes, 'Trailhead', 'Location', inplace = True)
+    cleanpy.stripsubstrings(df_hikes, 'Location', 'Region', suffix = ' -- ', inplace = True)
+
+    df_hikes.Trailhead = df_hikes.Trailhead.str.replace('See weather forecast', '')
+
+    #Fix Boolean Variables
+    for col in gp_feat:
+        df_hikes[col] = np.where(df_hikes[col] == '', True, False)
+
+    #Replace NaN with empty string for text entries
+    cols = ['Description', 'Directions', 'Alerts', 'Permits']
+
+    for col in cols:
+        df_hikes[col].fillna('', inplace = True)
+
+    # Organize Columns (coordinates are estimated once every hike is cleaned)
+    cols = [col for col in gp_core + gp_area + gp_gps + gp_stats + gp_text + gp_pop + gp_feat + gp_other if col != 'Coord_Type']
+
+    return df_hikes[cols], steps
+
+# =============================================================================
+#                                 Import Data
+# =============================================================================
+print('Importing Data...', end='')
+
+# Import Hike Data (Molten State, shards written by the hike page scraper)
+df_hikes_molten = cleanpy.readmolten('../Data/hike_data_molten')
+
+# Hash the rows of each hike (to find the hikes the next run has to clean)
+hashes = cleanpy.hashmolten(df_hikes_molten)
+
+# Keep the hikes that are new or changed since the last run
+state = None
+if incremental and os.path.exists(state_path) and os.path.exists('../Data/hikes.pkl'):
+    state = pd.read_pickle(state_path)
+    ids = cleanpy.changedids(hashes, state['hashes'])
+    df_hikes_molten_all = df_hikes_molten
+    df_hikes_molten = df_hikes_molten[df_hikes_molten.ID.isin(ids)]
+    print('Complete (%d new or changed hikes)' % (len(ids)))
+else:
+    print('Complete')
 
-print('Complete')
 # =============================================================================
 #                              Clean Variables
 # =============================================================================
 print('Cleaning Variables...\n')
 
-#Remove any duplicate columns
-cleanpy.dropdupcol(df_hikes)
-
-#Remove text that appears at start/end of record within a column
-cleanpy.chopsubstrings(df_hikes, exclude = ['URL', 'Lat', 'Long'], inplace = True)
-
-#Split/strip text that appears to be categorical from start/end each record in column
-cleanpy.splitsubstrings(df_hikes, exclude = ['URL'], nuq_max = 5, inplace = True)
-df_hikes.drop(columns = 'Rating_Cnt_end', inplace = True)  #Drop useless column
-
-#Rename and prettify new column
-df_hikes.rename(columns = {'Distance_end':'Distance_Type'}, inplace = True)
-df_hikes.Distance_Type.replace(['nan', ' miles, roundtrip', ' miles, one-way', ' miles of trails'],
-                               [np.nan, 'Roundtrip', 'One-way', 'Total Trail'],
-                               inplace = True)
-
-#Strip repeated text from Location and Trailhead
-for i in list(range(0,df_hikes.shape[0])):
-    #Clean Trailhead
-    if type(df_hikes.Location[i]) == str:
-        pat = df_hikes.Location[i]
-        df_hikes.Trailhead[i] = df_hikes.Trailhead[i].replace(pat, '').strip()
-    #Clean Location
-    if type(df_hikes.Region[i]) == str:
-        pat = df_hikes.Region[i] + ' -- '
-        df_hikes.Location[i] = df_hikes.Location[i].replace(pat, '').strip()
-
-df_hikes.Trailhead = df_hikes.Trailhead.str.replace('See weather forecast', '')
-
-#Fix Boolean Variables
-cols = ['Dogs_Leashed',
-        'Dogs_None',
-        'Kid_Friendly',
-        'Campsites',
-        'Lakes',
-        'Rivers',
-        'Mountain_Views',
-        'Summits',
-        'Ridges_Passes',
-        'Old_Growth',
-        'Fall_Foliage',
-        'Flowers_Meadows',
-        'Wildlife']
-
-for col in cols:
-    df_hikes[col] = np.where(df_hikes[col] == '', True, False)
-
-#Replace NaN with empty string for text entries
-cols = ['Description', 'Directions', 'Alerts', 'Permits']
-
-for col in cols:
-    df_hikes[col].fillna('', inplace = True)
+df_hikes, steps = cleanhikes(df_hikes_molten, None if state is None else state['steps'])
 
-#Update data types
-df_hikes = df_hikes.apply(pd.to_numeric, errors='ignore')
+#Find data types (numeric fields, and text fields with 75 or fewer values as
+#categorical), updating those of the last run
+types = cleanpy.scantypes(df_hikes, None if state is None else copy.deepcopy(state['types']), nuq_max = 75)
 
-#Update Categorical Fields
-col_cat = []
-for col in df_hikes.columns:
-    tp = df_hikes[col].dtype == 'object'
-    nu = df_hikes[col].nunique() <= 75
-    if (tp & nu):
-        col_cat.append(col)
+#Clean every hike if the new hikes change the type of a field (the outputs
+#of the last run cannot be updated)
+if (state is not None) and cleanpy.changedtypes(state['types'], types):
+    print('Field types changed, cleaning every hike\n')
+    state = None
+    df_hikes, steps = cleanhikes(df_hikes_molten_all)
+    types = cleanpy.scantypes(df_hikes, nuq_max = 75)
+df_hikes_molten = df_hikes_molten_all = None
 
-df_hikes[col_cat] = df_hikes[col_cat].astype('category')
+#Update data types
+df_hikes = cleanpy.settypes(df_hikes, types)
 
-#Estimate missing GPS Coordinates
-df_hikes = cleanpy.estlatlong(df_hikes, 'Trailhead')
-df_hikes = cleanpy.estlatlong(df_hikes, 'Location')
+#Update the outputs of the last run with the new and changed hikes (with
+#the coordinates as they were before the missing ones were estimated)
+if state is not None:
+    df_prev = pd.read_pickle('../Data/hikes.pkl')
+    df_prev[['Lat', 'Long']] = state['coords'].set_index('ID').reindex(df_prev.ID).to_numpy()
+    df_prev.drop(columns = 'Coord_Type', inplace = True)
+    df_hikes = cleanpy.upsertrows(df_prev, df_hikes, 'ID', ids = ids)
+    del df_prev
 
-# Organize Columns
-gp_core = ['ID', 'URL', 'Name']
-gp_area = ['Region', 'Location','Trailhead']
-gp_gps = ['Lat', 'Long', 'Coord_Type']
-gp_stats = ['Distance', 'Distance_Type', 'Elevation_Gain', 'Elevation_Peak']
-gp_text = ['Description', 'Directions']
-gp_pop = ['Rating', 'Rating_Cnt', 'Trip_Report_Cnt']
-gp_feat  = ['Dogs_Leashed', 'Dogs_None', 'Kid_Friendly', 'Campsites', 'Lakes', 'Rivers', 'Mountain_Views', 'Summits', 'Ridges_Passes', 'Old_Growth', 'Fall_Foliage', 'Flowers_Meadows', 'Wildlife']
-gp_other = ['Alerts', 'Permits']
+#Estimate missing GPS Coordinates (from those of every hike)
+coords = df_hikes[['ID', 'Lat', 'Long']].copy()
+cleanpy.estlatlong(df_hikes, ['Trailhead', 'Location', 'Region'], inplace = True)
 
+# Organize Columns
 df_hikes = df_hikes[gp_core + gp_area + gp_gps + gp_stats + gp_text + gp_pop + gp_feat + gp_other]
 
 #Create summary
@@ -167,4 +213,7 @@ print('Exporting Data...', end='')
 df_hikes.to_csv("../Data/hikes.csv", index = False, encoding = "utf-8")
 df_hikes.to_pickle("../Data/hikes.pkl")
 
+#Save hashes, column changes, data types and coordinates (for the next incremental run)
+pd.to_pickle({'hashes': hashes, 'steps': steps, 'types': types, 'coords': coords}, state_path)
+
 print('Complete')
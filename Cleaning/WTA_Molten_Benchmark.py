@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+"""
+WTA Molten Format Benchmark
+Author: Joseph DeGregorio
+
+Description:  This python script compares the load time and memory of the
+molten report table stored as one csv (read with the python engine, as the
+report cleaning used to) against the parquet shards written by the page
+scrapers, and the time and memory of pivoting the loaded table to wide
+format with drop_duplicates and pivot (as the report cleaning used to)
+against cleanpy.pivotmolten.  The scraped molten data is used if it exists,
+otherwise a synthetic report table is generated.
+
+"""
+# =============================================================================
+#                                   Setup
+# =============================================================================
+
+# Load Libraries
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+import numpy as np
+import pandas as pd
+import cleanpy
+
+sys.path.append('../Scraper')
+import scrapepy
+
+# Set source data (synthetic reports are generated if it does not exist)
+source = '../Data/report_data_molten'
+n_reports = 20000
+
+# Set benchmark output directory
+bench_dir = 'molten_benchmark'
+path_csv = os.path.join(bench_dir, 'report_data_molten.csv')
+path_parquet = os.path.join(bench_dir, 'report_data_molten')
+
+# Define load cases
+cases = {'csv (python engine)': lambda: cleanpy.readmolten(path_csv, engine = 'python'),
+         'csv (c engine)': lambda: cleanpy.readmolten(path_csv),
+         'parquet': lambda: cleanpy.readmolten(path_parquet),
+         'parquet (categorical)': lambda: cleanpy.readmolten(path_parquet, categorical = True)}
+
+def pivotframe( df ):
+    # Pivot to wide format (as the report cleaning used to)
+    df.dropna(inplace=True)
+    df.drop_duplicates(subset = ['ID', 'Key'], inplace=True)
+    return df.pivot(index = 'ID', columns = 'Key', values = 'Value')
+
+# Define pivot cases as [load case, pivot]
+pivots = {'drop_duplicates + pivot': ['parquet', pivotframe],
+          'pivotmolten': ['parquet', cleanpy.pivotmolten],
+          'pivotmolten (categorical)': ['parquet (categorical)', cleanpy.pivotmolten]}
+
+
+# =============================================================================
+#                          Load Case (subprocess)
+# =============================================================================
+
+# Run a single load case and print its results (one case per process, so
+# peak memory is measured separately for each case)
+if (len(sys.argv) == 3) and (sys.argv[1] == 'load'):
+    start = time.perf_counter()
+    df = cases[sys.argv[2]]()
+    seconds = time.perf_counter() - start
+
+    # Peak RSS (VmHWM on linux, since ru_maxrss carries over the parent's peak through exec)
+    if os.path.exists('/proc/self/status'):
+        with open('/proc/self/status') as f:
+            rss = [int(line.split()[1])*1024 for line in f if line.startswith('VmHWM')][0]
+    else:
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    print(json.dumps({'seconds': seconds,
+                      'rows': df.shape[0],
+                      'frame_mb': df.memory_usage(deep = True).sum()/2**20,
+                      'peak_rss_mb': rss/2**20}))
+    sys.exit(0)
+
+# Run a single pivot case and print its results (memory allocated while
+# pivoting is traced, since the process RSS is dominated by loading and
+# memory freed after loading is reused by the pivot)
+if (len(sys.argv) == 3) and (sys.argv[1] == 'pivot'):
+    load, pivot = pivots[sys.argv[2]]
+    df = cases[load]()
+
+    # Time a pivot of a copy, then trace a pivot of the loaded table
+    df_copy = df.copy()
+    start = time.perf_counter()
+    pivot(df_copy)
+    seconds = time.perf_counter() - start
+    del df_copy
+
+    tracemalloc.start()
+    df_wide = pivot(df)
+    traced, traced_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print(json.dumps({'seconds': seconds,
+                      'rows': df_wide.shape[0],
+                      'frame_mb': df_wide.memory_usage(deep = True).sum()/2**20,
+                      'peak_alloc_mb': traced_peak/2**20}))
+    sys.exit(0)
+
+# =============================================================================
+#                                 Build Data
+# =============================================================================
+print('Building Data...', end='')
+
+def makereports( n ):
+    # Generate n synthetic reports in molten [ID, Key, Value] format
+    rng = np.random.default_rng(0)
+    words = ['trail', 'snow', 'lake', 'views', 'muddy', 'bridge', 'summit', 'trees', 'creek', 'parking']
+    rows = []
+    for i in range(n):
+        report_id = '2018-08-%02d.%d' % (i % 28 + 1, 100000 + i)
+        body = '\n\n'.join(' '.join(rng.choice(words, 40)) for _ in range(rng.integers(1, 6)))
+        rows.extend([[report_id, 'Report_URL', 'https://www.wta.org/go-hiking/trip-reports/trip_report.' + report_id],
+                     [report_id, 'HikeID', 'hike-%d' % rng.integers(0, 3000)],
+                     [report_id, 'UserID', 'user%d' % rng.integers(0, 20000)],
+                     [report_id, 'Author', 'Author %d' % rng.integers(0, 20000)],
+                     [report_id, 'ReportDate', '2018-08-%02d' % (i % 28 + 1)],
+                     [report_id, 'Cond_TypeofHike', 'Day hike'],
+                     [report_id, 'Cond_TrailConditions', 'Trail in good condition:    Muddy or wet trail'],
+                     [report_id, 'Cond_Road', 'Road suitable for all vehicles'],
+                     [report_id, 'Feat_Hikedwithkids', 'True'],
+                     [report_id, 'ReportBody', body],
+                     [report_id, 'ImageCnt', str(rng.integers(0, 10))],
+                     [report_id, 'ReportHelpfulCnt', str(rng.integers(0, 10))]])
+    return pd.DataFrame.from_records(rows, columns = ['ID', 'Key', 'Value'])
+
+if os.path.exists(source):
+    df = cleanpy.readmolten(source)
+else:
+    df = makereports(n_reports)
+
+os.makedirs(bench_dir, exist_ok = True)
+
+# Write molten csv (as the page scrapers used to)
+df.to_csv(path_csv, index = False, encoding = "utf-8")
+
+# Write parquet shards (as the page scrapers do now)
+journal = scrapepy.Journal(':memory:')
+writer = scrapepy.ShardWriter(path_parquet, journal, format = 'parquet')
+for page_id, rows in df.groupby('ID', sort = False):
+    rows = rows.values.tolist()
+    journal.record(page_id, '', rows)
+    writer.write(page_id, rows)
+writer.close()
+journal.close()
+del df
+
+print('Complete')
+# =============================================================================
+#                                 Benchmark
+# =============================================================================
+print('Benchmarking...\n')
+
+size_csv = os.path.getsize(path_csv)
+size_parquet = sum(os.path.getsize(os.path.join(path_parquet, name)) for name in os.listdir(path_parquet))
+print('          csv size (MB):  %f' % (size_csv/2**20))
+print('      parquet size (MB):  %f' % (size_parquet/2**20))
+
+for case in cases:
+    out = subprocess.run([sys.executable, __file__, 'load', case], capture_output = True, text = True, check = True)
+    result = json.loads(out.stdout.strip().splitlines()[-1])
+
+    print('\n%s' % case)
+    print('            Rows loaded:  %d' % (result['rows']))
+    print('       Load time (secs):  %f' % (result['seconds']))
+    print('      Frame memory (MB):  %f' % (result['frame_mb']))
+    print('  Peak process RSS (MB):  %f' % (result['peak_rss_mb']))
+
+for case in pivots:
+    out = subprocess.run([sys.executable, __file__, 'pivot', case], capture_output = True, text = True, check = True)
+    result = json.loads(out.stdout.strip().splitlines()[-1])
+
+    print('\n%s' % case)
+    print('           Rows pivoted:  %d' % (result['rows']))
+    print('      Pivot time (secs):  %f' % (result['seconds']))
+    print('      Frame memory (MB):  %f' % (result['frame_mb']))
+    print('    Peak allocated (MB):  %f' % (result['peak_alloc_mb']))
@@ -5,7 +5,11 @@ Author: Joseph DeGregorio
 Created: 8/17/2018
 
 Description:  This python script takes the long format data table
-from scraping as input, pivots the data, and cleans each field.
+from scraping as input, pivots the data, and cleans each field.  In
+chunked mode the molten table is streamed in partitions (all rows of a
+report in one partition), so memory stays bounded however many reports
+there are.  In incremental mode only the reports that are new or changed
+since the last run are cleaned, and the outputs of that run are updated.
 
 """
 # =============================================================================
@@ -13,132 +17,225 @@ from scraping as input, pivots the data, and cleans each field.
 # =============================================================================
 
 # Load Libraries
+import copy
+import os
+import shutil
+import tempfile
 import pandas as pd
 import numpy as np
+import cleanpy
 import pandas_summary
 
-# =============================================================================
-#                                 Import Data
-# =============================================================================
-
-print('Importing Data...', end='')
-# Import Hike Data (Molten State)
-df_rpts_molten = pd.read_csv('../Data/reports_data_molten.csv', encoding = "utf-8", engine = 'python')
-print('Complete')
-
-# =============================================================================
-#                                Basic Cleaning
-# =============================================================================
-print('Basic Cleaning...', end='')
-# Remove Incomplete Records
-df_rpts_molten.dropna(inplace=True)
+# Set chunked mode (rows of the molten table per partition, or None to clean
+# every report at once)
+partition_rows = None
 
-# Remove Duplicates
-df_rpts_molten.drop_duplicates(subset = ['ID', 'Key'], inplace=True)
+# Set incremental mode (clean only the reports that are new or changed since
+# the last run, and update its outputs; not used in chunked mode)
+incremental = False
+state_path = '../Data/reports_state.pkl'
 
-# Pivot Data to tidy/wide format
-df_rpts = df_rpts_molten.pivot(index = 'ID', columns = 'Key', values = 'Value')
-df_rpts.reset_index(inplace=True)
-del df_rpts_molten
-
-#Remove reports that are missing a hike ID
-df_rpts = df_rpts[df_rpts.HikeID.notna()]
-
-#Rename ID field as "ReportID"
-df_rpts.rename(columns = {'ID':'ReportID'}, inplace=True)
-
-print('Complete')
-# =============================================================================
-#                              Clean Variables
-# =============================================================================
-print('Cleaning Variables...', end='')
-
-# Trail Conditions
-# Split basic condition category from list of hazards
-df_tc = df_rpts.Cond_TrailConditions.str.split(':', expand=True)
-df_rpts['Cond_Trail'] = df_tc[0]
-df_rpts.rename(columns = {'Cond_TypeofHike':'TypeofHike'}, inplace=True)
-del df_tc[0]
-
-# Convert hazards into list of dummy variables
-df_tc = df_tc[1].str.strip()
-df_tc = df_tc.str.replace('.', '')
-df_tc = df_tc.str.replace(' ', '')
-df_tc = df_tc.str.replace('/', '')
-df_tc = df_tc.str.replace('(', '')
-df_tc = df_tc.str.replace(')', '')
-df_tc = df_tc.str.get_dummies(',    ')
-
-rename = {'Bridgeout':'Haz_BridgeOut',
-          'Difficultstreamcrossings':'Haz_DifStreamCrossing',
-          'MudRockslideorwashout':'Haz_Washout',
-          'Muddyorwettrail':'Haz_Muddy',
-          'Overgrowninplaces':'Haz_Overgrown',
-          'Treesdownacrosstrail':'Haz_DownTrees'
-          }
-
-df_tc.rename(columns = rename, inplace=True)
-df_rpts = pd.concat([df_rpts, df_tc], axis=1)
-del df_tc
-del rename
-df_rpts.drop(columns = 'Cond_TrailConditions', inplace=True)
-
-#Fix Feature Boolean Variables
-col_feats = df_rpts.columns[df_rpts.columns.str.startswith('Feat')]
-for col in col_feats:
-    df_rpts[col] = np.where(df_rpts[col] == 'True', True, False)
-
-#Fix Hazard Boolean Variables
-col_haz = df_rpts.columns[df_rpts.columns.str.startswith('Haz')]
-for col in col_haz:
-    df_rpts[col] = np.where(df_rpts[col] == 1, True, False)
-
-
-#Replace NaN with empty string for text entries
-df_rpts['ReportBody'].fillna('', inplace = True)
-
-#Update data types
-df_rpts = df_rpts.apply(pd.to_numeric, errors='ignore')
-
-#Update Categorical Fields
-col_cat = []
-for col in df_rpts.columns:
-    tp = df_rpts[col].dtype == 'object'
-    nu = df_rpts[col].nunique() <= 25
-    if (tp & nu):
-        col_cat.append(col)
-
-#for col in col_cat:
-#    print(col)
-#    print(df_rpts[col].value_counts()[:6])
-#    print()
-
-df_rpts[col_cat] = df_rpts[col_cat].astype('category')
-
-#Update Date Fields
-df_rpts['ReportDate'] = df_rpts['ReportDate'].astype('datetime64')
-
-# Organize Columns
+# Set output columns
 gp_core = ['ReportID', 'Report_URL', 'HikeID', 'Author', 'UserID', 'ReportDate']
 gp_desc = ['TypeofHike', 'ReportBody', 'ImageCnt', 'ReportHelpfulCnt']
 gp_cond = ['Cond_Trail', 'Cond_Road', 'Cond_Snow', 'Cond_Bugs']
 gp_haz = ['Haz_BridgeOut', 'Haz_DifStreamCrossing', 'Haz_Washout', 'Haz_Muddy', 'Haz_Overgrown', 'Haz_DownTrees']
 gp_feat = ['Feat_Fallfoliage', 'Feat_Hikedwithadog', 'Feat_Hikedwithkids', 'Feat_Ripeberries', 'Feat_Wildflowersblooming']
 
-df_rpts = df_rpts[gp_core + gp_desc + gp_cond + gp_haz + gp_feat]
+# Set hazards listed in the trail conditions (phrase: field)
+hazards = {'Bridge out':'Haz_BridgeOut',
+           'Difficult stream crossings':'Haz_DifStreamCrossing',
+           'Mud/Rockslide or washout':'Haz_Washout',
+           'Muddy or wet trail':'Haz_Muddy',
+           'Overgrown in places':'Haz_Overgrown',
+           'Trees down across trail':'Haz_DownTrees'
+           }
 
-#Create summary
-df_sum = np.transpose(pandas_summary.DataFrameSummary(df_rpts).columns_stats)
+# Count of reports listing each hazard that is not in hazards
+unknown_hazards = {}
 
-print('Complete')
+# Set keys of the molten table the output columns are made from
+keys = ['Report_URL', 'HikeID', 'Author', 'UserID', 'ReportDate', 'Cond_TypeofHike', 'ReportBody',
+        'ImageCnt', 'ReportHelpfulCnt', 'Cond_TrailConditions', 'Cond_Road', 'Cond_Snow', 'Cond_Bugs'] + gp_feat
 
 # =============================================================================
-#                              Export Data
+#                               Cleaning Steps
 # =============================================================================
-print('Exporting Data...', end='')
-
-#Save csv
-df_rpts.to_csv("../Data/reports.csv", index = False, encoding = "utf-8")
-df_rpts.to_pickle("../Data/reports.pkl")
 
-print('Complete')
\ No newline at end of file
+def cleanreports( df_rpts_molten ):
+    # Pivot and clean the reports of a molten table (all of it, or a partition
+    # holding every row of its reports), before data types are set
+
+    # Pivot Data to tidy/wide format (skips incomplete records, and keeps the
+    # first value of duplicate ID/Key pairs)
+    df_rpts = cleanpy.pivotmolten(df_rpts_molten)
+    df_rpts.reset_index(inplace=True)
+
+    # Add keys no report in the table has (as text columns of NaN)
+    for key in keys:
+        if key not in df_rpts.columns:
+            df_rpts[key] = pd.Series(np.nan, index = df_rpts.index, dtype = object)
+
+    #Remove reports that are missing a hike ID
+    df_rpts = df_rpts[df_rpts.HikeID.notna()].reset_index(drop = True)
+
+    #Rename ID field as "ReportID"
+    df_rpts = df_rpts.rename(columns = {'ID':'ReportID'})
+
+    # Trail Conditions
+    # Split basic condition category from list of hazards (as Haz_ fields,
+    # counting the hazards not in the hazard list)
+    df_rpts['Cond_Trail'], df_haz = cleanpy.parsehazards(df_rpts.Cond_TrailConditions, hazards,
+                                                         unknown = unknown_hazards)
+    df_rpts = pd.concat([df_rpts, df_haz], axis=1)
+    del df_haz
+    df_rpts.drop(columns = 'Cond_TrailConditions', inplace=True)
+    df_rpts.rename(columns = {'Cond_TypeofHike':'TypeofHike'}, inplace=True)
+
+    #Fix Feature Boolean Variables
+    col_feats = df_rpts.columns[df_rpts.columns.str.startswith('Feat')]
+    for col in col_feats:
+        df_rpts[col] = np.where(df_rpts[col] == 'True', True, False)
+
+    #Replace NaN with empty string for text entries
+    df_rpts['ReportBody'].fillna('', inplace = True)
+
+    # Organize Columns
+    return df_rpts[gp_core + gp_desc + gp_cond + gp_haz + gp_feat]
+
+def typereports( df_rpts , types ):
+    # Set data types found by cleanpy.scantypes (numeric and categorical
+    # fields, the same for every partition) and the date field
+
+    #Update data types and Categorical Fields
+    df_rpts = cleanpy.settypes(df_rpts, types)
+
+    #Update Date Fields
+    df_rpts['ReportDate'] = df_rpts['ReportDate'].astype('datetime64')
+
+    return df_rpts
+
+if partition_rows is None:
+    # =========================================================================
+    #                               Import Data
+    # =========================================================================
+
+    print('Importing Data...', end='')
+    # Import Hike Data (Molten State, shards written by the report page scraper).
+    # The python engine is only used for csv shards (legacy runs or
+    # output_format = 'csv'), parquet shards are read with pyarrow.
+    df_rpts_molten = cleanpy.readmolten('../Data/report_data_molten', categorical = True, engine = 'python')
+
+    # Hash the rows of each report (to find the reports the next run has to clean)
+    hashes = cleanpy.hashmolten(df_rpts_molten)
+
+    # Keep the reports that are new or changed since the last run
+    state = None
+    if incremental and os.path.exists(state_path) and os.path.exists('../Data/reports.pkl'):
+        state = pd.read_pickle(state_path)
+        ids = cleanpy.changedids(hashes, state['hashes'])
+        df_rpts_molten_all = df_rpts_molten
+        df_rpts_molten = df_rpts_molten[df_rpts_molten.ID.isin(ids)]
+        print('Complete (%d new or changed reports)' % (len(ids)))
+    else:
+        print('Complete')
+
+    # =========================================================================
+    #                            Clean Variables
+    # =========================================================================
+    print('Cleaning Variables...', end='')
+
+    df_rpts = cleanreports(df_rpts_molten)
+
+    #Find data types (numeric fields, and text fields with 25 or fewer values
+    #as categorical), updating those of the last run
+    types = cleanpy.scantypes(df_rpts, None if state is None else copy.deepcopy(state['types']))
+
+    #Clean every report if the new reports change the type of a field (the
+    #outputs of the last run cannot be updated)
+    if (state is not None) and cleanpy.changedtypes(state['types'], types):
+        print('field types changed, cleaning every report...', end='')
+        state = None
+        unknown_hazards.clear()
+        df_rpts = cleanreports(df_rpts_molten_all)
+        types = cleanpy.scantypes(df_rpts)
+    df_rpts_molten = df_rpts_molten_all = None
+
+    #Update data types
+    df_rpts = typereports(df_rpts, types)
+
+    #Update the outputs of the last run with the new and changed reports
+    if state is not None:
+        df_rpts = cleanpy.upsertrows(pd.read_pickle('../Data/reports.pkl'), df_rpts, 'ReportID', ids = ids)
+
+    #Create summary
+    df_sum = np.transpose(pandas_summary.DataFrameSummary(df_rpts).columns_stats)
+
+    print('Complete')
+
+    # =========================================================================
+    #                              Export Data
+    # =========================================================================
+    print('Exporting Data...', end='')
+
+    #Save csv
+    df_rpts.to_csv("../Data/reports.csv", index = False, encoding = "utf-8")
+    df_rpts.to_pickle("../Data/reports.pkl")
+
+    #Save hashes and data types (for the next incremental run)
+    pd.to_pickle({'hashes': hashes, 'types': types}, state_path)
+
+    print('Complete')
+
+else:
+    # =========================================================================
+    #                     Clean Partitions (first pass)
+    # =========================================================================
+    print('Cleaning Partitions...', end='')
+
+    # Clean each partition and find the data types of the whole table (the
+    # cleaned partitions are kept on disk until the types are known)
+    tmp_dir = tempfile.mkdtemp(prefix = 'reports_', dir = '../Data')
+    tmp_paths = []
+    types = {}
+    # (python engine for csv shards only, as in memory)
+    partitions = cleanpy.readpartitions('../Data/report_data_molten', rows_max = partition_rows,
+                                        categorical = True, engine = 'python')
+    for df_rpts_molten in partitions:
+        df_rpts = cleanreports(df_rpts_molten)
+        cleanpy.scantypes(df_rpts, types)
+        tmp_paths.append(os.path.join(tmp_dir, 'part-%05d.pkl' % (len(tmp_paths))))
+        df_rpts.to_pickle(tmp_paths[-1])
+    df_rpts_molten = df_rpts = None
+
+    print('Complete (%d partitions)' % (len(tmp_paths)))
+
+    # =========================================================================
+    #                     Export Partitions (second pass)
+    # =========================================================================
+    print('Exporting Data...', end='')
+
+    # Clear the typed table of an earlier chunked run (reports.pkl is only
+    # written in memory, the typed table is written as parquet partitions)
+    os.makedirs('../Data/reports', exist_ok = True)
+    for name in os.listdir('../Data/reports'):
+        if name.startswith('part-') and name.endswith('.parquet'):
+            os.remove(os.path.join('../Data/reports', name))
+
+    # Set data types and append each partition to the final table (reports
+    # are sorted by ID within each partition, rather than across the table)
+    for i, tmp_path in enumerate(tmp_paths):
+        df_rpts = typereports(pd.read_pickle(tmp_path), types)
+        df_rpts.to_csv("../Data/reports.csv", mode = 'w' if i == 0 else 'a', header = (i == 0),
+                       index = False, encoding = "utf-8")
+        df_rpts.to_parquet('../Data/reports/part-%05d.parquet' % (i), index = False)
+        os.remove(tmp_path)
+    shutil.rmtree(tmp_dir)
+
+    print('Complete')
+
+# Report hazards that are not in the hazard list (left out of the Haz_ fields)
+if unknown_hazards:
+    print('Unknown hazards (not in the Haz_ fields):')
+    for hazard, count in sorted(unknown_hazards.items(), key = lambda item: -item[1]):
+        print('    %s: %d reports' % (hazard, count))
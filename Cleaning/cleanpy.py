@@ -1,6 +1,18 @@
 # -*- coding: utf-8 -*-
 
+import itertools
+import multiprocessing
+import os
+import re
 import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+
+#Use pyarrow to read parquet shards in row batches if available
+try:
+    import pyarrow.parquet as pq
+except ImportError:
+    pq = None
 
 def chopseries( s , search = 'end', nuq_min = 1, nuq_max = 5, thres = 0.3, char_min = 4):
 
@@ -23,10 +35,13 @@ def chopseries( s , search = 'end', nuq_min = 1, nuq_max = 5, thres = 0.3, char_
     #     and returns the repeated patterns, as well as their relative location
     #     from the start/end of the string.
     #
+    #     Details: The number of unique patterns can only grow as the chop
+    #     length grows, so the longest qualifying length is found with a
+    #     binary search over the unique string values, rather than counting
+    #     the unique patterns of the whole series at every length.
     # =========================================================================
 
     #Set initial values
-    chop_locs = []
     chop_loc = 0
     patterns = []
 
@@ -48,228 +63,447 @@ def chopseries( s , search = 'end', nuq_min = 1, nuq_max = 5, thres = 0.3, char_
     #Set maximum chop limit based on minimum string length in series
     len_min = len(min(unique, key=len))
 
-    #Define list to iterate through
-    iter_list = list(reversed(range(char_min, len_min)))
-
-    #Iterate from start/end from char_min to len_min
-    for i in iter_list:
-        #Determine unique values for i chop length
-        if search == 'start':
-            n_unique = s[s.notnull()].str[:i].nunique()
-        elif search == 'end':
-            n_unique = s[s.notnull()].str[-i:].nunique()
-        else:
-            print('Error:  Enter Valid Search Direction')
-            return chop_loc, patterns
-
-        #Store value if n_unique qualifies for min/max limits
-        if (n_unique >= nuq_min) & (n_unique <= nuq_max) & (n_unique/len(unique) <= thres):
-            chop_locs.append(i)
+    #Return null if there are no chop lengths to search
+    if char_min >= len_min:
+        return chop_loc, patterns
 
-    #Check if list is empty
-    if len(chop_locs) > 0:
+    if search not in ['start', 'end']:
+        print('Error:  Enter Valid Search Direction')
+        return chop_loc, patterns
 
-        #Determine max chop location that meets the requirements
-        chop_loc = max(chop_locs)
+    #Unique strings to chop (other values have no pattern)
+    strings = [value for value in unique if type(value) == str]
 
-        #
+    def countpatterns( i ):
+        #Number of unique patterns i characters from the start/end
         if search == 'start':
-            patterns = list(s[s.notnull()].str[:chop_loc].unique())
-        elif search == 'end':
-            patterns = list(s[s.notnull()].str[-chop_loc:].unique())
+            return len(set(value[:i] for value in strings))
+        return len(set(value[-i:] for value in strings))
+
+    def qualifies( n_unique ):
+        #Check if n_unique qualifies for min/max limits
+        return (n_unique >= nuq_min) & (n_unique <= nuq_max) & (n_unique/len(unique) <= thres)
+
+    #Binary search for the longest chop length under the max limits (the
+    #counts only grow with length, so every shorter length is also under)
+    low = max(char_min, 1)
+    high = len_min - 1
+    while low <= high:
+        i = (low + high) // 2
+        n_unique = countpatterns(i)
+        if (n_unique <= nuq_max) & (n_unique/len(unique) <= thres):
+            chop_loc = i
+            low = i + 1
         else:
-            print('Error:  Enter Valid Search Direction')
+            high = i - 1
+
+    #Check the longest length meets the min limit (every shorter length has
+    #fewer patterns)
+    if (chop_loc > 0) and not qualifies(countpatterns(chop_loc)):
+        chop_loc = 0
+
+    #Check non-positive chop lengths (do not follow the same ordering)
+    if chop_loc == 0:
+        for i in reversed(range(char_min, min(len_min, 1))):
+            if qualifies(countpatterns(i)):
+                chop_loc = i
+                break
+        else:
+            return chop_loc, patterns
+
+    #Gather patterns at the chop location
+    if search == 'start':
+        patterns = list(s[s.notnull()].str[:chop_loc].unique())
+    else:
+        patterns = list(s[s.notnull()].str[-chop_loc:].unique())
 
     return chop_loc, patterns
 
 
-def chopsubstrings( pddf , exclude = None, inplace = False):
+def chopsubstrings( pddf , exclude = None, inplace = False, record = None, processes = 1):
 
     # =========================================================================
-    #     Function: chopsubstrings( pddf , exclude = None, inplace = False)
+    #     Function: chopsubstrings( pddf , exclude = None, inplace = False,
+    #                               record = None, processes = 1)
     #
     #     Description:  The purpose of this function is to identify and remove
     #     repeated patterns that occur at the begining or end of every record.
     #
     #     Argument/Return:  The function requires a pandas dataframe as an
     #     input,as well as an optional argument to exclude specific columns.
+    #     Returns the dataframe (if not inplace).  The steps applied are added
+    #     to record (if a list is given), and can be applied to new data with
+    #     replaysubstrings.
     #
     #     Details: If a repeated pattern is found, it will be reported in
-    #     console and then removed from each record.
+    #     console and then removed from each record.  Only the changed columns
+    #     are replaced (the dataframe is not copied), and both ends are
+    #     removed in one pass over the column.  The patterns of each column
+    #     are found in separate processes if processes > 1 (all cores if
+    #     None), with the same results as processes = 1.
     # =========================================================================
 
     #Gather Columns
-    df  = pddf.copy(deep = True)
+    df = pddf if inplace else pddf.copy(deep = False)
     cols = list(df.select_dtypes('object').columns)
+    steps = []
 
     #Remove excluded columns
     if exclude != None:
         for exclusion in exclude:
             cols.remove(exclusion)
 
-    #Iterate through columns
-    for col in cols:
+    #Iterate through columns (in column order)
+    for col, (step, report) in mapcolumns(chopcolumn, df, cols, processes):
 
-        #Set Intial Values
-        chop_start_text = ''
-        chop_end_text = ''
+        #Print result
+        for line in report:
+            print(line)
 
-        #Define Series
-        s = df[col]
+        #Chop Start and End
+        if step is not None:
+            replaysubstrings(df, [step], inplace = True)
+            steps.append(step)
+
+    if record is not None:
+        record.extend(steps)
 
-        #Find chop location and patterns from START
-        chop_start_loc, patterns_start = chopseries(s,
-                                                    search = 'start',
-                                                    nuq_min = 1,
-                                                    nuq_max = 1,
-                                                    char_min = 1,
-                                                    thres = 1
-                                                    )
-
-        #Define the start text that is being chopped
-        if len(patterns_start) > 0:
-            chop_start_text = patterns_start[0]
-
-        #Find chop location and patterns from END
-        chop_end_loc, patterns_end = chopseries(s,
-                                                search = 'end',
+    if not inplace:
+        return df
+
+    return
+
+def chopcolumn( s ):
+    #Find the chop step (or None) and console report for one column
+
+    #Set Intial Values
+    chop_start_text = ''
+    chop_end_text = ''
+    step = None
+    report = []
+
+    #Find chop location and patterns from START
+    chop_start_loc, patterns_start = chopseries(s,
+                                                search = 'start',
                                                 nuq_min = 1,
                                                 nuq_max = 1,
                                                 char_min = 1,
                                                 thres = 1
                                                 )
 
-        #Define the text that is being chopped
-        if len(patterns_end) > 0:
-            chop_end_text = patterns_end[0]
+    #Define the start text that is being chopped
+    if len(patterns_start) > 0:
+        chop_start_text = patterns_start[0]
+
+    #Find chop location and patterns from END
+    chop_end_loc, patterns_end = chopseries(s,
+                                            search = 'end',
+                                            nuq_min = 1,
+                                            nuq_max = 1,
+                                            char_min = 1,
+                                            thres = 1
+                                            )
+
+    #Define the text that is being chopped
+    if len(patterns_end) > 0:
+        chop_end_text = patterns_end[0]
 
-        #Print result header
-        if (len(chop_start_text) > 0) | (len(chop_end_text) > 0):
-            print('\nModifying Column:  %s' % col)
+    #Result header
+    if (len(chop_start_text) > 0) | (len(chop_end_text) > 0):
+        report.append('\nModifying Column:  %s' % s.name)
 
         #Chop Start
         if len(chop_start_text) > 0:
-            print('   Removing "%s" from start' % chop_start_text)
-            if inplace:
-                pddf[col] = pddf[col].str[chop_start_loc:]
-            else:
-                df[col] = df[col].str[chop_start_loc:]
+            report.append('   Removing "%s" from start' % chop_start_text)
 
         #Chop End
         if len(chop_end_text) > 0:
-            print('   Removing "%s" from end' % chop_end_text)
-            if inplace:
-                pddf[col] = pddf[col].str[:-chop_end_loc]
-            else:
-                df[col] = df[col].str[:-chop_end_loc]
+            report.append('   Removing "%s" from end' % chop_end_text)
 
-    if not inplace:
-        return df
+        step = {'step': 'chop',
+                'col': s.name,
+                'start': chop_start_loc if len(chop_start_text) > 0 else 0,
+                'end': chop_end_loc if len(chop_end_text) > 0 else 0,
+                'start_text': chop_start_text,
+                'end_text': chop_end_text}
+
+    return step, report
 
-def splitsubstrings( pddf , exclude = None, nuq_max = 5, inplace = False):
+def splitsubstrings( pddf , exclude = None, nuq_max = 5, inplace = False, record = None, processes = 1):
 
     # =========================================================================
-    #     Function: chopsubstrings( pddf , exclude = None, inplace = False)
+    #     Function: splitsubstrings( pddf , exclude = None, nuq_max = 5,
+    #                                inplace = False, record = None,
+    #                                processes = 1)
     #
-    #     Description:  The purpose of this function is to identify and remove
-    #     repeated patterns that occur at the begining or end of every record.
+    #     Description:  The purpose of this function is to identify repeated
+    #     patterns that split the records of a column into a few categories
+    #     (e.g. ' miles, roundtrip' and ' miles, one-way'), and move them
+    #     from the start/end of each record into a new categorical column.
     #
     #     Argument/Return:  The function requires a pandas dataframe as an
     #     input,as well as an optional argument to exclude specific columns.
+    #     Returns the dataframe (if not inplace).  The steps applied are added
+    #     to record (if a list is given), and can be applied to new data with
+    #     replaysubstrings.
     #
-    #     Details: If a repeated pattern is found, it will be reported in
-    #     console and then removed from each record.
+    #     Details: If repeated patterns are found, they will be reported in
+    #     console, stripped from each record and stored in column_start or
+    #     column_end.  Each column is sliced once per search direction, and
+    #     only the changed and new columns are written to the dataframe.  The
+    #     patterns of each column are found in separate processes if
+    #     processes > 1 (all cores if None), with the same results as
+    #     processes = 1.
     # =========================================================================
 
-    #Import
-    import numpy as np
-
     #Gather Columns
-    df  = pddf.copy(deep = True)
+    df = pddf if inplace else pddf.copy(deep = False)
     cols = list(df.select_dtypes('object').columns)
+    steps = []
 
     #Remove excluded columns
     if exclude != None:
         for exclusion in exclude:
             cols.remove(exclusion)
 
-    #Iterate through columns
-    for col in cols:
+    #Iterate through columns (in column order)
+    for col, (step, report) in mapcolumns(splitcolumn, df, cols, processes, nuq_max = nuq_max):
 
-        #Define Series
-        s = df[col]
+        #Print result
+        for line in report:
+            print(line)
 
-        #Find chop location and patterns
-        for srch in ['start', 'end']:
-            chop_loc, patterns = chopseries(s,
-                                            search = srch,
-                                            nuq_min = 2,
-                                            nuq_max = nuq_max,
-                                            char_min = 5,
-                                            thres = 0.5
-                                            )
+        #Split Start and End
+        if step is not None:
+            replaysubstrings(df, [step], inplace = True)
+            steps.append(step)
 
-            if chop_loc > 0:
-                print('\nSplitting %s of column "%s", unique substrings:' % (srch, col))
+    if record is not None:
+        record.extend(steps)
 
-                #Create reference column for matching
-                if inplace:
-                    pddf['ref'] = pddf[col]
-                else:
-                    df['ref'] = df[col]
+    if not inplace:
+        return df
 
-                #Create new column for new categorical variable
-                col_new = col + '_' + srch
-                if inplace:
-                    pddf[col_new] = np.nan
-                else:
-                    df[col_new] = np.nan
-
-                #Iterate through sub-patterns
-                for pat in patterns:
-                    if srch == 'start':
-                        s_sub = s[s.str[:chop_loc] == pat]
-                    if srch == 'end':
-                        s_sub = s[s.str[-chop_loc:] == pat]
-
-                    #Find sub-chop location and patterns
-                    chop_loc_sub, patterns_sub = chopseries(s_sub,
-                                                            search = srch,
-                                                            nuq_min = 1,
-                                                            nuq_max = 1,
-                                                            char_min = 5,
-                                                            thres = 1
-                                                            )
-
-                    pat_sub = patterns_sub[0]
-                    print('    "%s"' % pat_sub)
-
-                    if srch == 'start':
-                        #Strip from start
-                        s_new = s.str[chop_loc_sub:]
-                        if inplace:
-                            pddf[col_new] = np.where(pddf['ref'].str[:chop_loc] == pat_sub, pat_sub, pddf[col_new])
-                            pddf[col][pddf[col].str[:chop_loc] == pat] = s_new
-
-                        else:
-                            df[col_new] = np.where(df['ref'].str[:chop_loc] == pat_sub, pat_sub, df[col_new])
-                            df[col][df[col].str[:chop_loc] == pat] = s_new
-
-                    if srch == 'end':
-                        #Strip from end
-                        s_new = s.str[:-chop_loc_sub]
-                        if inplace:
-                            pddf[col_new] = np.where(pddf['ref'].str[-chop_loc_sub:] == pat_sub, pat_sub, pddf[col_new])
-                            pddf[col][pddf[col].str[-chop_loc:] == pat] = s_new
-                        else:
-                            df[col_new] = np.where(df['ref'].str[-chop_loc_sub:] == pat_sub, pat_sub, df[col_new])
-                            df[col][df[col].str[-chop_loc:] == pat] = s_new
-
-    #Remove REF column
-    if inplace:
-        pddf.drop(columns = 'ref', inplace = True)
+    return
+
+def splitcolumn( s , nuq_max = 5):
+    #Find the split step (or None) and console report for one column
+
+    stages = []
+    report = []
+
+    #Find chop location and patterns
+    for srch in ['start', 'end']:
+        chop_loc, patterns = chopseries(s,
+                                        search = srch,
+                                        nuq_min = 2,
+                                        nuq_max = nuq_max,
+                                        char_min = 5,
+                                        thres = 0.5
+                                        )
+
+        if chop_loc > 0:
+            report.append('\nSplitting %s of column "%s", unique substrings:' % (srch, s.name))
+
+            #Pattern of each record
+            if srch == 'start':
+                s_pat = s.str[:chop_loc]
+            else:
+                s_pat = s.str[-chop_loc:]
+
+            #Iterate through sub-patterns
+            subs = []
+            for pat in patterns:
+                s_sub = s[s_pat == pat]
+
+                #Find sub-chop location and patterns
+                chop_loc_sub, patterns_sub = chopseries(s_sub,
+                                                        search = srch,
+                                                        nuq_min = 1,
+                                                        nuq_max = 1,
+                                                        char_min = 5,
+                                                        thres = 1
+                                                        )
+
+                pat_sub = patterns_sub[0]
+                report.append('    "%s"' % pat_sub)
+                subs.append([pat, chop_loc_sub, pat_sub])
+
+            stages.append({'search': srch, 'chop_loc': chop_loc, 'col_new': s.name + '_' + srch, 'patterns': subs})
+
+    if len(stages) == 0:
+        return None, report
+
+    return {'step': 'split', 'col': s.name, 'stages': stages}, report
+
+def mapcolumns( func , df , cols , processes = 1, **kwargs):
+
+    # =========================================================================
+    #     Function: mapcolumns( func , df , cols , processes = 1, **kwargs)
+    #
+    #               func: Function of one column (and kwargs)
+    #               df: Pandas dataframe
+    #               cols: Columns to run func on
+    #               processes: Number of processes (all cores if None)
+    #
+    #     Description:  The purpose of this function is to run a per column
+    #     function over many columns, in a process pool if processes > 1.
+    #
+    #     Argument/Return:  Yields (column, result) in the order of cols.
+    #
+    #     Details: Only each column's data is sent to the workers (forked
+    #     where possible, so the calling script is not re-imported).  With
+    #     one process, each column is read when it is reached, after the
+    #     results of the previous columns have been applied.
+    # =========================================================================
+
+    if processes is None:
+        processes = os.cpu_count()
+    processes = min(processes, len(cols))
+
+    #Run in this process
+    if processes <= 1:
+        for col in cols:
+            yield col, func(df[col], **kwargs)
+        return
+
+    #Run in a process pool (results are gathered in column order)
+    if 'fork' in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context('fork')
     else:
-        df.drop(columns = 'ref', inplace = True)
+        context = None
+    with ProcessPoolExecutor(max_workers = processes, mp_context = context) as executor:
+        futures = [executor.submit(func, df[col], **kwargs) for col in cols]
+        for col, future in zip(cols, futures):
+            yield col, future.result()
+
+def replaysubstrings( pddf , record , inplace = False):
+
+    # =========================================================================
+    #     Function: replaysubstrings( pddf , record , inplace = False)
+    #
+    #               pddf: Pandas dataframe
+    #               record: List of steps from chopsubstrings/splitsubstrings
+    #               inplace: Modify pddf instead of returning a copy
+    #
+    #     Description:  The purpose of this function is to apply the substring
+    #     changes found on one dataframe to another (e.g. newly scraped
+    #     records), without searching for the patterns again.
+    #
+    #     Argument/Return:  Returns the dataframe (if not inplace) with each
+    #     step applied in order.  Steps for columns that do not exist are
+    #     skipped.
+    #
+    #     Details: A 'chop' step removes the first 'start' and last 'end'
+    #     characters of each record that has the recorded start and end text
+    #     (the text of every record the step was found on), and leaves other
+    #     text records unchanged.  A 'split' step strips each pattern's
+    #     sub-pattern from the records that have it, and stores the
+    #     sub-patterns in a new column ('nan' where none is found), with
+    #     every stage searching the column as it was before the step.
+    # =========================================================================
+
+    df = pddf if inplace else pddf.copy(deep = False)
+
+    for step in record:
+        col = step['col']
+        if col not in df.columns:
+            continue
+        s = df[col]
+
+        #Chop Start and End (in one slice), leaving text records that do not
+        #have the recorded start/end text as they are
+        if step['step'] == 'chop':
+            s_new = s.str[step['start']:(-step['end'] if step['end'] > 0 else None)]
+            match = s.str.startswith(step.get('start_text', '')).eq(True) & s.str.endswith(step.get('end_text', '')).eq(True)
+            text = s.str.len().notna()
+            df[col] = s_new.where(match | ~text, s)
+            continue
+
+        #Split Start and End
+        values = s.to_numpy(dtype = object, copy = True)
+        for stage in step['stages']:
+            chop_loc = stage['chop_loc']
+            ref = pd.Series(values.copy(), index = s.index)
+            col_new = np.full(len(values), 'nan', dtype = object)
+
+            #Pattern of each record (updated as records are stripped)
+            if stage['search'] == 'start':
+                s_pat = ref.str[:chop_loc].to_numpy(dtype = object, copy = True)
+            else:
+                s_pat = ref.str[-chop_loc:].to_numpy(dtype = object, copy = True)
+            ref_pats = {}
+
+            for pat, chop_loc_sub, pat_sub in stage['patterns']:
+
+                #Store sub-pattern in new column (start compares the first
+                #chop_loc characters, end the last chop_loc_sub characters)
+                loc = chop_loc if stage['search'] == 'start' else chop_loc_sub
+                if loc not in ref_pats:
+                    if stage['search'] == 'start':
+                        ref_pats[loc] = ref.str[:loc].to_numpy(dtype = object)
+                    else:
+                        ref_pats[loc] = ref.str[-loc:].to_numpy(dtype = object)
+                col_new[ref_pats[loc] == pat_sub] = pat_sub
+
+                #Strip sub-pattern (from the records as they were before the step)
+                rows = np.flatnonzero(s_pat == pat)
+                if stage['search'] == 'start':
+                    s_new = s.iloc[rows].str[chop_loc_sub:]
+                    values[rows] = s_new.to_numpy(dtype = object)
+                    s_pat[rows] = s_new.str[:chop_loc].to_numpy(dtype = object)
+                else:
+                    s_new = s.iloc[rows].str[:-chop_loc_sub]
+                    values[rows] = s_new.to_numpy(dtype = object)
+                    s_pat[rows] = s_new.str[-chop_loc:].to_numpy(dtype = object)
+
+            df[stage['col_new']] = col_new
+
+        df[col] = pd.Series(values, index = s.index, dtype = object)
+
+    if not inplace:
+        return df
+
+    return
+
+def stripsubstrings( pddf , col , pat_col , suffix = '', inplace = False):
+
+    # =========================================================================
+    #     Function: stripsubstrings( pddf , col , pat_col , suffix = '',
+    #                                inplace = False)
+    #
+    #               pddf: Pandas dataframe
+    #               col: Column to strip
+    #               pat_col: Column holding each row's text to remove
+    #               suffix: Text following the pattern that is also removed
+    #                       (e.g. ' -- ')
+    #               inplace: Modify pddf instead of returning a copy
+    #
+    #     Description:  The purpose of this function is to remove text that
+    #     is repeated from another column of the same record (e.g. the
+    #     Region at the start of every Location).
+    #
+    #     Argument/Return:  Returns the dataframe (if not inplace) with every
+    #     occurrence of pat_col + suffix removed from col and the result
+    #     stripped of whitespace, row by row.  Rows where either value is
+    #     not a string (e.g. NaN) are left unchanged.
+    #
+    #     Details: The whole column is processed in one pass over its
+    #     values, rather than indexing the dataframe a row at a time.
+    # =========================================================================
+
+    #Shallow copy (the stripped column is assigned, not modified in place)
+    df = pddf if inplace else pddf.copy(deep = False)
+
+    #Row aligned values and patterns
+    values = df[col].to_numpy(dtype = object)
+    patterns = df[pat_col].to_numpy(dtype = object)
+
+    #Remove pattern from each value
+    stripped = [value.replace(pat + suffix, '').strip() if (type(value) == str) and (type(pat) == str) else value
+                for value, pat in zip(values, patterns)]
+
+    df[col] = pd.Series(stripped, index = df.index, dtype = object)
 
     if not inplace:
         return df
@@ -285,98 +519,621 @@ def dropdupcol( df ):
 #     duplicate columns within a pandas dataframe.
 #
 #     Argument/Return:  The function requires a pandas dataframe as an input,
-#     and returns a pandas dataframe with the duplicate columns removed.
+#     removes the duplicate columns from it, and returns the list of dropped
+#     columns.
 #
 #     Details: If a duplicate is found, the function will keep the first
 #     instance and remove the second instance, based on the inital column
-#     order.
+#     order.  Each column is fingerprinted once (null positions and values),
+#     and only columns with the same fingerprint are compared.
 # =============================================================================
 
     #Define list of columns
     cols = list(df.columns)
     cols_drop = []
-    # Loop through pairs evaluate
-    for col_1 in cols:
-        for col_2 in cols:
-
-            # Skip duplicate pairs (i.e. pair in lower triangular matrix)
-            if cols.index(col_1) >= cols.index(col_2):
-                continue
 
-            # Skip if NA count doesn't match
-            if df[col_1].isnull().sum() != df[col_2].isnull().sum():
-                continue
+    #Null mask of each column
+    nulls = {col: df[col].isnull().to_numpy() for col in cols}
 
-            # Determine Index of NA Values
-            index_na_1 = df[col_1].index[df[col_1].isnull()]
-            index_na_2 = df[col_2].index[df[col_2].isnull()]
-            test_na = list(~(index_na_1 == index_na_2))
-            test_vals = list(~(df[col_1][df[col_1].notna()] == df[col_2][df[col_2].notna()]))
-
-            # Flag if columns have identical values
-            if (sum(test_na) + sum(test_vals)) == 0:
-                #Print and store result
-                print('Duplicate Columns: %s, %s' % (col_1, col_2))
-                cols_drop.append(col_2)
-
-    #Remove Duplicates from Drop List
-    cols_drop = list(set(cols_drop))
+    #Group columns by fingerprint (python hashes match for equal values,
+    #e.g. 1, 1.0 and True, so no duplicates are missed)
+    buckets = {}
+    for col in cols:
+        mask = nulls[col]
+        try:
+            value_hash = hash(tuple(df[col].to_numpy()[~mask].tolist()))
+        except TypeError:
+            value_hash = None
+        key = (np.packbits(mask).tobytes(), value_hash)
+        buckets.setdefault(key, []).append(col)
+
+    #Compare pairs with the same fingerprint
+    pairs = []
+    for bucket in buckets.values():
+        for i, col_1 in enumerate(bucket):
+            for col_2 in bucket[i+1:]:
+                vals_1 = df[col_1][~nulls[col_1]]
+                vals_2 = df[col_2][~nulls[col_2]]
+
+                # Flag if columns have identical values
+                if (vals_1 == vals_2).all():
+                    pairs.append((cols.index(col_1), cols.index(col_2)))
+
+    #Print and store results (in column order)
+    for i, j in sorted(pairs):
+        print('Duplicate Columns: %s, %s' % (cols[i], cols[j]))
+        if cols[j] not in cols_drop:
+            cols_drop.append(cols[j])
+    cols_drop = [col for col in cols if col in cols_drop]
 
     #Print dropped columns and drop from dataframe
     print('\nDropping Columns:  ')
     for col in cols_drop:
         print('    %s' % col)
-        df.drop(columns = col, inplace=True)
+    df.drop(columns = cols_drop, inplace=True)
 
-    return
+    return cols_drop
+
+def estlatlong( pddf , est_by , inplace = False):
+
+    # =========================================================================
+    #     Function: estlatlong( pddf , est_by , inplace = False)
+    #
+    #               pddf: Pandas dataframe with Lat and Long columns
+    #               est_by: Column (or list of columns, most specific first)
+    #                       to estimate missing coordinates by
+    #               inplace: Modify pddf instead of returning a copy
+    #
+    #     Description:  The purpose of this function is to fill in missing
+    #     GPS coordinates with the average coordinates of records that share
+    #     the same value (e.g. Trailhead, then Location, then Region).
+    #
+    #     Argument/Return:  Returns the dataframe (if not inplace) with Lat
+    #     and Long filled, and Coord_Type set to 'Actual', 'Est - <column>'
+    #     for the column that supplied the estimate, or NaN if no estimate
+    #     was found.  Every record is kept, in its original order.
+    #
+    #     Details: Each column's averages are taken over the coordinates
+    #     known at that point (actual and estimated by earlier columns), and
+    #     are broadcast back to the records with a groupby transform.
+    #     Records with a missing est_by value get no estimate from it.
+    # =========================================================================
 
-def estlatlong( df , est_by,  inplace=False):
+    df = pddf if inplace else pddf.copy(deep = False)
 
-    #Fill in using average Trailhead location (if available)
-    df_temp = df.groupby(by=est_by, as_index=False).agg({'Lat':np.mean,'Long':np.mean}, axis=1)
-    df_temp.rename(columns={'Lat': 'Lat_est', 'Long': 'Long_est'}, inplace=True)
+    if type(est_by) == str:
+        est_by = [est_by]
 
     #Track initial null values
-    null_cnt_0 = df.Lat.isnull().sum()
+    lat = df['Lat'].to_numpy(dtype = float, copy = True)
+    long = df['Long'].to_numpy(dtype = float, copy = True)
+    coord_type = np.full(len(lat), 'Actual', dtype = object)
+    coord_type[np.isnan(lat)] = np.nan
+
+    for col in est_by:
+        null_cnt_0 = np.isnan(lat).sum()
 
-    df = df.merge(df_temp, on=est_by)
-    df['Coord_Type'] = np.where(df.Lat.isnull(), 'Est - ' + est_by, 'Actual')
-    df.Lat = np.where(df.Lat.isnull(), df.Lat_est, df.Lat)
-    df.Long = np.where(df.Long.isnull(), df.Long_est, df.Long)
+        #Average coordinates of each value (NaN where the value is missing)
+        coords = pd.DataFrame({'Lat': lat, 'Long': long}, index = df.index)
+        est = coords.groupby(df[col].to_numpy(), sort = False).transform('mean')
+        lat_est = est['Lat'].to_numpy()
+        long_est = est['Long'].to_numpy()
 
-    #Track final null values
-    null_cnt_1 = df.Lat.isnull().sum()
+        #Fill missing coordinates and record where they came from
+        fill = np.isnan(lat) & ~np.isnan(lat_est)
+        coord_type[fill] = 'Est - ' + col
+        lat = np.where(np.isnan(lat), lat_est, lat)
+        long = np.where(np.isnan(long), long_est, long)
 
-    #Drop temporary merged columns
-    df.drop(['Lat_est', 'Long_est'], axis=1, inplace=True)
+        #Print results
+        print('Null values reduced from %d to %d' % (null_cnt_0, np.isnan(lat).sum()))
 
-    #Print results
-    print('Null values reduced from %d to %d' % (null_cnt_0, null_cnt_1))
+    df['Lat'] = lat
+    df['Long'] = long
+    df['Coord_Type'] = coord_type
+
+    if not inplace:
+        return df
+
+    return
+
+
+def parsehazards( s , hazards , sep = ':', delim = ',', unknown = None):
+
+    # =========================================================================
+    #     Function: parsehazards( s , hazards , sep = ':', delim = ',',
+    #                             unknown = None)
+    #
+    #               s: Series of trail conditions ("Condition:  Hazard,
+    #                  Hazard")
+    #               hazards: Dictionary of hazard phrase to column name
+    #               sep: Separator after the condition
+    #               delim: Delimiter between hazards
+    #               unknown: Dictionary to count hazards that are not in
+    #                        hazards (updated in place)
+    #
+    #     Description:  Split each trail condition into the condition and
+    #     boolean flags of the hazards listed after it.
+    #
+    #     Argument/Return:  Returns the condition (text before sep, NaN
+    #     where s is missing) and a dataframe with a boolean column per
+    #     hazard column name, both indexed like s.  Hazards that are not in
+    #     hazards are left out of the flags and counted in unknown.
+    #
+    #     Details: Each unique value is scanned once.  Every hazard phrase
+    #     is matched by one compiled pattern that ignores case, spacing and
+    #     the punctuation between words (e.g. "Mud/Rockslide"), and the
+    #     hazards of a value are gathered as bit flags.
+    # =========================================================================
+
+    #Hazard columns (a bit each) and one pattern matching any phrase (a group each)
+    cols = list(dict.fromkeys(hazards.values()))
+    bits = [cols.index(col) for col in hazards.values()]
+    words = [r'[\W_]*'.join(re.findall(r'[^\W_]+', phrase)) for phrase in hazards]
+    matcher = re.compile('|'.join('(%s)' % (w) for w in words), re.IGNORECASE)
+
+    #Scan unique values (codes of -1, missing values, take the last entry)
+    codes, uniques = pd.factorize(s)
+    conditions = np.empty(len(uniques) + 1, dtype = object)
+    conditions[-1] = np.nan
+    flags = np.zeros(len(uniques) + 1, dtype = np.int64)
+    counts = np.bincount(codes[codes >= 0], minlength = len(uniques))
+    for i, value in enumerate(uniques):
+        condition, _, hazards_text = str(value).partition(sep)
+        conditions[i] = condition
+        for hazard in hazards_text.split(delim):
+            hazard = hazard.strip()
+            match = matcher.fullmatch(hazard)
+            if match:
+                flags[i] |= 1 << bits[match.lastindex - 1]
+            elif hazard and (unknown is not None):
+                unknown[hazard] = unknown.get(hazard, 0) + int(counts[i])
+
+    #Flags of each row as boolean columns
+    flags = flags[codes]
+    df_haz = pd.DataFrame({col: (flags >> bit) & 1 == 1 for bit, col in enumerate(cols)}, index = s.index)
+
+    return pd.Series(conditions[codes], index = s.index, name = s.name), df_haz
+
+
+def pivotmolten( pddf , index = 'ID', columns = 'Key', values = 'Value', dropna = True):
+
+    # =========================================================================
+    #     Function: pivotmolten( pddf , index = 'ID', columns = 'Key',
+    #                            values = 'Value', dropna = True)
+    #
+    #               pddf: Molten pandas dataframe
+    #               index: Column holding the record ID
+    #               columns: Column holding the field name
+    #               values: Column holding the field value
+    #               dropna: Skip rows with a missing index, column or value
+    #
+    #     Description:  The purpose of this function is to pivot the molten
+    #     [ID, Key, Value] table to wide format (one row per ID, one column
+    #     per Key) with as little memory as possible.
+    #
+    #     Argument/Return:  Returns the same dataframe as dropping duplicate
+    #     (index, column) rows and then calling pivot: index and columns are
+    #     sorted, missing values are NaN, and the first value of each
+    #     (index, column) pair is kept.
+    #
+    #     Details: ID and Key are encoded as integer codes (categorical
+    #     columns are used as they are), and each value is written straight
+    #     into one preallocated array that becomes the dataframe, without
+    #     building a MultiIndex or a deduplicated copy of the molten table.
+    # =========================================================================
+
+    #Rows to pivot
+    if dropna:
+        rows = np.flatnonzero(pddf[index].notna().to_numpy() & pddf[columns].notna().to_numpy() & pddf[values].notna().to_numpy())
+    else:
+        rows = np.flatnonzero(pddf[index].notna().to_numpy() & pddf[columns].notna().to_numpy())
+
+    #Encode ID and Key as sorted codes (of the rows kept)
+    codes = []
+    for col in [index, columns]:
+        if (pddf[col].dtype.name == 'category') and pddf[col].cat.categories.is_monotonic_increasing:
+            col_codes, uniques = pddf[col].cat.codes.to_numpy(), pddf[col].cat.categories
+        else:
+            col_codes, uniques = pd.factorize(pddf[col], sort = True)
+        col_codes = col_codes[rows]
+        used = np.flatnonzero(np.bincount(col_codes, minlength = len(uniques)))
+        remap = np.zeros(len(uniques), dtype = np.int64)
+        remap[used] = np.arange(len(used))
+        codes.append((remap[col_codes], pd.Index(np.asarray(uniques)[used], name = col)))
+    (id_codes, ids), (key_codes, keys) = codes
+
+    #Find the first row of each (Key, ID) cell
+    cells = key_codes
+    cells *= len(ids)
+    cells += id_codes
+    del id_codes, key_codes
+    first = np.full(len(keys)*len(ids), len(rows), dtype = np.int64)
+    np.minimum.at(first, cells, np.arange(len(rows)))
+    cells = np.flatnonzero(first < len(rows))
+    rows = rows[first[cells]]
+    del first
+
+    #Write values into one array (a column per key)
+    vals = pddf[values].to_numpy()
+    dtype = float if vals.dtype.kind in 'iufb' else object
+    wide = np.empty((len(keys), len(ids)), dtype = dtype)
+    wide.fill(np.nan)  #np.full would store a new float object per missing value
+    wide.reshape(-1)[cells] = vals[rows]
+
+    return pd.DataFrame(wide.T, index = ids, columns = keys, copy = False)
+
+def readshards( path , chunksize = None, **kwargs ):
+
+    # =========================================================================
+    #     Function: readshards( path , chunksize = None, **kwargs )
+    #
+    #               path: Directory of molten data shards (part-NNNNN.csv or
+    #                     part-NNNNN.parquet)
+    #               chunksize: Max rows per dataframe (whole shards if None)
+    #               kwargs: Extra arguments passed to pd.read_csv
+    #
+    #     Description:  Lazily read the molten data shards written by the
+    #     scrapers, one shard (or chunk of a shard) at a time.  A page that
+    #     was scraped again is in more than one shard, so each ID is only
+    #     kept from the newest shard it appears in.
+    #
+    #     Argument/Return:  Generator of [ID, Key, Value] dataframes, newest
+    #     shard first.  ID and Key are categorical for parquet shards.
+    #
+    #     Details: With a chunksize, parquet shards are read in record
+    #     batches (the scrapers write them in row groups) and csv shards in
+    #     chunks, so only chunksize rows of a shard are held at once.  The
+    #     IDs of each shard are gathered as its chunks are read and only
+    #     drop rows from the older shards after it.
+    # =========================================================================
+
+    #Find shards, newest first
+    names = [name for name in os.listdir(path) if name.startswith('part-') and name.endswith(('.csv', '.parquet'))]
+    names = sorted(names, reverse = True)
+
+    #Read each shard, dropping IDs already read from a newer shard
+    ids_read = set()
+    for name in names:
+        if name.endswith('.parquet'):
+            if (chunksize is None) or (pq is None):
+                chunks = [pd.read_parquet(os.path.join(path, name))]
+            else:
+                chunks = (batch.to_pandas() for batch in pq.ParquetFile(os.path.join(path, name)).iter_batches(batch_size = chunksize))
+        elif chunksize is None:
+            chunks = [pd.read_csv(os.path.join(path, name), encoding = "utf-8", dtype = {'ID': str}, **kwargs)]
+        else:
+            #Read values as text (a chunk could hold only numbers, unlike the whole shard)
+            chunks = pd.read_csv(os.path.join(path, name), encoding = "utf-8", chunksize = chunksize,
+                                 dtype = {'ID': str, 'Key': str, 'Value': str}, **kwargs)
+
+        ids_shard = set()
+        for df in chunks:
+            df = df[~df.ID.isin(ids_read)]
+            ids_shard.update(df.ID.unique())
+            yield df
+        ids_read.update(ids_shard)
+
+
+def readmolten( path , categorical = False, **kwargs ):
+
+    # =========================================================================
+    #     Function: readmolten( path , categorical = False, **kwargs )
+    #
+    #               path: Directory of molten data shards, or a single csv
+    #               categorical: Return ID and Key as categorical columns
+    #               kwargs: Extra arguments passed to pd.read_csv
+    #
+    #     Description:  Read the molten data table written by the scrapers.
+    #
+    #     Argument/Return:  Returns a single [ID, Key, Value] dataframe.  ID
+    #     and Key are object columns unless categorical = True.
+    # =========================================================================
+
+    if os.path.isdir(path):
+        df = pd.concat(readshards(path, **kwargs), ignore_index = True)
+    else:
+        df = pd.read_csv(path, encoding = "utf-8", **kwargs)
+
+    #Set ID/Key type (categories differ between shards, so set them after concatenating)
+    for col in ['ID', 'Key']:
+        if categorical:
+            df[col] = df[col].astype('category')
+        else:
+            df[col] = df[col].astype('object')
 
     return df
 
 
+def readpartitions( path , rows_max = 1000000, categorical = False, **kwargs ):
 
+    # =========================================================================
+    #     Function: readpartitions( path , rows_max = 1000000,
+    #                               categorical = False, **kwargs )
+    #
+    #               path: Directory of molten data shards, or a single csv
+    #               rows_max: Number of rows to gather before a partition is
+    #                         returned
+    #               categorical: Return ID and Key as categorical columns
+    #               kwargs: Extra arguments passed to pd.read_csv
+    #
+    #     Description:  Lazily read the molten data table in partitions that
+    #     keep all rows of an ID together, so each partition can be pivoted
+    #     and cleaned on its own.
+    #
+    #     Argument/Return:  Generator of [ID, Key, Value] dataframes of at
+    #     most rows_max rows (a partition is larger only if a single ID has
+    #     more rows).  ID and Key are object columns unless
+    #     categorical = True.
+    #
+    #     Details: Shards (and a csv) are read in chunks of rows_max rows
+    #     (see readshards).  Each partition is cut at rows_max rows, and the
+    #     rows of the ID at the cut are held back for the next partition,
+    #     since the scrapers write the rows of a page together but a chunk
+    #     can end part way through them.  IDs already returned are dropped
+    #     from later chunks (a page scraped again), so only the set of IDs
+    #     read is kept between partitions.
+    # =========================================================================
 
+    if os.path.isdir(path):
+        chunks = readshards(path, chunksize = rows_max, **kwargs)
+    else:
+        #Read values as text (a chunk could hold only numbers, unlike the whole table)
+        chunks = pd.read_csv(path, encoding = "utf-8", chunksize = rows_max,
+                             dtype = {'ID': str, 'Key': str, 'Value': str}, **kwargs)
+
+    ids_read = set()
+    buffer = []
+    rows = 0
+    dtype = 'category' if categorical else 'object'
+    for df in itertools.chain(chunks, [None]):
+        if df is not None:
+            buffer.append(df[~df.ID.isin(ids_read)])
+            rows += len(buffer[-1])
+
+        #Return partitions of rows_max rows while there are enough rows (and
+        #the rest once the table has ended)
+        while (rows >= rows_max) if (df is not None) else (rows > 0):
+            df_part = pd.concat(buffer, ignore_index = True)
+
+            if df is not None:
+                #Cut at rows_max rows, holding back the rows of the ID at the
+                #cut (the last ID if the rows end there, since its rows may
+                #continue in the next chunk)
+                ids = df_part.ID.to_numpy()
+                cut = min(rows_max, len(ids))
+                boundary = ids[cut] if cut < len(ids) else ids[cut - 1]
+                before = np.flatnonzero(ids[:cut] != boundary)
+                start = before[-1] + 1 if len(before) > 0 else 0
+
+                #A single ID of more than rows_max rows is returned whole once it ends
+                if start == 0:
+                    after = np.flatnonzero(ids != boundary)
+                    if len(after) == 0:
+                        buffer = [df_part]
+                        break
+                    start = after[0]
+
+                buffer = [df_part.iloc[start:]]
+                df_part = df_part.iloc[:start]
+            else:
+                buffer = []
+            rows = sum(len(df_buffer) for df_buffer in buffer)
+            ids_read.update(df_part.ID.unique())
 
+            #Set ID/Key type (categories differ between chunks, so set them after concatenating)
+            yield df_part.reset_index(drop = True).astype({'ID': dtype, 'Key': dtype})
 
 
+def scantypes( df , types = None, nuq_max = 25):
 
+    # =========================================================================
+    #     Function: scantypes( df , types = None, nuq_max = 25)
+    #
+    #               df: Pandas dataframe (the whole table, or one partition)
+    #               types: Column types found in earlier partitions
+    #               nuq_max: Maximum number of unique values of a
+    #                        categorical column
+    #
+    #     Description:  Find the data type of each column: numeric if every
+    #     value converts with pd.to_numeric, otherwise categorical if it is
+    #     a text column with at most nuq_max unique values.
+    #
+    #     Argument/Return:  Returns types, updated with the columns of df
+    #     ({col: {'numeric': dtype or False, 'levels': set or None}}).  Pass
+    #     it back in with the next partition, and to settypes once every
+    #     partition has been scanned.
+    #
+    #     Details: A column is numeric only if it converts in every
+    #     partition, with the dtype that holds all of them (int and float
+    #     partitions give float).  The unique values of text columns are
+    #     gathered across partitions, and dropped once there are more than
+    #     nuq_max of them.
+    # =========================================================================
+
+    if types is None:
+        types = {}
+
+    for col in df.columns:
+        s = df[col]
+        if col not in types:
+            types[col] = {'numeric': None, 'levels': set()}
+        col_types = types[col]
+
+        #Numeric type (the dtype pd.to_numeric gives, in every partition)
+        if col_types['numeric'] is not False:
+            try:
+                dtype = pd.to_numeric(s).dtype
+            except (ValueError, TypeError):
+                dtype = False
+            if (dtype is not False) and (col_types['numeric'] is not None):
+                dtype = np.result_type(col_types['numeric'], dtype)
+            col_types['numeric'] = dtype
+
+        #Levels of text columns
+        if col_types['levels'] is not None:
+            if s.dtype == 'object':
+                col_types['levels'].update(s.dropna().unique())
+            if (s.dtype != 'object') or (len(col_types['levels']) > nuq_max):
+                col_types['levels'] = None
+
+    return types
+
+
+def settypes( pddf , types , inplace = False):
+
+    # =========================================================================
+    #     Function: settypes( pddf , types , inplace = False)
+    #
+    #               pddf: Pandas dataframe
+    #               types: Column types found by scantypes
+    #               inplace: Update pddf instead of returning a copy
+    #
+    #     Description:  Convert numeric columns with pd.to_numeric and text
+    #     columns with few unique values to categorical, as found by
+    #     scantypes.
+    #
+    #     Argument/Return:  Returns the converted dataframe unless inplace.
+    #     Every partition gets the same dtypes and the same categories, so
+    #     partitions cleaned separately can be appended to one table.
+    # =========================================================================
+
+    if inplace:
+        df = pddf
+    else:
+        df = pddf.copy(deep = False)
+
+    for col, col_types in types.items():
+        if col not in df.columns:
+            continue
+        if col_types['numeric'] is not False:
+            df[col] = pd.to_numeric(df[col]).astype(col_types['numeric'])
+        elif col_types['levels'] is not None:
+            df[col] = df[col].astype(pd.CategoricalDtype(sorted(col_types['levels'])))
+
+    if not inplace:
+        return df
+
+    return
+
+
+def changedtypes( types_prev , types ):
+
+    # =========================================================================
+    #     Function: changedtypes( types_prev , types )
+    #
+    #               types_prev: Column types found by scantypes in an
+    #                           earlier run
+    #               types: The same types, updated with new data
+    #
+    #     Description:  Find the columns whose type the new data changed, so
+    #     a table typed with types_prev can no longer be converted to types
+    #     (a numeric column with text, a categorical column with too many
+    #     unique values, or a new column).
+    #
+    #     Argument/Return:  Returns the list of changed columns.  A numeric
+    #     dtype that widens (int to float) or a categorical column with new
+    #     levels is not a change, since settypes converts those.
+    # =========================================================================
+
+    cols = []
+    for col, col_types in types.items():
+        if col not in types_prev:
+            cols.append(col)
+        elif (types_prev[col]['numeric'] is not False) and (col_types['numeric'] is False):
+            cols.append(col)
+        elif (types_prev[col]['levels'] is not None) and (col_types['levels'] is None):
+            cols.append(col)
+
+    return cols
 
 
+def hashmolten( pddf , index = 'ID'):
 
+    # =========================================================================
+    #     Function: hashmolten( pddf , index = 'ID')
+    #
+    #               pddf: Molten pandas dataframe
+    #               index: Column holding the record ID
+    #
+    #     Description:  Hash the rows of each ID in the molten table, so a
+    #     later run can find the IDs that are new or have changed (see
+    #     changedids).
+    #
+    #     Argument/Return:  Returns a uint64 series of hashes indexed by ID.
+    #
+    #     Details: Each row's other columns are hashed with
+    #     pd.util.hash_pandas_object, and the row hashes of an ID are summed
+    #     (wrapping at 2^64), so the hash does not depend on the order the
+    #     rows were written in.  Categorical and object columns hash alike.
+    # =========================================================================
 
+    #Hash each row (without its ID)
+    cols = [col for col in pddf.columns if col != index]
+    rows = pd.util.hash_pandas_object(pddf[cols], index = False).to_numpy()
 
+    #Sum row hashes of each ID
+    codes, uniques = pd.factorize(pddf[index], sort = True)
+    keep = codes >= 0
+    codes, rows = codes[keep], rows[keep]
+    ids = pd.Index(np.asarray(uniques, dtype = object), name = index)
+    if len(codes) == 0:
+        return pd.Series(np.zeros(0, dtype = np.uint64), index = ids)
+    order = np.argsort(codes, kind = 'stable')
+    starts = np.flatnonzero(np.r_[True, np.diff(codes[order]) != 0])
 
+    return pd.Series(np.add.reduceat(rows[order], starts), index = ids)
 
 
+def changedids( hashes , hashes_prev ):
 
+    # =========================================================================
+    #     Function: changedids( hashes , hashes_prev )
+    #
+    #               hashes: Hashes of each ID from hashmolten
+    #               hashes_prev: Hashes of each ID from an earlier run
+    #
+    #     Description:  Find the IDs that are new or whose molten rows have
+    #     changed since the earlier run.
+    #
+    #     Argument/Return:  Returns an index of IDs.  IDs of the earlier run
+    #     that are no longer in the table are not included.
+    # =========================================================================
 
+    prev = hashes_prev.reindex(hashes.index, fill_value = 0).to_numpy()
+    changed = (hashes.to_numpy() != prev) | ~hashes.index.isin(hashes_prev.index)
 
+    return hashes.index[changed]
 
 
+def upsertrows( df_prev , df_new , index , ids = None):
 
+    # =========================================================================
+    #     Function: upsertrows( df_prev , df_new , index , ids = None)
+    #
+    #               df_prev: Pandas dataframe from an earlier run
+    #               df_new: Rows to insert or update (same columns)
+    #               index: Column holding the record ID
+    #               ids: IDs to replace (the IDs of df_new if None), so
+    #                    records cleaned out of df_new are removed
+    #
+    #     Description:  Replace the rows of df_prev whose ID is in ids,
+    #     and add the rows with new IDs.
+    #
+    #     Argument/Return:  Returns the combined dataframe sorted by ID.
+    #     Categorical columns take the categories of df_new (which should
+    #     include those of df_prev, see scantypes/settypes).
+    # =========================================================================
 
+    if ids is None:
+        ids = df_new[index]
 
+    df = pd.concat([df_prev[~df_prev[index].isin(ids)], df_new], ignore_index = True)
+    df = df.sort_values(index, kind = 'stable', ignore_index = True)
 
+    #Set categories (concatenating columns with other categories gives object columns)
+    for col in df_new.columns:
+        if (df_new[col].dtype.name == 'category') and (df[col].dtype != df_new[col].dtype):
+            df[col] = df[col].astype(df_new[col].dtype)
 
+    return df
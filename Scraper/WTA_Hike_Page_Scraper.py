@@ -14,229 +14,124 @@ script leverages a previously scraped list of hike URLs.
 #--------------------------------------------#
 
 #Import Packages/Functions
-import requests
 import pandas as pd
-from bs4 import BeautifulSoup
-from time import sleep
+import scrapepy
+import extractpy
+from functools import partial
 
 #Load the list of hike page URLs
 df = pd.read_csv("hike_urls.csv", encoding = "utf-8")
 hike_urls = df['URL'].values.tolist()
-headers = {'user-agent':'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/62.0.3202.94 Safari/537.36'}
 
-#Set time delay (seconds)
-delay = 3
+#Set politeness limits (starting and max requests per second, max requests in flight).
+#The rate adapts between them, backing off when the server throttles or slows down.
+rate = 1
+rate_max = 4
+concurrency = 8
 attempt_max = 10
 
+#Set refresh mode (revisit completed pages, skipping unchanged ones via ETag / Last-Modified)
+refresh = False
+
+#Set parser backend ('html.parser' or 'lxml') and only parse the wrapper subtree
+#(check parity with WTA_Parser_Parity.py after changing these)
+parser = 'lxml'
+strain = True
+
+#Set molten data output format ('csv' or 'parquet')
+output_format = 'parquet'
+
+#Set number of extraction processes (all cores if None)
+processes = None
+
+#Set replay mode (re-extract archived pages offline instead of scraping)
+replay = False
+
+#Set progress reporting (seconds between progress lines, metrics file)
+report_interval = 10
+metrics_path = 'hike_metrics.jsonl'
+
+#Create pooled keep-alive session
+session = scrapepy.ScrapeSession(pool_size = concurrency)
+
 #--------------------------------------------#
 #                  Scraper
 #--------------------------------------------#
 
-#Create list to append results
-hike_data = []
+#Open raw page archive
+archive = scrapepy.Archive('hike_archive.sqlite')
+
+#Open progress journal and skip pages completed by an earlier run (revisit all pages in refresh/replay mode)
+journal = scrapepy.Journal('hike_journal.sqlite')
+hike_done = journal.done()
+if not (refresh | replay):
+    hike_urls = [url for url in hike_urls if extractpy.hikeid(url) not in hike_done]
+
+#Open molten data output (rows are streamed to shards as pages are recorded)
+writer = scrapepy.ShardWriter('../Cleaning/hike_data_molten', journal, format = output_format)
+
+#Load validators of completed pages for conditional requests
+hike_validators = journal.validators()
+
+def hikeheaders(url):
+    return hike_validators.get(extractpy.hikeid(url))
+
+#Create counters for revalidation hits/misses
+hike_revalidated = {'hits': 0, 'misses': 0}
 
-#Start from middle of list to continue script after error
-#index_start = 3029
-#hike_urls = hike_urls[index_start:len(hike_urls)]
+#Define extraction (runs in the extraction processes)
+extract = partial(extractpy.extracthike, parser = parser, strain = strain)
 
-for index, url in enumerate(hike_urls):
+def scrapehike(index, url, req, hike_data):
 
     #Hike ID
-    hike_id = url.rpartition('/')[2]
-
-    #Print Status
-    print("\n")
-    print('Scraping %d of %d pages.........' % (index + 1, len(hike_urls)))
-    print('                  Current page:  %s' % (hike_id))
-    print('               Remaining pages:  %f' % (len(hike_urls) - (index+1)))
-    print('              Percent Complete:  %f' % ((index+1)/len(hike_urls)))
-    print('Estimated Time Remaining (hrs):  %f' % ((len(hike_urls) - (index+1))*delay*(1/3600)))
-
-    #Request HTLM from webpage
-    req = ''
-    attempt = 1
-    attempt_delay = 5
-    while req == '' and attempt <= attempt_max:
-        try:
-            req = requests.get(url, headers = headers)
-            break
-        except:
-            print("\n")
-            print("Connection Error. Trying again in 15 seconds...")
-            print("\n")
-            attempt = attempt + 1
-            sleep(attempt*attempt_delay)
-            continue
-    if attempt == attempt_max:
-        continue
-
-    #Create Soup
-    soup  = BeautifulSoup(req.text, 'html.parser')
-
-    if type(soup) is type(None):
-        continue
-
-    #Further refine soup to the hike wrapper division
-    try:
-        hike = soup.find('div', attrs = {'id': 'hike-wrapper'})
-    except:
-        print('    -Could not find hike wrapper')
-        continue
-
-    if type(hike) is type(None):
-        continue
-
-    #Hike Name
-    key = 'Name'
-    try:
-        target = hike.find('h1', attrs={'class': 'documentFirstHeading'})
-        val = target.text.strip()
-        hike_data.append([hike_id, key, val])
-    except:
-        print('    -Could not find attribute: %s' % (key))
-
-    #Region
-    key = 'Region'
-    try:
-        target = hike.find('div', attrs={'id': 'hike-region'})
-        target = target.find('span')
-        val = target.text.strip()
-        hike_data.append([hike_id, key, val])
-    except:
-        print('    -Could not find attribute: %s' % (key))
-
-    #Hike Stats (No ID)
-    hikestats = hike.find_all('div', attrs={'class':'hike-stat', 'id':''})
-    for hikestat in hikestats:
-        hikestat_vals = hikestat.find_all('div', attrs={'id':''})
-        for i, hikestat_val in enumerate(hikestat_vals):
-            try:
-                if len(hikestat_vals) == 1:
-                    hikestat_header = hikestat.find('h4', attrs={'id':''}).text.strip()
-                else:
-                    hikestat_header = hikestat.find('h4', attrs={'id':''}).text.strip() + '_' + str(i)
-                key = hikestat_header
-                val = hikestat_val.text.strip()
-                hike_data.append([hike_id, key, val])
-            except:
-                print('    -Could not find hike stats')
-
-    #Distance
-    key = 'Distance'
-    try:
-        target = hike.find('div', attrs={'id':'distance'})
-        val = target.span.text.strip()
-        hike_data.append([hike_id, key, val])
-    except:
-        print('    -Could not find attribute: %s' % (key))
-
-    #Current Rating
-    key = 'Rating'
-    try:
-        target = hike.find('div', attrs={'class':'current-rating'})
-        val = target.text.strip()
-        hike_data.append([hike_id, key, val])
-    except:
-        print('    -Could not find attribute: %s' % (key))
-
-    #Rating Count
-    key = 'Rating_Count'
-    try:
-        target = hike.find('div', attrs={'class':'rating-count'})
-        val = target.text.strip()
-        hike_data.append([hike_id, key, val])
-    except:
-        print('    -Could not find attribute: %s' % (key))
-
-    #Hike Features
-    try:
-        target = hike.find('div', attrs={'id':'hike-features'})
-        targets = target.find_all('div', attrs= {'class': ['feature alpha ', 'feature ']})
-        for feat in targets:
-            key = feat.get('data-title')
-            val = 'True'
-            hike_data.append([hike_id, key, val])
-    except:
-        print('    -Could not find hike features')
-
-    #Permits/Passes
-    key = 'Permits'
-    try:
-        target = hike.find('a', attrs={'title':'Learn more about the various types of recreation passes in Washington'})
-        val = target.text.strip()
-        hike_data.append([hike_id, key, val])
-    except:
-        print('    -Could not find attribute: %s' % (key))
-
-    #Alerts
-    key = 'Alerts'
-    try:
-        target = hike.find('div', attrs={'class':'alert orange'})
-        val = target.span.text.strip()
-        hike_data.append([hike_id, key, val])
-    except:
-        print('    -Could not find attribute: %s' % (key))
-
-    #Trip Report Count
-    key = 'Trip_Report_Cnt'
-    try:
-        target = hike.find('span', attrs={'class':'ReportCount'})
-        val = target.text.strip()
-        hike_data.append([hike_id, key, val])
-    except:
-        print('    -Could not find attribute: %s' % (key))
-
-    #Description
-    key = 'Description'
-    try:
-        target = hike.find('div', attrs={'id':'hike-body-text'})
-        val = target.text.strip()
-        hike_data.append([hike_id, key, val])
-    except:
-        print('    -Could not find attribute: %s' % (key))
-
-    #Driving Directions
-    key = 'Directions'
-    try:
-        target = hike.find('div', attrs={'id':'driving-directions'})
-        val = ''
-        targets = target.find_all('p')
-        for target in targets:
-            val = val + target.text.strip() + ' '
-        hike_data.append([hike_id, key, val])
-    except:
-        print('    -Could not find attribute: %s' % (key))
-
-    #GPS Coordinates
-    try:
-        target = hike.find('div', attrs={'class':'latlong'})
-        targets = target.find_all('span')
-        if len(targets) == 2:
-            key = 'Lat'
-            val = targets[0].text.strip()
-            hike_data.append([hike_id, key, val])
-
-            key = 'Long'
-            val = targets[1].text.strip()
-            hike_data.append([hike_id, key, val])
-    except:
-        print('    -Could not find attribute: GPS Coordinates')
-
-    #Trailhead
-    key = 'Trailhead'
-    try:
-        target = hike.find('div', attrs={'id':'trailhead-details'})
-        targets = target.find_all('p')
-        val = ''
-        for target in targets:
-            val = val + target.text.strip() + ' '
-        hike_data.append([hike_id, key, val])
-    except:
-        print('    -Could not find attribute: %s' % (key))
-
-    #Time delay before loading next page
-    sleep(delay)
-
-#Save data
-df = pd.DataFrame.from_records(hike_data, columns = ['ID', 'Key', 'Value'])
-df.to_csv("../Cleaning/hike_data_molten.csv", index = False, encoding = "utf-8")
+    hike_id = extractpy.hikeid(url)
+
+    #Reuse recorded rows if the page is unchanged (304 Not Modified)
+    if req.status_code == 304:
+        hike_revalidated['hits'] = hike_revalidated['hits'] + 1
+        return
+    if hike_id in hike_validators:
+        hike_revalidated['misses'] = hike_revalidated['misses'] + 1
+
+    #Archive raw page
+    archive.store(url, req)
+
+    #Record completed page (pages with nothing extracted are retried next run)
+    if len(hike_data) > 0:
+        journal.record(hike_id, url, hike_data, headers = req.headers)
+        writer.write(hike_id, hike_data)
+
+def replayhike(index, url, hike_data):
+
+    #Record re-extracted page
+    if len(hike_data) > 0:
+        journal.record(extractpy.hikeid(url), url, hike_data)
+        writer.write(extractpy.hikeid(url), hike_data)
+
+if replay:
+    print('Replaying %d archived pages.........' % (archive.count()))
+    telemetry = scrapepy.Telemetry(archive.count(), metrics_path, report_interval)
+    scrapepy.replaypages(archive, extract, replayhike, processes = processes, telemetry = telemetry)
+    telemetry.close()
+else:
+    print('Scraping %d pages.........' % (len(hike_urls)))
+    telemetry = scrapepy.Telemetry(len(hike_urls), metrics_path, report_interval)
+    scrapepy.scrapepages(hike_urls, extract, scrapehike,
+                         session = session,
+                         concurrency = concurrency,
+                         rate = rate,
+                         rate_max = rate_max,
+                         processes = processes,
+                         attempt_max = attempt_max,
+                         headers = hikeheaders,
+                         telemetry = telemetry)
+    telemetry.close()
+    session.report()
+    print('   Unchanged pages (304 hits):  %d' % (hike_revalidated['hits']))
+    print('   Changed pages (200 misses):  %d' % (hike_revalidated['misses']))
+
+#Finish the last shard (shards hold all pages recorded in the journal, including earlier runs)
+writer.close()
+journal.close()
+archive.close()
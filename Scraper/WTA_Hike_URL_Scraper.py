@@ -12,8 +12,8 @@ from the Washington Trails Association (WTA) webpage (www.wta.org/).
 #--------------------------------------------#
 
 #Import Packages/Functions
-import requests
 import pandas as pd
+import scrapepy
 from bs4 import BeautifulSoup
 from numpy import arange
 from time import sleep
@@ -22,6 +22,18 @@ from time import sleep
 #Create list to store extracted hike URLs
 hike_urls = []
 
+#Set discovery mode (find the last listing page, then fetch all pages concurrently,
+#overlapping neighbouring pages so hikes that shift down a page are not missed)
+discover = True
+
+#Set politeness limits for discovery (starting and max requests per second, max requests in flight)
+rate = 1
+rate_max = 4
+concurrency = 8
+
+#Create pooled keep-alive session
+session = scrapepy.ScrapeSession(pool_size = concurrency)
+
 #--------------------------------------------#
 #               Generate Page URLS
 #--------------------------------------------#
@@ -37,41 +49,56 @@ print("\n")
 print("Scraping Starting...  now!!!")
 print("\n")
 
-for p in list(range(len(url_pages))):
+def parsehikes(html):
+    #Hike URLs listed on a page
+    soup  = BeautifulSoup(html, 'html.parser')
+    return [hike['href'] for hike in soup.find_all('a' , attrs={'class': 'listitem-title'}, href=True)]
+
+if discover:
+    hike_urls = scrapepy.discoverpages(url_base, parsehikes, 30,
+                                       session = session,
+                                       concurrency = concurrency,
+                                       rate = rate,
+                                       rate_max = rate_max,
+                                       overlap = 3)
+    print("Scraped URLs:  :", len(hike_urls))
+else:
+    for p in list(range(len(url_pages))):
     
-    url = url_base + str(url_pages[p])
+        url = url_base + str(url_pages[p])
     
-    #--------------------------------------------#
-    #               Gather HIKE URLS
-    #--------------------------------------------#
+        #--------------------------------------------#
+        #               Gather HIKE URLS
+        #--------------------------------------------#
     
-    #Request HTLM from webpage
-    req = requests.get(url)
+        #Request HTLM from webpage
+        req = session.get(url)
     
-    #Create Soup
-    soup  = BeautifulSoup(req.text, 'html.parser')
+        #Create Soup
+        soup  = BeautifulSoup(req.text, 'html.parser')
     
-    #Search for all tags containing the hike objects
-    hikes = soup.find_all('a' , attrs={'class': 'listitem-title'}, href=True)
+        #Search for all tags containing the hike objects
+        hikes = soup.find_all('a' , attrs={'class': 'listitem-title'}, href=True)
     
-    #Check if page is empty
-    if len(hikes) == 0:
-        break
+        #Check if page is empty
+        if len(hikes) == 0:
+            break
     
-    #Extract hike URLs
-    for i in list(arange(0, len(hikes), 1)):
-        hike_urls.append(hikes[i]['href'])
-        #print(hike_urls[i])
+        #Extract hike URLs
+        for i in list(arange(0, len(hikes), 1)):
+            hike_urls.append(hikes[i]['href'])
+            #print(hike_urls[i])
     
-    #Print progress
-    print("Scraped URLs:  :", len(hike_urls))
+        #Print progress
+        print("Scraped URLs:  :", len(hike_urls))
  
-    #Wait 2 seconds before requesting next page
-    sleep(2)
+        #Wait 2 seconds before requesting next page
+        sleep(2)
 
 #Print Complete
 print("\n")
 print("Scraping Complete!!!")
+session.report()
 print("\n")
 
 #Save hike URLs to a csv file for the next phase of scraping
@@ -0,0 +1,436 @@
+# -*- coding: utf-8 -*-
+"""
+WTA Parser Parity Check
+Author: Joseph DeGregorio
+
+Description:  This python script checks that the page extraction gives the
+same molten rows as the original per-field extraction of the page scrapers
+(a full-page 'html.parser' soup searched once per field), both with the
+default parser and with a faster parser backend.  A fixture of synthetic
+hike and report pages is always checked, so the check runs without any
+archives, then every archived hike and report page is checked when the
+archives exist.  All extractions are timed, since parsing is the main CPU
+cost when replaying archived pages.
+
+"""
+#--------------------------------------------#
+#                  Setup
+#--------------------------------------------#
+
+#Import Packages/Functions
+import contextlib
+import io
+import os
+import sys
+import time
+from bs4 import BeautifulSoup
+import scrapepy
+import extractpy
+import standinpy
+
+#Set parser backend to check against the original
+parser = 'lxml'
+strain = True
+
+#Set max pages to check per archive (None checks all pages)
+page_max = None
+
+#Set synthetic fixture size (pages and bytes of boilerplate per page)
+fixture_hikes = 50
+fixture_reports = 200
+fixture_padding = 20000
+
+
+#--------------------------------------------#
+#            Original Extraction
+#--------------------------------------------#
+
+#Per-field extraction of the original page scrapers, kept as the reference.
+#The one deviation from the original code: hike features were matched with
+#the class strings 'feature alpha ' / 'feature ', which BeautifulSoup never
+#matches (it splits the trailing space off the page's class strings), so the
+#original extracted no features.  The reference matches them as extractpy
+#does, with the classes below.
+feature_classes = ['feature alpha', 'feature']
+
+def originalhike(url, html):
+
+    #Hike ID
+    hike_id = url.rpartition('/')[2]
+    hike_data = []
+
+    #Create Soup
+    soup  = BeautifulSoup(html, 'html.parser')
+
+    if type(soup) is type(None):
+        return hike_data
+
+    #Further refine soup to the hike wrapper division
+    try:
+        hike = soup.find('div', attrs = {'id': 'hike-wrapper'})
+    except:
+        print('    -Could not find hike wrapper')
+        return hike_data
+
+    if type(hike) is type(None):
+        return hike_data
+
+    #Hike Name
+    key = 'Name'
+    try:
+        target = hike.find('h1', attrs={'class': 'documentFirstHeading'})
+        val = target.text.strip()
+        hike_data.append([hike_id, key, val])
+    except:
+        print('    -Could not find attribute: %s' % (key))
+
+    #Region
+    key = 'Region'
+    try:
+        target = hike.find('div', attrs={'id': 'hike-region'})
+        target = target.find('span')
+        val = target.text.strip()
+        hike_data.append([hike_id, key, val])
+    except:
+        print('    -Could not find attribute: %s' % (key))
+
+    #Hike Stats (No ID)
+    hikestats = hike.find_all('div', attrs={'class':'hike-stat', 'id':''})
+    for hikestat in hikestats:
+        hikestat_vals = hikestat.find_all('div', attrs={'id':''})
+        for i, hikestat_val in enumerate(hikestat_vals):
+            try:
+                if len(hikestat_vals) == 1:
+                    hikestat_header = hikestat.find('h4', attrs={'id':''}).text.strip()
+                else:
+                    hikestat_header = hikestat.find('h4', attrs={'id':''}).text.strip() + '_' + str(i)
+                key = hikestat_header
+                val = hikestat_val.text.strip()
+                hike_data.append([hike_id, key, val])
+            except:
+                print('    -Could not find hike stats')
+
+    #Distance
+    key = 'Distance'
+    try:
+        target = hike.find('div', attrs={'id':'distance'})
+        val = target.span.text.strip()
+        hike_data.append([hike_id, key, val])
+    except:
+        print('    -Could not find attribute: %s' % (key))
+
+    #Current Rating
+    key = 'Rating'
+    try:
+        target = hike.find('div', attrs={'class':'current-rating'})
+        val = target.text.strip()
+        hike_data.append([hike_id, key, val])
+    except:
+        print('    -Could not find attribute: %s' % (key))
+
+    #Rating Count
+    key = 'Rating_Count'
+    try:
+        target = hike.find('div', attrs={'class':'rating-count'})
+        val = target.text.strip()
+        hike_data.append([hike_id, key, val])
+    except:
+        print('    -Could not find attribute: %s' % (key))
+
+    #Hike Features (see feature_classes)
+    try:
+        target = hike.find('div', attrs={'id':'hike-features'})
+        targets = target.find_all('div', attrs= {'class': feature_classes})
+        for feat in targets:
+            key = feat.get('data-title')
+            val = 'True'
+            hike_data.append([hike_id, key, val])
+    except:
+        print('    -Could not find hike features')
+
+    #Permits/Passes
+    key = 'Permits'
+    try:
+        target = hike.find('a', attrs={'title':'Learn more about the various types of recreation passes in Washington'})
+        val = target.text.strip()
+        hike_data.append([hike_id, key, val])
+    except:
+        print('    -Could not find attribute: %s' % (key))
+
+    #Alerts
+    key = 'Alerts'
+    try:
+        target = hike.find('div', attrs={'class':'alert orange'})
+        val = target.span.text.strip()
+        hike_data.append([hike_id, key, val])
+    except:
+        print('    -Could not find attribute: %s' % (key))
+
+    #Trip Report Count
+    key = 'Trip_Report_Cnt'
+    try:
+        target = hike.find('span', attrs={'class':'ReportCount'})
+        val = target.text.strip()
+        hike_data.append([hike_id, key, val])
+    except:
+        print('    -Could not find attribute: %s' % (key))
+
+    #Description
+    key = 'Description'
+    try:
+        target = hike.find('div', attrs={'id':'hike-body-text'})
+        val = target.text.strip()
+        hike_data.append([hike_id, key, val])
+    except:
+        print('    -Could not find attribute: %s' % (key))
+
+    #Driving Directions
+    key = 'Directions'
+    try:
+        target = hike.find('div', attrs={'id':'driving-directions'})
+        val = ''
+        targets = target.find_all('p')
+        for target in targets:
+            val = val + target.text.strip() + ' '
+        hike_data.append([hike_id, key, val])
+    except:
+        print('    -Could not find attribute: %s' % (key))
+
+    #GPS Coordinates
+    try:
+        target = hike.find('div', attrs={'class':'latlong'})
+        targets = target.find_all('span')
+        if len(targets) == 2:
+            key = 'Lat'
+            val = targets[0].text.strip()
+            hike_data.append([hike_id, key, val])
+
+            key = 'Long'
+            val = targets[1].text.strip()
+            hike_data.append([hike_id, key, val])
+    except:
+        print('    -Could not find attribute: GPS Coordinates')
+
+    #Trailhead
+    key = 'Trailhead'
+    try:
+        target = hike.find('div', attrs={'id':'trailhead-details'})
+        targets = target.find_all('p')
+        val = ''
+        for target in targets:
+            val = val + target.text.strip() + ' '
+        hike_data.append([hike_id, key, val])
+    except:
+        print('    -Could not find attribute: %s' % (key))
+
+    return hike_data
+
+def originalreport(url, html):
+
+    # Report ID
+    report_id = url.rpartition('trip_report.')[2]
+    report_data = []
+
+    # Create Soup
+    soup  = BeautifulSoup(html, 'html.parser')
+
+    if type(soup) is type(None):
+        return report_data
+
+    # Further refine soup to the report wrapper division
+    try:
+        report = soup.find('div', attrs = {'id': 'report-wrapper'})
+    except:
+        print('    -Could not find report wrapper')
+        return report_data
+
+    if type(report) is type(None):
+        return report_data
+
+    # ReportURL
+    key = 'Report_URL'
+    val = url
+    report_data.append([report_id, key, val])
+
+    # Hike ID (primary key to hike table)
+    key = 'HikeID'
+    try:
+        target = report.find('h1', attrs={'class': 'documentFirstHeading'}).a.get('href')
+        val = target.rpartition('/')[2]
+        report_data.append([report_id, key, val])
+    except:
+        print('    -Could not find attribute: %s' % (key))
+
+    # Author UserID
+    key = 'UserID'
+    try:
+        target = report.find('span', attrs={'itemprop':'author'}).a.get('href')
+        val = target.rpartition('/')[2]
+        report_data.append([report_id, key, val])
+    except:
+        print('    -Could not find attribute: %s' % (key))
+
+    # Author Name
+    key = 'Author'
+    try:
+        target = report.find('span', attrs={'itemprop':'author'}).a
+        val = target.text.strip()
+        report_data.append([report_id, key, val])
+    except:
+        print('    -Could not find attribute: %s' % (key))
+
+    # Report Date
+    key = 'ReportDate'
+    try:
+        target = report.find('span', attrs={'class':'elapsed-time'})
+        val = target.get('datetime')
+        report_data.append([report_id, key, val])
+    except:
+        print('    -Could not find attribute: %s' % (key))
+
+    # Trip Conditions
+    try:
+        conditions = report.find_all('div', attrs={'class':'trip-condition'})
+        for condition in conditions:
+            key = 'Cond_' + condition.h4.text.strip().replace(' ', '')
+            val = condition.span.text.strip()
+            report_data.append([report_id, key, val])
+    except:
+        print('    -Could not find trip conditions')
+
+    # Trip Features
+    try:
+        features = report.find('div', attrs={'id':'trip-features'}).find_all('div')
+        for feature in features:
+            key = 'Feat_' + feature.get('data-title').replace(' ', '')
+            val = 'True'
+            report_data.append([report_id, key, val])
+    except:
+        print('    -Could not find trip features')
+
+    # Trip Report Description
+    key = 'ReportBody'
+    try:
+        target = report.find('div', attrs={'id':'tripreport-body-text'})
+        val = target.text.strip()
+        report_data.append([report_id, key, val])
+    except:
+        print('    -Could not find attribute: %s' % (key))
+
+    # Trip Report Description
+    key = 'ImageCnt'
+    try:
+        target = report.find_all('div', attrs={'class':'captioned-image'})
+        val = len(target)
+        report_data.append([report_id, key, val])
+    except:
+        print('    -Could not find attribute: %s' % (key))
+
+    # Report Helpful Count
+    key = 'ReportHelpfulCnt'
+    try:
+        target = report.find('span', attrs={'class':'total-thumbs-up'})
+        val = target.text.strip()
+        report_data.append([report_id, key, val])
+    except:
+        print('    -Could not find attribute: %s' % (key))
+
+    return report_data
+
+
+#--------------------------------------------#
+#               Parity Check
+#--------------------------------------------#
+
+def checkpages(label, pages, extract, original):
+
+    #Check (url, html) pages against the original extraction, returning the
+    #number of pages that differ and the number of rows checked
+    page_count = 0
+    row_count = 0
+    page_mismatches = 0
+    times = {'original': 0, 'base': 0, 'new': 0}
+
+    for url, html in pages:
+
+        #Extract page each way (silence missing attribute messages)
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            rows_orig = original(url, html)
+            times['original'] = times['original'] + time.perf_counter() - start
+
+            start = time.perf_counter()
+            rows_base = extract(url, html)
+            times['base'] = times['base'] + time.perf_counter() - start
+
+            start = time.perf_counter()
+            rows_new = extract(url, html, parser = parser, strain = strain)
+            times['new'] = times['new'] + time.perf_counter() - start
+
+        #Report rows that differ from the original
+        if (rows_base != rows_orig) | (rows_new != rows_orig):
+            page_mismatches = page_mismatches + 1
+            print('\nMismatch:  %s' % (url))
+            for rows in [rows_base, rows_new]:
+                for row in rows_orig:
+                    if row not in rows:
+                        print('    - %s' % (row))
+                for row in rows:
+                    if row not in rows_orig:
+                        print('    + %s' % (row))
+
+        page_count = page_count + 1
+        row_count = row_count + len(rows_orig)
+        if (page_max is not None) and (page_count >= page_max):
+            break
+
+    #Print results
+    print("\n")
+    print('                        Pages:  %s' % (label))
+    print('                Pages checked:  %d' % (page_count))
+    print('                 Rows checked:  %d' % (row_count))
+    print('           Pages with changes:  %d' % (page_mismatches))
+    print('         original (ms / page):  %f' % (1000*times['original']/max(page_count, 1)))
+    print('      html.parser (ms / page):  %f' % (1000*times['base']/max(page_count, 1)))
+    print('%29s:  %f' % (parser + (' strained' if strain else '') + ' (ms / page)', 1000*times['new']/max(page_count, 1)))
+
+    return page_mismatches, row_count
+
+def archivedpages(archive):
+    #Latest archived version of each page
+    for url, encoding, codec, data in archive.latest():
+        yield url, scrapepy.decodepage(encoding, codec, data)
+
+mismatches = 0
+
+#Synthetic fixture (always checked, and must yield rows)
+pages, hikes, reports = standinpy.synthpages(fixture_hikes, fixture_reports, fixture_padding)
+fixtures = [('synthetic hikes', hikes, extractpy.extracthike, originalhike),
+            ('synthetic reports', [path for path, date in reports], extractpy.extractreport, originalreport)]
+
+for label, paths, extract, original in fixtures:
+    page_mismatches, row_count = checkpages(label, [('https://www.wta.org' + path, pages[path]) for path in paths],
+                                            extract, original)
+    if row_count == 0:
+        print('No rows extracted from the %s' % (label))
+        page_mismatches = page_mismatches + 1
+    mismatches = mismatches + page_mismatches
+
+#Archived pages
+checks = [('hike_archive.sqlite', extractpy.extracthike, originalhike),
+          ('report_archive.sqlite', extractpy.extractreport, originalreport)]
+
+for path, extract, original in checks:
+
+    if not os.path.exists(path):
+        print('\nSkipping %s (not found)' % (path))
+        continue
+
+    archive = scrapepy.Archive(path)
+    page_mismatches, row_count = checkpages(path, archivedpages(archive), extract, original)
+    archive.close()
+    mismatches = mismatches + page_mismatches
+
+#Exit with an error if any page changed
+if mismatches > 0:
+    sys.exit(1)
@@ -14,170 +14,102 @@ script leverages a previously scraped list of hike URLs.
 # -------------------------------------------- #
 
 # Import Packages/Functions
-import requests
 import pandas as pd
-from bs4 import BeautifulSoup
-from time import sleep
+import scrapepy
+import extractpy
+from functools import partial
 
 # Load the list of hike page URLs
 df = pd.read_csv("report_urls.csv", encoding = "utf-8")
 report_urls = df['URL'].values.tolist()
-headers = {'user-agent':'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/62.0.3202.94 Safari/537.36'}
 
-# Set time delay (seconds)
-delay = 3
+# Set politeness limits (starting and max requests per second, max requests in flight).
+# The rate adapts between them, backing off when the server throttles or slows down.
+rate = 1
+rate_max = 4
+concurrency = 8
 attempt_max = 10
 
+# Set parser backend ('html.parser' or 'lxml') and only parse the wrapper subtree
+# (check parity with WTA_Parser_Parity.py after changing these)
+parser = 'lxml'
+strain = True
+
+# Set molten data output format ('csv' or 'parquet')
+output_format = 'parquet'
+
+# Set number of extraction processes (all cores if None)
+processes = None
+
+# Set replay mode (re-extract archived pages offline instead of scraping)
+replay = False
+
+# Set progress reporting (seconds between progress lines, metrics file)
+report_interval = 10
+metrics_path = 'report_metrics.jsonl'
+
+# Create pooled keep-alive session
+session = scrapepy.ScrapeSession(pool_size = concurrency)
+
 # -------------------------------------------- #
 #                   Scraper
 # -------------------------------------------- #
 
-# Create list to append results
-report_data = []
+# Open raw page archive
+archive = scrapepy.Archive('report_archive.sqlite')
 
-# Start from middle of list to continue script after error
-#index_start = 70322
-#report_urls = report_urls[index_start:len(report_urls)]
+# Open progress journal and skip pages completed by an earlier run (re-extract all pages in replay mode)
+journal = scrapepy.Journal('report_journal.sqlite')
+report_done = journal.done()
+if not replay:
+    report_urls = [url for url in report_urls if extractpy.reportid(url) not in report_done]
 
-for index, url in enumerate(report_urls):
+# Open molten data output (rows are streamed to shards as pages are recorded)
+writer = scrapepy.ShardWriter('../Cleaning/report_data_molten', journal, format = output_format)
 
-    # Report ID
-    report_id = url.rpartition('trip_report.')[2]
-
-    # Print Status
-    print("\n")
-    print('Scraping %d of %d pages.........' % (index + 1, len(report_urls)))
-    print('                  Current page:  %s' % (report_id))
-    print('               Remaining pages:  %f' % (len(report_urls) - (index+1)))
-    print('              Percent Complete:  %f' % ((index+1)/len(report_urls)))
-    print('Estimated Time Remaining (hrs):  %f' % ((len(report_urls) - (index+1))*delay*(1/3600)))
-
-    # Request HTLM from webpage
-    req = ''
-    attempt = 1
-    attempt_delay = 5
-    while req == '' and attempt <= attempt_max:
-        try:
-            req = requests.get(url, headers = headers)
-            break
-        except:
-            print("\n")
-            print("Connection Error. Trying again in 15 seconds...")
-            print("\n")
-            attempt = attempt + 1
-            sleep(attempt*attempt_delay)
-            continue
-    if attempt == attempt_max:
-        continue
-
-    # Create Soup
-    soup  = BeautifulSoup(req.text, 'html.parser')
-
-    if type(soup) is type(None):
-        continue
-
-    # Further refine soup to the report wrapper division
-    try:
-        report = soup.find('div', attrs = {'id': 'report-wrapper'})
-    except:
-        print('    -Could not find report wrapper')
-        continue
-
-    if type(report) is type(None):
-        continue
-
-    # ReportURL
-    key = 'Report_URL'
-    val = url
-    report_data.append([report_id, key, val])
-
-    # Hike ID (primary key to hike table)
-    key = 'HikeID'
-    try:
-        target = report.find('h1', attrs={'class': 'documentFirstHeading'}).a.get('href')
-        val = target.rpartition('/')[2]
-        report_data.append([report_id, key, val])
-    except:
-        print('    -Could not find attribute: %s' % (key))
-
-    # Author UserID
-    key = 'UserID'
-    try:
-        target = report.find('span', attrs={'itemprop':'author'}).a.get('href')
-        val = target.rpartition('/')[2]
-        report_data.append([report_id, key, val])
-    except:
-        print('    -Could not find attribute: %s' % (key))
-
-    # Author Name
-    key = 'Author'
-    try:
-        target = report.find('span', attrs={'itemprop':'author'}).a
-        val = target.text.strip()
-        report_data.append([report_id, key, val])
-    except:
-        print('    -Could not find attribute: %s' % (key))
-
-    # Report Date
-    key = 'ReportDate'
-    try:
-        target = report.find('span', attrs={'class':'elapsed-time'})
-        val = target.get('datetime')
-        report_data.append([report_id, key, val])
-    except:
-        print('    -Could not find attribute: %s' % (key))
-
-    # Trip Conditions
-    try:
-        conditions = report.find_all('div', attrs={'class':'trip-condition'})
-        for condition in conditions:
-            key = 'Cond_' + condition.h4.text.strip().replace(' ', '')
-            val = condition.span.text.strip()
-            report_data.append([report_id, key, val])
-    except:
-        print('    -Could not find trip conditions')
-
-    # Trip Features
-    try:
-        features = report.find('div', attrs={'id':'trip-features'}).find_all('div')
-        for feature in features:
-            key = 'Feat_' + feature.get('data-title').replace(' ', '')
-            val = 'True'
-            report_data.append([report_id, key, val])
-    except:
-        print('    -Could not find trip features')
-
-    # Trip Report Description
-    key = 'ReportBody'
-    try:
-        target = report.find('div', attrs={'id':'tripreport-body-text'})
-        val = target.text.strip()
-        report_data.append([report_id, key, val])
-    except:
-        print('    -Could not find attribute: %s' % (key))
-
-    # Trip Report Description
-    key = 'ImageCnt'
-    try:
-        target = report.find_all('div', attrs={'class':'captioned-image'})
-        val = len(target)
-        report_data.append([report_id, key, val])
-    except:
-        print('    -Could not find attribute: %s' % (key))
-
-    # Report Helpful Count
-    key = 'ReportHelpfulCnt'
-    try:
-        target = report.find('span', attrs={'class':'total-thumbs-up'})
-        val = target.text.strip()
-        report_data.append([report_id, key, val])
-    except:
-        print('    -Could not find attribute: %s' % (key))
-
-    # Time delay before loading next page
-    sleep(delay)
-
-
-df = pd.DataFrame.from_records(report_data, columns = ['ID', 'Key', 'Value'])
-df.to_csv("../Cleaning/report_data_molten.csv", index = False, encoding = "utf-8")
+# Define extraction (runs in the extraction processes)
+extract = partial(extractpy.extractreport, parser = parser, strain = strain)
 
+def scrapereport(index, url, req, report_data):
+
+    # Report ID
+    report_id = extractpy.reportid(url)
+
+    # Archive raw page
+    archive.store(url, req)
+
+    # Record completed page (pages with nothing extracted are retried next run)
+    if len(report_data) > 0:
+        journal.record(report_id, url, report_data)
+        writer.write(report_id, report_data)
+
+def replayreport(index, url, report_data):
+
+    # Record re-extracted page
+    if len(report_data) > 0:
+        journal.record(extractpy.reportid(url), url, report_data)
+        writer.write(extractpy.reportid(url), report_data)
+
+if replay:
+    print('Replaying %d archived pages.........' % (archive.count()))
+    telemetry = scrapepy.Telemetry(archive.count(), metrics_path, report_interval)
+    scrapepy.replaypages(archive, extract, replayreport, processes = processes, telemetry = telemetry)
+    telemetry.close()
+else:
+    print('Scraping %d pages.........' % (len(report_urls)))
+    telemetry = scrapepy.Telemetry(len(report_urls), metrics_path, report_interval)
+    scrapepy.scrapepages(report_urls, extract, scrapereport,
+                         session = session,
+                         concurrency = concurrency,
+                         rate = rate,
+                         rate_max = rate_max,
+                         processes = processes,
+                         attempt_max = attempt_max,
+                         telemetry = telemetry)
+    telemetry.close()
+    session.report()
+
+# Finish the last shard (shards hold all pages recorded in the journal, including earlier runs)
+writer.close()
+journal.close()
+archive.close()
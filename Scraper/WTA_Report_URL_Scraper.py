@@ -12,8 +12,11 @@ from the Washington Trails Association (WTA) webpage (www.wta.org/).
 #--------------------------------------------#
 
 #Import Packages/Functions
-import requests
+import json
+import os
 import pandas as pd
+import scrapepy
+import extractpy
 from bs4 import BeautifulSoup
 from numpy import arange
 from time import sleep
@@ -21,62 +24,157 @@ from time import sleep
 
 #Create list to store extracted report URLs
 report_urls = []
-headers = {'user-agent':'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/62.0.3202.94 Safari/537.36'}
+
+#Set delta mode (only gather reports newer than the last run)
+delta = True
+
+#Set discovery mode for full runs (find the last listing page, then fetch all
+#pages concurrently).  Delta runs page through the listing until known reports.
+discover = True
+
+#Set politeness limits for discovery (starting and max requests per second, max requests in flight)
+rate = 1
+rate_max = 4
+concurrency = 8
+
+#Create pooled keep-alive session
+session = scrapepy.ScrapeSession(pool_size = concurrency)
+
+#Load URLs and newest report from the last run
+known_urls = []
+state = {'newest_id': None, 'newest_date': None}
+if delta and os.path.exists("report_urls.csv"):
+    known_urls = pd.read_csv("report_urls.csv", encoding = "utf-8")['URL'].values.tolist()
+if delta and os.path.exists("report_urls_state.json"):
+    with open("report_urls_state.json") as f:
+        state = json.load(f)
+known_set = set(known_urls)
 
 
 #--------------------------------------------#
 #               Generate Page URLS
 #--------------------------------------------#
 
+#Define page size (small pages when only a few new reports are expected)
+if len(known_urls) > 0:
+    page_size = 100
+else:
+    page_size = 1000
+
 #Define WTA start URL
-url_base = 'https://www.wta.org/@@search_tripreport_listing?b_size=1000&b_start:int='
+url_base = 'https://www.wta.org/@@search_tripreport_listing?b_size=%d&b_start:int=' % (page_size)
 
 #Define page increments
-url_pages = arange(0, 150000, 1000)
+url_pages = arange(0, 150000, page_size)
 
 #Print Start
 print("\n")
 print("Scraping Starting...  now!!!")
 print("\n")
 
-for p in list(range(len(url_pages))):
+def parsereports(html):
+    #Report URLs and dates listed on a page
+    soup  = BeautifulSoup(html, 'html.parser')
+    reports = []
+    for report in soup.find_all('div' , attrs={'class': 'item'}):
+        report_date = report.find('span', attrs={'class':'elapsed-time'})
+        if report_date is not None:
+            report_date = report_date.get('datetime')
+        reports.append((report.find('a', attrs={'class':'listitem-title'})['href'], report_date))
+    return reports
+
+if discover & (len(known_urls) == 0):
+    reports = scrapepy.discoverpages(url_base, parsereports, page_size,
+                                     session = session,
+                                     concurrency = concurrency,
+                                     rate = rate,
+                                     rate_max = rate_max,
+                                     overlap = page_size // 10,
+                                     key = lambda report: report[0])
+    report_urls = [report_url for report_url, report_date in reports]
+    if len(reports) > 0:
+        newest = {'newest_id': extractpy.reportid(reports[0][0]), 'newest_date': reports[0][1]}
+    print("Scraped URLs:  :", len(report_urls))
+else:
+    for p in list(range(len(url_pages))):
     
-    url = url_base + str(url_pages[p])
+        url = url_base + str(url_pages[p])
     
-    #--------------------------------------------#
-    #           Gather TRIP REPORT URLS
-    #--------------------------------------------#
+        #--------------------------------------------#
+        #           Gather TRIP REPORT URLS
+        #--------------------------------------------#
     
-    #Request HTLM from webpage
-    req = requests.get(url, headers = headers)
+        #Request HTLM from webpage (with retries), stopping rather than
+        #reading a failed page as the end of the listing
+        req = scrapepy.fetchpage(url, session = session)
+        if (req is None) or (req.status_code != 200):
+            raise RuntimeError('Could not fetch listing page: %s' % (url))
     
-    #Create Soup
-    soup  = BeautifulSoup(req.text, 'html.parser')
+        #Create Soup
+        soup  = BeautifulSoup(req.text, 'html.parser')
     
-    #Search for all tags containing the report objects
-    reports = soup.find_all('div' , attrs={'class': 'item'})
+        #Search for all tags containing the report objects
+        reports = soup.find_all('div' , attrs={'class': 'item'})
     
-    #Check if page is empty
-    if len(reports) == 0:
-        break
+        #Check if page is empty
+        if len(reports) == 0:
+            break
     
-    #Extract report URLs
-    for i in list(range(len(reports))):
+        #Extract report URLs
+        known_reached = False
+        page_old = 0
+        for i in list(range(len(reports))):
         
-        report_urls.append(reports[i].find('a', attrs={'class':'listitem-title'})['href'])
-        #print(report_urls[i])
+            report_url = reports[i].find('a', attrs={'class':'listitem-title'})['href']
+
+            #Find report date (if listed)
+            report_date = reports[i].find('span', attrs={'class':'elapsed-time'})
+            if report_date is not None:
+                report_date = report_date.get('datetime')
+
+            #Track newest report of this run
+            if (p == 0) & (i == 0):
+                newest = {'newest_id': extractpy.reportid(report_url), 'newest_date': report_date}
+
+            #Skip reports ingested by an earlier run
+            if (report_url in known_set) | (extractpy.reportid(report_url) == state['newest_id']):
+                known_reached = True
+                continue
+
+            #Count reports dated before the newest report of the last run
+            if (report_date is not None) & (state['newest_date'] is not None):
+                if report_date < state['newest_date']:
+                    page_old = page_old + 1
+
+            report_urls.append(report_url)
+            #print(report_urls[i])
     
-    #Print progress
-    print("Scraped URLs:  :", len(report_urls))
+        #Print progress
+        print("Scraped URLs:  :", len(report_urls))
+
+        #Stop paging once reports from the last run are reached
+        if known_reached | (page_old == len(reports)):
+            break
  
-    #Wait 2 seconds before requesting next page
-    sleep(2)
+        #Wait 2 seconds before requesting next page
+        sleep(2)
 
 #Print Complete
 print("\n")
 print("Scraping Complete!!!")
+print("New URLs:  :", len(report_urls))
+session.report()
 print("\n")
 
-#Save report URLs to a csv file for the next phase of scraping
+#Save new report URLs (the page scraper skips reports already in its journal)
 df = pd.DataFrame(report_urls, columns=['URL'])
+df.to_csv("report_urls_new.csv", index = False, encoding = "utf-8")
+
+#Save all report URLs (newest first) to a csv file for the next phase of scraping
+df = pd.DataFrame(report_urls + known_urls, columns=['URL'])
 df.to_csv("report_urls.csv", index = False, encoding = "utf-8")
+
+#Save newest report for the next delta run
+if len(report_urls) > 0:
+    with open("report_urls_state.json", 'w') as f:
+        json.dump(newest, f)
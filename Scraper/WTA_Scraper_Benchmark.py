@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+"""
+WTA Scraper Benchmark
+Author: Joseph DeGregorio
+
+Description:  This python script measures the throughput of the four
+scraper flows (hike URLs, report URLs, hike pages, report pages) against a
+local stand-in for the WTA webpage, so concurrency and parser changes can be
+tuned offline and throughput regressions caught.  Each scraper runs
+unchanged apart from its settings (replaced below) and the site address, in
+a scratch workspace, and its pages/sec, CPU per page and peak memory are
+reported and appended to a JSON lines results file.  A page flow that
+records no molten rows fails the benchmark.
+
+"""
+#--------------------------------------------#
+#                  Setup
+#--------------------------------------------#
+
+#Import Packages/Functions
+import json
+import os
+import re
+import resource
+import runpy
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+import standinpy
+
+#Set stand-in server behaviour (response time and spread in seconds, fraction
+#of 5xx responses, requests per second before 429s)
+latency = 0.05
+jitter = 0.02
+error_rate = 0.01
+rate_limit = 0
+
+#Set synthetic pages (used if the page archives do not exist)
+n_hikes = 600
+n_reports = 3000
+padding = 100000
+
+#Set scraper settings to run with (replaces the settings in each scraper)
+settings = {'rate': 50,
+            'rate_max': 200,
+            'concurrency': 16,
+            'report_interval': 5}
+
+#Set scraper flows to run (in order, since the page scrapers use the URL lists)
+flows = ['WTA_Hike_URL_Scraper.py',
+         'WTA_Report_URL_Scraper.py',
+         'WTA_Hike_Page_Scraper.py',
+         'WTA_Report_Page_Scraper.py']
+
+#Set output of the page flows (molten shard directory and journal, in the
+#scratch workspace), checked after each run so a flow that extracts nothing fails
+outputs = {'WTA_Hike_Page_Scraper.py': ('Cleaning/hike_data_molten', 'Scraper/hike_journal.sqlite'),
+           'WTA_Report_Page_Scraper.py': ('Cleaning/report_data_molten', 'Scraper/report_journal.sqlite')}
+
+#Set results file (one record per flow per run) and keep the scratch workspace
+results_path = 'scraper_benchmark.jsonl'
+keep_workspace = False
+
+#--------------------------------------------#
+#            Run Flow (subprocess)
+#--------------------------------------------#
+
+#Run a single scraper and print its CPU time and peak memory (one flow per
+#process, so memory is measured separately for each flow)
+if (len(sys.argv) == 3) and (sys.argv[1] == 'run'):
+    runpy.run_path(sys.argv[2], run_name = '__main__')
+
+    #CPU of the scraper and its (extraction) worker processes
+    usage_self = resource.getrusage(resource.RUSAGE_SELF)
+    usage_workers = resource.getrusage(resource.RUSAGE_CHILDREN)
+
+    #Peak RSS (VmHWM on linux, since ru_maxrss carries over the parent's peak through exec)
+    if os.path.exists('/proc/self/status'):
+        with open('/proc/self/status') as f:
+            rss = [int(line.split()[1])*1024 for line in f if line.startswith('VmHWM')][0]
+    else:
+        rss = usage_self.ru_maxrss
+
+    print(json.dumps({'cpu_secs': usage_self.ru_utime + usage_self.ru_stime + usage_workers.ru_utime + usage_workers.ru_stime,
+                      'peak_rss_mb': rss/2**20,
+                      'worker_peak_rss_mb': usage_workers.ru_maxrss*1024/2**20}))
+    sys.exit(0)
+
+def configure( source , settings , base_url ):
+    #Replace a scraper's settings (those it has) and point it at the stand-in
+    for name, value in settings.items():
+        source = re.sub(r'^%s = .*$' % (re.escape(name)), '%s = %r' % (name, value), source, count = 1, flags = re.M)
+    return source.replace('https://www.wta.org', base_url)
+
+#--------------------------------------------#
+#              Stand-in Server
+#--------------------------------------------#
+print('Building Pages...', end='')
+
+if os.path.exists('hike_archive.sqlite') and os.path.exists('report_archive.sqlite'):
+    pages, hikes, reports = standinpy.archivepages('hike_archive.sqlite', 'report_archive.sqlite')
+    source = 'archived'
+else:
+    pages, hikes, reports = standinpy.synthpages(n_hikes, n_reports, padding)
+    source = 'synthetic'
+
+server = standinpy.StandinServer(pages, hikes, reports,
+                                 latency = latency,
+                                 jitter = jitter,
+                                 error_rate = error_rate,
+                                 rate_limit = rate_limit)
+server.start()
+del pages
+
+print('Complete (%d hikes and %d reports, %s)' % (len(hikes), len(reports), source))
+
+#--------------------------------------------#
+#                 Benchmark
+#--------------------------------------------#
+
+#Create scratch workspace (the page scrapers write to ../Cleaning)
+workspace = tempfile.mkdtemp(prefix = 'wta_benchmark_')
+os.makedirs(os.path.join(workspace, 'Scraper'))
+os.makedirs(os.path.join(workspace, 'Cleaning'))
+
+results = []
+
+for flow in flows:
+
+    #Write configured copy of the scraper
+    with open(flow, encoding = 'utf-8') as f:
+        script = configure(f.read(), settings, server.base_url)
+    with open(os.path.join(workspace, 'Scraper', flow), 'w', encoding = 'utf-8') as f:
+        f.write(script)
+
+    #Run scraper (the copy imports the scraper utilities from this directory)
+    stats = server.stats.copy()
+    start = time.perf_counter()
+    out = subprocess.run([sys.executable, os.path.abspath(__file__), 'run', flow],
+                         cwd = os.path.join(workspace, 'Scraper'), capture_output = True, text = True)
+    seconds = time.perf_counter() - start
+
+    if out.returncode != 0:
+        print(out.stdout[-2000:])
+        print(out.stderr[-2000:])
+        raise RuntimeError('%s failed' % (flow))
+
+    with open(os.path.join(workspace, 'Scraper', flow.replace('.py', '.log')), 'w', encoding = 'utf-8') as f:
+        f.write(out.stdout)
+
+    #Responses served to this flow
+    served = server.stats - stats
+    pages = served[200] + served[304]
+    errors = sum(n for status, n in served.items() if status >= 500)
+
+    #Rows the flow recorded (page flows), and its molten shards
+    rows = None
+    if flow in outputs:
+        shard_dir, journal_path = [os.path.join(workspace, path) for path in outputs[flow]]
+        with sqlite3.connect(journal_path) as conn:
+            rows = conn.execute('SELECT COUNT(*) FROM rows').fetchone()[0]
+        shards = [name for name in os.listdir(shard_dir) if name.startswith('part-')] if os.path.isdir(shard_dir) else []
+        if (rows == 0) or (len(shards) == 0):
+            print(out.stdout[-2000:])
+            raise RuntimeError('%s recorded no rows (%d pages served, %d shards written)' % (flow, pages, len(shards)))
+
+    usage = json.loads(out.stdout.strip().splitlines()[-1])
+    result = dict(usage,
+                  flow = flow,
+                  time = time.time(),
+                  pages = pages,
+                  rows = rows,
+                  throttled = served[429],
+                  errors = errors,
+                  seconds = seconds,
+                  pages_per_sec = pages/seconds,
+                  rows_per_sec = None if rows is None else rows/seconds,
+                  cpu_ms_per_page = 1000*usage['cpu_secs']/max(pages, 1),
+                  settings = settings,
+                  server = {'latency': latency, 'jitter': jitter, 'error_rate': error_rate,
+                            'rate_limit': rate_limit, 'source': source})
+    results.append(result)
+
+    #Print results
+    print('\n%s' % (flow))
+    print('                 Pages served:  %d (%d throttled, %d errors)' % (pages, result['throttled'], errors))
+    print('              Run time (secs):  %f' % (seconds))
+    print('                  Pages / sec:  %f' % (result['pages_per_sec']))
+    if rows is not None:
+        print('                Rows recorded:  %d' % (rows))
+        print('                   Rows / sec:  %f' % (result['rows_per_sec']))
+    print('            CPU per page (ms):  %f' % (result['cpu_ms_per_page']))
+    print('        Peak scraper RSS (MB):  %f' % (result['peak_rss_mb']))
+    print('         Peak worker RSS (MB):  %f' % (result['worker_peak_rss_mb']))
+
+server.stop()
+
+#Append results for comparison with earlier runs
+with open(results_path, 'a') as f:
+    for result in results:
+        f.write(json.dumps(result) + '\n')
+
+if keep_workspace:
+    print('\nWorkspace:  %s' % (workspace))
+else:
+    shutil.rmtree(workspace)
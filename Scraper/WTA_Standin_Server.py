@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+"""
+WTA Stand-in Server
+Author: Joseph DeGregorio
+
+Description:  This python script serves a local stand-in for the WTA
+webpage (www.wta.org/) so the scrapers can be run and tuned offline.  Pages
+recorded in the page archives are served if they exist, otherwise synthetic
+pages are generated.  Point a scraper at the stand-in by replacing
+https://www.wta.org in its URLs with the address printed below.
+
+"""
+#--------------------------------------------#
+#                  Setup
+#--------------------------------------------#
+
+#Import Packages/Functions
+import os
+import standinpy
+
+#Set port to listen on
+port = 8750
+
+#Set server behaviour (response time and spread in seconds, fraction of 5xx
+#responses, requests per second before 429s)
+latency = 0.05
+jitter = 0.02
+error_rate = 0.01
+rate_limit = 20
+
+#Set synthetic pages (used if the page archives do not exist)
+n_hikes = 600
+n_reports = 3000
+padding = 100000
+
+#--------------------------------------------#
+#                  Server
+#--------------------------------------------#
+
+if os.path.exists('hike_archive.sqlite') and os.path.exists('report_archive.sqlite'):
+    pages, hikes, reports = standinpy.archivepages('hike_archive.sqlite', 'report_archive.sqlite')
+else:
+    pages, hikes, reports = standinpy.synthpages(n_hikes, n_reports, padding)
+
+server = standinpy.StandinServer(pages, hikes, reports,
+                                 port = port,
+                                 latency = latency,
+                                 jitter = jitter,
+                                 error_rate = error_rate,
+                                 rate_limit = rate_limit)
+
+print('Serving %d hikes and %d reports at %s (Ctrl+C to stop)' % (len(hikes), len(reports), server.base_url))
+try:
+    server.serve_forever()
+except KeyboardInterrupt:
+    pass
+server.server_close()
+print('Responses:  %s' % (dict(server.stats)))
@@ -0,0 +1,331 @@
+# -*- coding: utf-8 -*-
+"""
+WTA Page Extraction
+Author: Joseph DeGregorio
+
+Description:  Extraction logic for the hike and trip report pages.  Each
+function takes the URL and HTML text of a single page and returns the molten
+[ID, Key, Value] rows found on that page, so the same logic can be fed by
+any fetch loop or replayed over archived pages.  Pages can be parsed with
+the built-in 'html.parser' or the faster 'lxml' backend, optionally building
+only the wrapper division's subtree.
+
+The attributes of each page are declared in a field table (key, tag,
+attributes, value) which is compiled once, so all fields are collected in a
+single walk of the wrapper division rather than one search per field.
+
+"""
+import time
+from collections import namedtuple
+from bs4 import BeautifulSoup, SoupStrainer, Tag
+
+
+def makesoup( html , wrapper_id , parser = 'html.parser', strain = False):
+
+    # =========================================================================
+    #     Function: makesoup( html , wrapper_id , parser = 'html.parser',
+    #                         strain = False)
+    #
+    #               html: HTML text of the page
+    #               wrapper_id: ID of the wrapper division holding the data
+    #               parser: Parser backend ('html.parser' or 'lxml')
+    #               strain: Only build the wrapper division's subtree
+    #
+    #     Description:  Parse a page.  With strain = True the rest of the page
+    #     is tokenized but never built into the tree, which is where most of
+    #     the parse time goes.
+    # =========================================================================
+
+    if strain:
+        return BeautifulSoup(html, parser, parse_only = SoupStrainer('div', attrs = {'id': wrapper_id}))
+    return BeautifulSoup(html, parser)
+
+
+def hikeid( url ):
+    #Hike ID is the last part of the hike URL
+    return url.rpartition('/')[2]
+
+
+def reportid( url ):
+    #Report ID is the part of the report URL after "trip_report."
+    return url.rpartition('trip_report.')[2]
+
+
+#Field table entry
+#    key: Molten key (or a label for the missing field message when rows = True)
+#    name: Tag name
+#    attrs: Tag attributes, matched the same way as BeautifulSoup's find
+#    many: Collect all matching tags (find_all) instead of the first (find)
+#    value: Function of the matched tag(s) returning the value
+#    rows: value yields [key, value] pairs instead of a single value
+Field = namedtuple('Field', ['key', 'name', 'attrs', 'many', 'value', 'rows'])
+
+
+def compilefields( fields ):
+
+    # =========================================================================
+    #     Function: compilefields( fields )
+    #
+    #               fields: List of Field entries
+    #
+    #     Description:  Compile a field table into a lookup of tag name to
+    #     (field index, attributes) so each tag of the wrapper is only checked
+    #     against the fields with the same tag name.
+    #
+    #     Argument/Return:  Returns (fields, lookup).
+    # =========================================================================
+
+    lookup = {}
+    for i, field in enumerate(fields):
+        attrs = []
+        for attr, values in field.attrs.items():
+            if isinstance(values, str):
+                values = [values]
+            attrs.append((attr, frozenset(values)))
+        lookup.setdefault(field.name, []).append((i, tuple(attrs)))
+    return (fields, lookup)
+
+
+def matchattrs( tag , attrs ):
+    #Multi-valued attributes (class) match on any single value or the whole string
+    for attr, values in attrs:
+        value = tag.get(attr)
+        if value is None:
+            return False
+        if isinstance(value, list):
+            if values.isdisjoint(value) and (' '.join(value) not in values):
+                return False
+        elif value not in values:
+            return False
+    return True
+
+
+def extractfields( page_id , wrapper , spec , missing = None):
+
+    # =========================================================================
+    #     Function: extractfields( page_id , wrapper , spec , missing = None)
+    #
+    #               page_id: ID of the page
+    #               wrapper: Wrapper division holding the data
+    #               spec: Compiled field table (see compilefields)
+    #               missing: List to append the keys of missing fields to,
+    #                        or None to print a message for each
+    #
+    #     Description:  Walk the wrapper division once, collecting the first
+    #     (or every) tag matching each field, then evaluate the fields in
+    #     table order.  A field that is missing or fails to evaluate is
+    #     skipped, and recorded in missing (or printed, as with a search per
+    #     field).
+    #
+    #     Argument/Return:  Returns a list of [ID, Key, Value] rows.
+    # =========================================================================
+
+    fields, lookup = spec
+
+    #Collect matching tags
+    found = [[] if field.many else None for field in fields]
+    for tag in wrapper.descendants:
+        if not isinstance(tag, Tag):
+            continue
+        for i, attrs in lookup.get(tag.name, ()):
+            if fields[i].many:
+                if matchattrs(tag, attrs):
+                    found[i].append(tag)
+            elif (found[i] is None) and matchattrs(tag, attrs):
+                found[i] = tag
+
+    #Evaluate fields
+    data = []
+    for field, target in zip(fields, found):
+        try:
+            if target is None:
+                raise AttributeError(field.key)
+            if field.rows:
+                for key, val in field.value(target):
+                    data.append([page_id, key, val])
+            else:
+                data.append([page_id, field.key, field.value(target)])
+        except Exception:
+            if missing is not None:
+                missing.append(field.key)
+            elif field.rows:
+                print('    -Could not find %s' % (field.key))
+            else:
+                print('    -Could not find attribute: %s' % (field.key))
+
+    return data
+
+
+def text( target ):
+    return target.text.strip()
+
+
+def paragraphs( target ):
+    #Paragraphs joined with trailing spaces
+    val = ''
+    for p in target.find_all('p'):
+        val = val + p.text.strip() + ' '
+    return val
+
+
+def hrefid( target ):
+    #Last part of the first link's URL
+    return target.a.get('href').rpartition('/')[2]
+
+
+def hikestats( hikestats ):
+    #Hike Stats (No ID), numbered if a stat has more than one value.  Stats
+    #without a header are skipped, and reported once the others are yielded.
+    failed = False
+    for hikestat in hikestats:
+        hikestat_vals = hikestat.find_all('div', attrs={'id':''})
+        for i, hikestat_val in enumerate(hikestat_vals):
+            try:
+                hikestat_header = hikestat.find('h4', attrs={'id':''}).text.strip()
+                if len(hikestat_vals) > 1:
+                    hikestat_header = hikestat_header + '_' + str(i)
+                yield hikestat_header, hikestat_val.text.strip()
+            except Exception:
+                failed = True
+    if failed:
+        raise AttributeError('hike stats')
+
+
+def hikefeatures( target ):
+    #The page's class strings ('feature alpha ', 'feature ') end in a space,
+    #which BeautifulSoup splits off, so match them without it
+    for feat in target.find_all('div', attrs= {'class': ['feature alpha', 'feature']}):
+        yield feat.get('data-title'), 'True'
+
+
+def latlong( target ):
+    targets = target.find_all('span')
+    if len(targets) == 2:
+        yield 'Lat', targets[0].text.strip()
+        yield 'Long', targets[1].text.strip()
+
+
+def tripconditions( conditions ):
+    for condition in conditions:
+        yield 'Cond_' + condition.h4.text.strip().replace(' ', ''), condition.span.text.strip()
+
+
+def tripfeatures( target ):
+    for feature in target.find_all('div'):
+        yield 'Feat_' + feature.get('data-title').replace(' ', ''), 'True'
+
+
+#Hike page fields (in molten row order)
+HIKE_FIELDS = compilefields([
+    Field('Name', 'h1', {'class': 'documentFirstHeading'}, False, text, False),
+    Field('Region', 'div', {'id': 'hike-region'}, False, lambda t: t.find('span').text.strip(), False),
+    Field('hike stats', 'div', {'class': 'hike-stat', 'id': ''}, True, hikestats, True),
+    Field('Distance', 'div', {'id': 'distance'}, False, lambda t: t.span.text.strip(), False),
+    Field('Rating', 'div', {'class': 'current-rating'}, False, text, False),
+    Field('Rating_Count', 'div', {'class': 'rating-count'}, False, text, False),
+    Field('hike features', 'div', {'id': 'hike-features'}, False, hikefeatures, True),
+    Field('Permits', 'a', {'title': 'Learn more about the various types of recreation passes in Washington'}, False, text, False),
+    Field('Alerts', 'div', {'class': 'alert orange'}, False, lambda t: t.span.text.strip(), False),
+    Field('Trip_Report_Cnt', 'span', {'class': 'ReportCount'}, False, text, False),
+    Field('Description', 'div', {'id': 'hike-body-text'}, False, text, False),
+    Field('Directions', 'div', {'id': 'driving-directions'}, False, paragraphs, False),
+    Field('GPS Coordinates', 'div', {'class': 'latlong'}, False, latlong, True),
+    Field('Trailhead', 'div', {'id': 'trailhead-details'}, False, paragraphs, False),
+])
+
+#Trip report page fields (in molten row order, after Report_URL)
+REPORT_FIELDS = compilefields([
+    Field('HikeID', 'h1', {'class': 'documentFirstHeading'}, False, hrefid, False),
+    Field('UserID', 'span', {'itemprop': 'author'}, False, hrefid, False),
+    Field('Author', 'span', {'itemprop': 'author'}, False, lambda t: t.a.text.strip(), False),
+    Field('ReportDate', 'span', {'class': 'elapsed-time'}, False, lambda t: t.get('datetime'), False),
+    Field('trip conditions', 'div', {'class': 'trip-condition'}, True, tripconditions, True),
+    Field('trip features', 'div', {'id': 'trip-features'}, False, tripfeatures, True),
+    Field('ReportBody', 'div', {'id': 'tripreport-body-text'}, False, text, False),
+    Field('ImageCnt', 'div', {'class': 'captioned-image'}, True, len, False),
+    Field('ReportHelpfulCnt', 'span', {'class': 'total-thumbs-up'}, False, text, False),
+])
+
+
+def extracthike( url , html , parser = 'html.parser', strain = False, timings = None,
+                 missing = None):
+
+    # =========================================================================
+    #     Function: extracthike( url , html , parser = 'html.parser',
+    #                            strain = False, timings = None,
+    #                            missing = None)
+    #
+    #               url: Hike page URL
+    #               html: HTML text of the hike page
+    #               parser: Parser backend (see makesoup)
+    #               strain: Only parse the hike wrapper subtree
+    #               timings: Dictionary to fill in with the 'parse' and
+    #                        'extract' seconds, or None
+    #               missing: List to append the keys of missing fields to,
+    #                        or None to print them (see extractfields)
+    #
+    #     Description:  Extract all hike attributes (HIKE_FIELDS) from the
+    #     hike wrapper division of a hike page.
+    #
+    #     Argument/Return:  Returns a list of [ID, Key, Value] rows.  An empty
+    #     list is returned if the hike wrapper could not be found.
+    # =========================================================================
+
+    #Create Soup and refine it to the hike wrapper division
+    start = time.perf_counter()
+    soup  = makesoup(html, 'hike-wrapper', parser, strain)
+    hike = None if soup is None else soup.find('div', attrs = {'id': 'hike-wrapper'})
+    parsed = time.perf_counter()
+
+    hike_data = [] if hike is None else extractfields(hikeid(url), hike, HIKE_FIELDS, missing)
+
+    if timings is not None:
+        timings['parse'] = parsed - start
+        timings['extract'] = time.perf_counter() - parsed
+
+    return hike_data
+
+
+def extractreport( url , html , parser = 'html.parser', strain = False, timings = None,
+                   missing = None):
+
+    # =========================================================================
+    #     Function: extractreport( url , html , parser = 'html.parser',
+    #                              strain = False, timings = None,
+    #                              missing = None)
+    #
+    #               url: Report page URL
+    #               html: HTML text of the report page
+    #               parser: Parser backend (see makesoup)
+    #               strain: Only parse the report wrapper subtree
+    #               timings: Dictionary to fill in with the 'parse' and
+    #                        'extract' seconds, or None
+    #               missing: List to append the keys of missing fields to,
+    #                        or None to print them (see extractfields)
+    #
+    #     Description:  Extract all trip report attributes (REPORT_FIELDS)
+    #     from the report wrapper division of a trip report page.
+    #
+    #     Argument/Return:  Returns a list of [ID, Key, Value] rows.  An empty
+    #     list is returned if the report wrapper could not be found.
+    # =========================================================================
+
+    # Report ID
+    report_id = reportid(url)
+
+    # Create Soup and refine it to the report wrapper division
+    start = time.perf_counter()
+    soup  = makesoup(html, 'report-wrapper', parser, strain)
+    report = None if soup is None else soup.find('div', attrs = {'id': 'report-wrapper'})
+    parsed = time.perf_counter()
+
+    # Report URL first, then the report fields
+    report_data = []
+    if report is not None:
+        report_data = [[report_id, 'Report_URL', url]] + extractfields(report_id, report, REPORT_FIELDS, missing)
+
+    if timings is not None:
+        timings['parse'] = parsed - start
+        timings['extract'] = time.perf_counter() - parsed
+
+    return report_data
@@ -0,0 +1,1143 @@
+# -*- coding: utf-8 -*-
+"""
+WTA Scraper Utilities
+Author: Joseph DeGregorio
+
+Description:  Shared fetch utilities for the WTA scrapers.  All scrapers
+share one pooled keep-alive session type, which sets the default headers and
+tracks transfer/handshake counts.  The fetch engine keeps several requests
+in flight at once while holding the whole scrape to a global
+requests-per-second budget, and runs a staged pipeline that extracts the
+pages in a process pool.  The page scrapers record each completed page in a
+SQLite journal so an interrupted scrape resumes where it stopped, stream
+the extracted rows to size-bounded output shards while the scrape runs, and
+keep every fetched page in a compressed archive so extraction can be
+replayed offline.  Progress is kept in a Telemetry object (stage timers,
+rates, errors) that prints a periodic progress line and writes a JSON lines
+metrics file, rather than printing a status block per page.
+
+"""
+import asyncio
+import collections
+import csv
+import datetime
+import email.utils
+import hashlib
+import json
+import multiprocessing
+import os
+import random
+import sqlite3
+import threading
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
+from functools import partial
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.utils import DEFAULT_ACCEPT_ENCODING
+
+#Use zstd for the page archive if available (zlib otherwise)
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+#Use pyarrow for parquet output shards if available
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+#Responses that are retried (rate limited or server errors)
+RETRY_STATUS = (429, 500, 502, 503, 504)
+
+#Max delay (seconds) between attempts and max Retry-After wait honoured
+ATTEMPT_DELAY_MAX = 120
+RETRY_AFTER_MAX = 300
+
+#Molten data schema for parquet shards
+if pa is not None:
+    MOLTEN_SCHEMA = pa.schema([('ID', pa.dictionary(pa.int32(), pa.string())),
+                               ('Key', pa.dictionary(pa.int32(), pa.string())),
+                               ('Value', pa.large_string())])
+
+
+class CountingAdapter(HTTPAdapter):
+
+    # =========================================================================
+    #     Class: CountingAdapter( pool_size )
+    #
+    #     Description:  Pooled HTTP adapter that counts every socket connect
+    #     (i.e. every TCP+TLS handshake), including reconnects of keep-alive
+    #     connections dropped by the server.
+    # =========================================================================
+
+    def __init__(self, pool_size):
+        self.lock = threading.Lock()
+        self.handshakes = 0
+        super().__init__(pool_connections = pool_size, pool_maxsize = pool_size)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+
+        #Swap in pool classes whose connections report each connect
+        adapter = self
+        pool_classes = {}
+        for scheme, pool_cls in self.poolmanager.pool_classes_by_scheme.items():
+
+            class CountingConnection(pool_cls.ConnectionCls):
+                def connect(self):
+                    with adapter.lock:
+                        adapter.handshakes = adapter.handshakes + 1
+                    super().connect()
+
+            pool_classes[scheme] = type(pool_cls.__name__, (pool_cls,), {'ConnectionCls': CountingConnection})
+
+        self.poolmanager.pool_classes_by_scheme = pool_classes
+
+
+#Default request headers for every scraper
+HEADERS = {'user-agent':'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/62.0.3202.94 Safari/537.36',
+           'accept-encoding': DEFAULT_ACCEPT_ENCODING}
+
+
+class ScrapeSession(requests.Session):
+
+    # =========================================================================
+    #     Class: ScrapeSession( pool_size = 10, headers = None)
+    #
+    #               pool_size: Max keep-alive connections kept per host
+    #                          (set >= the number of requests in flight)
+    #               headers: Headers to add to/override the defaults
+    #
+    #     Description:  Requests session with connection pooling, keep-alive
+    #     and compressed transfer (gzip/deflate, plus brotli when the brotli
+    #     package is installed).  Every request made through the session is
+    #     measured so the transfer savings can be reported.
+    # =========================================================================
+
+    def __init__(self, pool_size = 10, headers = None):
+        super().__init__()
+
+        #Mount pooled adapters (retries are handled by the fetch engine)
+        self.adapter = CountingAdapter(pool_size)
+        self.mount('https://', self.adapter)
+        self.mount('http://', self.adapter)
+
+        #Set default headers
+        self.headers.update(HEADERS)
+        if headers is not None:
+            self.headers.update(headers)
+
+        #Set initial stats
+        self.lock = threading.Lock()
+        self.pages = 0
+        self.bytes_wire = 0
+        self.bytes_body = 0
+        self.retries = 0
+        self.throttled = 0
+        self.rate = None
+
+    def request(self, *args, **kwargs):
+        req = super().request(*args, **kwargs)
+
+        #Record bytes over the wire (compressed) and decoded body bytes
+        if not kwargs.get('stream'):
+            with self.lock:
+                self.pages = self.pages + 1
+                self.bytes_wire = self.bytes_wire + req.raw.tell()
+                self.bytes_body = self.bytes_body + len(req.content)
+
+        return req
+
+    def report(self):
+        #Print transfer summary
+        pages = max(self.pages, 1)
+        print("\n")
+        print('                Pages fetched:  %d' % (self.pages))
+        print('            Bytes transferred:  %d (%d per page)' % (self.bytes_wire, self.bytes_wire/pages))
+        print('           Bytes decompressed:  %d (%d per page)' % (self.bytes_body, self.bytes_body/pages))
+        print('            Compression ratio:  %f' % (self.bytes_body/max(self.bytes_wire, 1)))
+        print('           Connections opened:  %d (%f pages per connection)' % (self.adapter.handshakes, self.pages/max(self.adapter.handshakes, 1)))
+        print('                      Retries:  %d' % (self.retries))
+        print('Throttled responses (429/503):  %d' % (self.throttled))
+        if self.rate:
+            print('  Final rate (requests / sec):  %f' % (self.rate))
+
+
+class Telemetry:
+
+    # =========================================================================
+    #     Class: Telemetry( total = None, path = None, interval = 10,
+    #                       window = 60)
+    #
+    #               total: Number of pages expected (for the ETA)
+    #               path: JSON lines file to append metrics records to
+    #               interval: Seconds between progress reports
+    #               window: Seconds of completed pages used for the rolling
+    #                       rate
+    #
+    #     Description:  Scrape metrics in place of per-page status prints.
+    #     The fetch engine records per-stage timers (fetch, parse, extract,
+    #     write), bytes received, errors by type (including page fields that
+    #     could not be found) and completed pages.  At
+    #     most every interval seconds one compact progress line is printed,
+    #     with the rolling pages/sec and an ETA from that observed rate, and
+    #     the full metrics are appended to the JSON lines file.
+    # =========================================================================
+
+    def __init__(self, total = None, path = None, interval = 10, window = 60):
+        self.total = total
+        self.interval = interval
+        self.window = window
+        self.start = time.monotonic()
+        self.reported = self.start
+        self.pages = 0
+        self.bytes_in = 0
+        self.stages = {}
+        self.errors = collections.Counter()
+        self.gauges = {}
+        self.recent = collections.deque()
+        self.file = open(path, 'a') if path else None
+
+    def time(self, stage, seconds):
+        #Add a stage timing (count, total seconds, max seconds)
+        count, total, longest = self.stages.get(stage, (0, 0, 0))
+        self.stages[stage] = (count + 1, total + seconds, max(longest, seconds))
+
+    def page(self):
+        #Count a completed page
+        now = time.monotonic()
+        self.pages = self.pages + 1
+        self.recent.append(now)
+        self.tick(now)
+
+    def error(self, kind):
+        self.errors[kind] = self.errors[kind] + 1
+        self.tick()
+
+    def rate(self, now = None):
+        #Rolling pages per second over the window
+        now = now or time.monotonic()
+        while self.recent and (self.recent[0] < now - self.window):
+            self.recent.popleft()
+        return len(self.recent)/max(min(self.window, now - self.start), 1e-9)
+
+    def metrics(self):
+        now = time.monotonic()
+        rate = self.rate(now)
+        eta = None
+        if (self.total is not None) and (rate > 0):
+            eta = max(self.total - self.pages, 0)/rate
+        return {'time': time.time(),
+                'elapsed': now - self.start,
+                'pages': self.pages,
+                'total': self.total,
+                'pages_per_sec': rate,
+                'eta_secs': eta,
+                'bytes_in': self.bytes_in,
+                'stages': {stage: {'count': count, 'seconds': total, 'max_seconds': longest}
+                           for stage, (count, total, longest) in self.stages.items()},
+                'errors': dict(self.errors),
+                'gauges': dict(self.gauges)}
+
+    def tick(self, now = None):
+        #Report if the interval has passed
+        if (now or time.monotonic()) - self.reported >= self.interval:
+            self.report()
+
+    def report(self):
+        #Print a progress line and append a metrics record
+        self.reported = time.monotonic()
+        m = self.metrics()
+
+        line = '[%d' % (m['pages'])
+        if m['total']:
+            line = line + '/%d %.1f%%' % (m['total'], 100*m['pages']/max(m['total'], 1))
+        line = line + '] %.2f pages/s' % (m['pages_per_sec'])
+        if m['eta_secs'] is not None:
+            line = line + ' | ETA %s' % (datetime.timedelta(seconds = round(m['eta_secs'])))
+        for stage, s in m['stages'].items():
+            line = line + ' | %s %.0fms' % (stage, 1000*s['seconds']/s['count'])
+        line = line + ' | in %.1fMB' % (m['bytes_in']/2**20)
+        for gauge, value in m['gauges'].items():
+            line = line + ' | %s %.2f' % (gauge, value)
+        if m['errors']:
+            line = line + ' | errors ' + ', '.join('%s: %d' % (kind, n) for kind, n in m['errors'].items())
+        print(line)
+
+        if self.file is not None:
+            self.file.write(json.dumps(m) + '\n')
+            self.file.flush()
+
+    def close(self):
+        self.report()
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+class RateLimiter:
+
+    # =========================================================================
+    #     Class: RateLimiter( rate , rate_max = None, latency_factor = 2)
+    #
+    #               rate: Starting max requests per second across all workers
+    #                     (0 for no limit)
+    #               rate_max: Ceiling for the adaptive rate (fixed rate if
+    #                         None)
+    #               latency_factor: Back off when the average response time
+    #                               rises above this multiple of the fastest
+    #                               average seen
+    #
+    #     Description:  Spaces request starts 1/rate seconds apart.  Each
+    #     worker sleeps until the next free start time and takes it, so the
+    #     budget holds no matter how many requests are in flight.  With
+    #     rate_max set the rate adapts (AIMD): healthy responses raise the
+    #     rate steadily (by a twentieth of rate_max per second) up to
+    #     rate_max, and a 429/503, connection error or rising latency halves
+    #     it.  Only requests started after the last cut can cut the rate
+    #     again, since the ones already in flight were sent at the old rate.
+    # =========================================================================
+
+    def __init__(self, rate, rate_max = None, latency_factor = 2):
+        self.rate = rate
+        self.rate_max = rate_max if (rate and rate_max) else rate
+        self.rate_min = rate/10 if self.rate_max != rate else rate
+        self.increase = self.rate_max/20
+        self.latency_factor = latency_factor
+        self.latency = None
+        self.latency_min = None
+        self.cut = 0
+        self.cuts = 0
+        self.interval = 1/rate if rate else 0
+        self.slot = time.monotonic()
+
+    async def wait(self):
+        #Sleep until the next free start time (which may move while asleep)
+        while True:
+            now = time.monotonic()
+            if now >= self.slot:
+                self.slot = now + self.interval
+                return now
+            await asyncio.sleep(self.slot - now)
+
+    def setrate(self, rate):
+        self.rate = min(max(rate, self.rate_min), self.rate_max)
+        self.interval = 1/self.rate
+
+    def success(self, start):
+        #Track average response time and the fastest average seen (which
+        #drifts up slowly, so a lasting change in response time is relearned)
+        latency = time.monotonic() - start
+        if self.latency is None:
+            self.latency = latency
+            self.latency_min = latency
+        else:
+            self.latency = 0.9*self.latency + 0.1*latency
+            self.latency_min = min(self.latency, 1.01*self.latency_min)
+
+        if self.rate_max == self.rate_min:
+            return
+
+        #Back off on rising latency, otherwise speed up
+        if self.latency > self.latency_factor*self.latency_min:
+            self.backoff(start)
+        else:
+            self.setrate(self.rate + self.increase*self.interval)
+
+    def backoff(self, start, delay = None):
+        #Halve the rate (unless the request was sent before the last cut)
+        #and hold off all requests for the server's Retry-After delay
+        now = time.monotonic()
+        if (self.rate_max != self.rate_min) and (start >= self.cut):
+            self.setrate(self.rate/2)
+            self.cut = now
+            self.cuts = self.cuts + 1
+        if delay:
+            self.slot = max(self.slot, now + delay)
+
+
+class RetryBudget:
+
+    # =========================================================================
+    #     Class: RetryBudget( ratio = 0.1, minimum = 10)
+    #
+    #               ratio: Retries allowed per request sent
+    #               minimum: Retries allowed before any requests are sent
+    #
+    #     Description:  Global limit on retries, so a struggling server sees
+    #     at most ratio extra requests rather than every page retried
+    #     attempt_max times.
+    # =========================================================================
+
+    def __init__(self, ratio = 0.1, minimum = 10):
+        self.ratio = ratio
+        self.tokens = minimum
+
+    def request(self):
+        self.tokens = self.tokens + self.ratio
+
+    def retry(self):
+        if self.tokens < 1:
+            return False
+        self.tokens = self.tokens - 1
+        return True
+
+
+def retryafter( req ):
+    #Seconds to wait from a Retry-After header (seconds or HTTP date), or None
+    value = req.headers.get('Retry-After')
+    if value is None:
+        return None
+    try:
+        delay = float(value)
+    except ValueError:
+        try:
+            delay = (email.utils.parsedate_to_datetime(value) - datetime.datetime.now(datetime.timezone.utc)).total_seconds()
+        except (TypeError, ValueError):
+            return None
+    return min(max(delay, 0), RETRY_AFTER_MAX)
+
+
+class Fetcher:
+
+    # =========================================================================
+    #     Class: Fetcher( session , executor , rate , attempt_max ,
+    #                     attempt_delay , timeout , rate_max = None,
+    #                     retry_budget = 0.1, telemetry = None)
+    #
+    #     Description:  Fetches single pages for the fetch engine.  Requests
+    #     run in the thread pool executor and each request start waits for
+    #     the shared (adaptive) rate limiter.  Connection errors and
+    #     RETRY_STATUS responses are retried after a jittered exponential
+    #     delay while the global retry budget lasts; other responses are
+    #     returned as they are.  Fetch times, bytes received and errors (by
+    #     type) are recorded in the telemetry.
+    # =========================================================================
+
+    def __init__(self, session, executor, rate, attempt_max, attempt_delay, timeout,
+                 rate_max = None, retry_budget = 0.1, telemetry = None):
+        self.session = session
+        self.executor = executor
+        self.limiter = RateLimiter(rate, rate_max)
+        self.budget = RetryBudget(retry_budget)
+        self.attempt_max = attempt_max
+        self.attempt_delay = attempt_delay
+        self.timeout = timeout
+        self.telemetry = telemetry if telemetry is not None else Telemetry(interval = float('inf'))
+
+    async def fetch(self, url, headers = None):
+        loop = asyncio.get_running_loop()
+        self.budget.request()
+
+        #Request HTML from webpage
+        for attempt in range(1, self.attempt_max + 1):
+            start = await self.limiter.wait()
+            try:
+                req = await loop.run_in_executor(self.executor, partial(self.session.get, url, headers = headers, timeout = self.timeout))
+            except Exception as e:
+                self.telemetry.error(type(e).__name__)
+                self.limiter.backoff(start)
+            else:
+                self.telemetry.time('fetch', time.monotonic() - start)
+                self.telemetry.bytes_in = self.telemetry.bytes_in + req.raw.tell()
+                if req.status_code not in RETRY_STATUS:
+                    self.limiter.success(start)
+                    self.setrate()
+                    return req
+                self.telemetry.error('HTTP %d' % (req.status_code))
+                if req.status_code in (429, 503):
+                    self.session.throttled = self.session.throttled + 1
+                    self.limiter.backoff(start, retryafter(req))
+            self.setrate()
+
+            #Give up on the last attempt or once the retry budget is spent
+            if attempt == self.attempt_max:
+                break
+            if not self.budget.retry():
+                self.telemetry.error('retry budget spent')
+                break
+
+            #Jittered exponential delay
+            delay = random.uniform(0, min(self.attempt_delay*2**(attempt - 1), ATTEMPT_DELAY_MAX))
+            self.session.retries = self.session.retries + 1
+            await asyncio.sleep(delay)
+
+        print('    -Skipping page after %d attempts: %s' % (attempt, url))
+        self.telemetry.error('skipped')
+        return None
+
+    def setrate(self):
+        #Publish the current (adaptive) rate
+        self.session.rate = self.limiter.rate
+        if self.limiter.rate_max != self.limiter.rate_min:
+            self.telemetry.gauges['rate'] = self.limiter.rate
+
+
+def processpool( processes ):
+    #Create a process pool and start its workers.  Workers are forked where
+    #possible (so the calling script is not re-imported), and are started
+    #up front so they are forked before any fetch threads exist.
+    if 'fork' in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context('fork')
+    else:
+        context = None
+    executor = ProcessPoolExecutor(max_workers = processes, mp_context = context)
+    executor.submit(os.getpid).result()
+    return executor
+
+
+def fetchpage( url , session = None, attempt_max = 10, attempt_delay = 5,
+               timeout = 60, retry_budget = 0.1):
+
+    # =========================================================================
+    #     Function: fetchpage( url , session = None, attempt_max = 10,
+    #                          attempt_delay = 5, timeout = 60,
+    #                          retry_budget = 0.1)
+    #
+    #               url: Page URL to fetch
+    #               session: ScrapeSession to fetch with (one is created
+    #                        if not given)
+    #               (other arguments as in scrapepages)
+    #
+    #     Description:  Fetch a single page from a sequential loop through a
+    #     Fetcher, so it gets the same timeout and status-aware retries as
+    #     the concurrent fetch engine.
+    #
+    #     Argument/Return:  Returns the response, or None if the page still
+    #     failed or returned a RETRY_STATUS response after its attempts.
+    # =========================================================================
+
+    if session is None:
+        session = ScrapeSession(pool_size = 1)
+
+    async def fetch():
+        with ThreadPoolExecutor(max_workers = 1) as executor:
+            fetcher = Fetcher(session, executor, 1, attempt_max, attempt_delay, timeout,
+                              retry_budget = retry_budget)
+            return await fetcher.fetch(url)
+
+    return asyncio.run(fetch())
+
+
+def discoverpages( url_base , parse , page_size , session = None,
+                   concurrency = 8, rate = 1, rate_max = None, overlap = 0,
+                   key = None, attempt_max = 10, attempt_delay = 5,
+                   timeout = 60, retry_budget = 0.1):
+
+    # =========================================================================
+    #     Function: discoverpages( url_base , parse , page_size ,
+    #                              session = None, concurrency = 8, rate = 1,
+    #                              rate_max = None, overlap = 0, key = None,
+    #                              attempt_max = 10, attempt_delay = 5,
+    #                              timeout = 60, retry_budget = 0.1)
+    #
+    #               url_base: Listing URL ending in the start offset
+    #                         parameter (e.g. '...?b_start:int=')
+    #               parse: Function called as parse(html) that returns the
+    #                      list of items on a listing page
+    #               page_size: Items per listing page
+    #               session: ScrapeSession to fetch with (one is created
+    #                        if not given)
+    #               overlap: Items shared by neighbouring pages, so items
+    #                        that shift down a page while the listing is
+    #                        fetched are not missed
+    #               key: Function of an item used to drop repeated items
+    #                    (the item itself if None)
+    #               (other arguments as in scrapepages)
+    #
+    #     Description:  Gather every item of a paged listing.  The last
+    #     non-empty page is found first with an exponential then binary
+    #     search over the start offsets, then all pages up to it (plus one,
+    #     in case the listing grows) are fetched concurrently within the
+    #     rate budget.
+    #
+    #     Argument/Return:  Returns the items in listing order, keeping the
+    #     first of any repeated items.  Raises RuntimeError if any listing
+    #     page still fails or is not a 200 after its attempts, rather than
+    #     returning an incomplete listing.
+    # =========================================================================
+
+    if session is None:
+        session = ScrapeSession(pool_size = concurrency)
+
+    if overlap >= page_size:
+        raise ValueError('overlap must be smaller than page_size')
+
+    return asyncio.run(_discoverpages(url_base, parse, page_size, session, concurrency,
+                                      rate, rate_max, overlap, key, attempt_max,
+                                      attempt_delay, timeout, retry_budget))
+
+
+async def _discoverpages( url_base , parse , page_size , session , concurrency ,
+                          rate , rate_max , overlap , key , attempt_max ,
+                          attempt_delay , timeout , retry_budget ):
+
+    stride = page_size - overlap
+
+    with ThreadPoolExecutor(max_workers = concurrency) as executor:
+        fetcher = Fetcher(session, executor, rate, attempt_max, attempt_delay, timeout,
+                          rate_max, retry_budget)
+
+        async def listing(page):
+            #Items of a listing page (a page that could not be fetched would
+            #otherwise read as empty and leave a gap in the listing)
+            req = await fetcher.fetch(url_base + str(page*stride))
+            if (req is None) or (req.status_code != 200):
+                raise RuntimeError('Could not fetch listing page: %s' % (url_base + str(page*stride)))
+            return parse(req.text)
+
+        async def probe(page):
+            #Check whether a listing page has any items
+            return len(await listing(page)) > 0
+
+        #Find the last non-empty page (exponential search for an empty page,
+        #then binary search between the last non-empty and first empty page)
+        if not await probe(0):
+            return []
+        last, empty = 0, 1
+        while await probe(empty):
+            last, empty = empty, empty*2
+        while empty - last > 1:
+            page = (last + empty) // 2
+            if await probe(page):
+                last = page
+            else:
+                empty = page
+        print('Last listing page:  %d (offset %d)' % (last, last*stride))
+
+        #Fetch all pages concurrently
+        pages = iter(range(last + 2))
+        items = {}
+
+        async def worker():
+            for page in pages:
+                items[page] = await listing(page)
+
+        await asyncio.gather(*[worker() for _ in range(concurrency)])
+
+    #Join pages in listing order, dropping items repeated across pages
+    seen = set()
+    listing = []
+    for page in sorted(items):
+        for item in items[page]:
+            item_key = item if key is None else key(item)
+            if item_key not in seen:
+                seen.add(item_key)
+                listing.append(item)
+
+    return listing
+
+
+def _extractpage( extract , url , html ):
+    #Extract a page (runs in a worker), returning the rows, the parse and
+    #extraction times and the keys of missing fields filled in by the
+    #extraction function (counted in the telemetry rather than printed)
+    timings = {}
+    missing = []
+    rows = extract(url, html, timings = timings, missing = missing)
+    return rows, timings, missing
+
+
+def scrapepages( urls , extract , callback , session = None, concurrency = 8,
+                 rate = 1, rate_max = None, processes = None, queue_size = 32,
+                 attempt_max = 10, attempt_delay = 5, timeout = 60,
+                 headers = None, retry_budget = 0.1, telemetry = None):
+
+    # =========================================================================
+    #     Function: scrapepages( urls , extract , callback , session = None,
+    #                            concurrency = 8, rate = 1, rate_max = None,
+    #                            processes = None, queue_size = 32,
+    #                            attempt_max = 10, attempt_delay = 5,
+    #                            timeout = 60, headers = None,
+    #                            retry_budget = 0.1, telemetry = None)
+    #
+    #               urls: List of page URLs to scrape
+    #               extract: Extraction function called as
+    #                        extract(url, html, timings = dict,
+    #                        missing = list), filling in its 'parse' and
+    #                        'extract' seconds and the keys of fields not
+    #                        found (must be importable, e.g. from extractpy)
+    #               callback: Function called as
+    #                         callback(index, url, req, rows) to persist each
+    #                         page once it is extracted
+    #               session: ScrapeSession to fetch with (one is created
+    #                        if not given)
+    #               concurrency: Max requests in flight
+    #               rate: Max requests started per second (starting rate
+    #                     if rate_max is set)
+    #               rate_max: Let the rate adapt to the server's health up
+    #                         to rate_max (see RateLimiter), or None for a
+    #                         fixed rate
+    #               processes: Number of extraction processes (all cores if
+    #                          None)
+    #               queue_size: Max pages waiting between stages
+    #               attempt_max: Max attempts per page
+    #               attempt_delay: Base delay (seconds) between attempts,
+    #                              doubled each attempt and jittered
+    #               timeout: Request timeout (seconds)
+    #               headers: Function called as headers(url) that returns
+    #                        extra headers for that page's request (e.g.
+    #                        conditional request validators), or None
+    #               retry_budget: Retries allowed per page across the whole
+    #                             scrape (see RetryBudget)
+    #               telemetry: Telemetry to record fetch/write timers,
+    #                          errors and progress in (none kept if None)
+    #
+    #     Description:  Staged scrape pipeline.  Fetch workers (threads, up
+    #     to concurrency requests in flight) feed a bounded queue, a process
+    #     pool parses and extracts the pages, and a single writer thread
+    #     hands the rows to the callback.  When a later stage falls behind, its
+    #     bounded queue fills and the earlier stage waits, so memory stays
+    #     flat and parsing never holds up the network requests.
+    #
+    #     Argument/Return:  Pages are handed to the callback in completion
+    #     order (not list order).  Pages that still fail or return a
+    #     RETRY_STATUS response after their attempts (or once the retry
+    #     budget is spent) are skipped.  304 Not Modified responses are not
+    #     extracted (rows is None), and pages whose extraction fails are
+    #     passed on with no rows.  Returns the number of pages handed to the
+    #     callback.
+    # =========================================================================
+
+    if session is None:
+        session = ScrapeSession(pool_size = concurrency)
+    if processes is None:
+        processes = os.cpu_count()
+
+    return asyncio.run(_scrapepages(urls, extract, callback, session, concurrency,
+                                    rate, rate_max, processes, queue_size, attempt_max,
+                                    attempt_delay, timeout, headers, retry_budget,
+                                    telemetry))
+
+
+async def _scrapepages( urls , extract , callback , session , concurrency ,
+                        rate , rate_max , processes , queue_size , attempt_max ,
+                        attempt_delay , timeout , headers , retry_budget ,
+                        telemetry ):
+
+    loop = asyncio.get_running_loop()
+    pages = iter(enumerate(urls))
+    fetched = asyncio.Queue(maxsize = queue_size)
+    extracted = asyncio.Queue(maxsize = queue_size)
+    written = []
+
+    #Start the extraction processes before the fetch threads.  The callback
+    #runs in a single writer thread, so pages are persisted one at a time in
+    #order while archive compression and commits do not hold up the fetches.
+    with processpool(processes) as pool, ThreadPoolExecutor(max_workers = concurrency) as executor, \
+         ThreadPoolExecutor(max_workers = 1) as writer:
+        fetcher = Fetcher(session, executor, rate, attempt_max, attempt_delay, timeout,
+                          rate_max, retry_budget, telemetry)
+        telemetry = fetcher.telemetry
+
+        async def fetchstage():
+            #Fetch pages until the list is exhausted
+            for index, url in pages:
+                req = await fetcher.fetch(url, headers(url) if headers else None)
+                if req is not None:
+                    await fetched.put((index, url, req))
+
+        async def extractstage():
+            #Extract fetched pages in the process pool
+            while True:
+                page = await fetched.get()
+                if page is None:
+                    break
+                index, url, req = page
+                rows = None
+                if req.status_code != 304:
+                    try:
+                        rows, timings, missing = await loop.run_in_executor(pool, _extractpage, extract, url, req.text)
+                        for stage, seconds in timings.items():
+                            telemetry.time(stage, seconds)
+                        for key in missing:
+                            telemetry.error('missing %s' % (key))
+                    except Exception as e:
+                        print('    -Could not extract page: %s (%s)' % (url, e))
+                        telemetry.error('extract %s' % (type(e).__name__))
+                        rows = []
+                await extracted.put((index, url, req, rows))
+
+        async def writestage():
+            #Persist extracted pages
+            while True:
+                page = await extracted.get()
+                if page is None:
+                    break
+                start = time.monotonic()
+                await loop.run_in_executor(writer, partial(callback, *page))
+                telemetry.time('write', time.monotonic() - start)
+                telemetry.page()
+                written.append(page[0])
+
+        async def fetchall():
+            await asyncio.gather(*[fetchstage() for _ in range(concurrency)])
+            for _ in range(processes):
+                await fetched.put(None)
+
+        async def extractall():
+            await asyncio.gather(*[extractstage() for _ in range(processes)])
+            await extracted.put(None)
+
+        await asyncio.gather(fetchall(), extractall(), writestage())
+
+    return len(written)
+
+
+class Journal:
+
+    # =========================================================================
+    #     Class: Journal( path )
+    #
+    #               path: SQLite file to store progress in
+    #
+    #     Description:  Durable progress journal for the page scrapers.  Each
+    #     completed page ID and its extracted [ID, Key, Value] rows are
+    #     committed in one transaction as soon as the page is extracted, so a
+    #     crash loses at most the pages still in flight.  Re-running a scraper
+    #     skips every ID already in the journal.  The page's ETag and
+    #     Last-Modified validators are kept so later runs can revalidate it
+    #     with a conditional request, and the output shard holding the page's
+    #     current rows is tracked (see ShardWriter).
+    # =========================================================================
+
+    def __init__(self, path):
+        #Pages are recorded from the scrape pipeline's writer thread
+        self.conn = sqlite3.connect(path, check_same_thread = False)
+        self.conn.execute('PRAGMA journal_mode = WAL')
+        self.conn.execute('PRAGMA synchronous = NORMAL')
+        with self.conn:
+            self.conn.execute('CREATE TABLE IF NOT EXISTS pages (id TEXT PRIMARY KEY, url TEXT, completed REAL)')
+            self.conn.execute('CREATE TABLE IF NOT EXISTS rows (id TEXT, key TEXT, value)')
+            self.conn.execute('CREATE INDEX IF NOT EXISTS rows_id ON rows (id)')
+
+            #Add validator/shard columns to journals created before they existed
+            cols = [col[1] for col in self.conn.execute('PRAGMA table_info(pages)')]
+            for col in ['etag', 'last_modified', 'shard']:
+                if col not in cols:
+                    self.conn.execute('ALTER TABLE pages ADD COLUMN %s TEXT' % col)
+
+    def done(self):
+        #Return set of completed page IDs
+        return set(page_id for (page_id,) in self.conn.execute('SELECT id FROM pages'))
+
+    def validators(self):
+        #Return conditional request headers for each completed page ID
+        validators = {}
+        for page_id, etag, last_modified in self.conn.execute('SELECT id, etag, last_modified FROM pages'):
+            headers = {}
+            if etag is not None:
+                headers['If-None-Match'] = etag
+            if last_modified is not None:
+                headers['If-Modified-Since'] = last_modified
+            validators[page_id] = headers
+        return validators
+
+    def record(self, page_id, url, rows, headers = None):
+        #Replace the page's rows and mark it complete in one transaction
+        #(validators are taken from the response headers if given, and kept
+        #as they are otherwise, e.g. when replaying archived pages; the new
+        #rows are not in any output shard yet)
+        with self.conn:
+            self.conn.execute('DELETE FROM rows WHERE id = ?', (page_id,))
+            self.conn.executemany('INSERT INTO rows (id, key, value) VALUES (?, ?, ?)', rows)
+            self.conn.execute('''INSERT INTO pages (id, url, completed) VALUES (?, ?, ?)
+                                 ON CONFLICT (id) DO UPDATE SET url = excluded.url, completed = excluded.completed, shard = NULL''',
+                              (page_id, url, time.time()))
+            if headers is not None:
+                self.conn.execute('UPDATE pages SET etag = ?, last_modified = ? WHERE id = ?',
+                                  (headers.get('ETag'), headers.get('Last-Modified'), page_id))
+
+    def rows(self, page_id = None):
+        #Iterate through all recorded rows (or one page's rows) in the order they were recorded
+        if page_id is None:
+            return self.conn.execute('SELECT id, key, value FROM rows ORDER BY rowid')
+        return self.conn.execute('SELECT id, key, value FROM rows WHERE id = ? ORDER BY rowid', (page_id,))
+
+    def unsharded(self):
+        #Return IDs of pages whose current rows are not in an output shard
+        return [page_id for (page_id,) in self.conn.execute('SELECT id FROM pages WHERE shard IS NULL ORDER BY completed')]
+
+    def shard(self, page_ids, shard):
+        #Record the output shard holding each page's current rows
+        with self.conn:
+            self.conn.executemany('UPDATE pages SET shard = ? WHERE id = ?', [(shard, page_id) for page_id in page_ids])
+
+    def shards(self):
+        #Return set of output shards holding current rows
+        return set(shard for (shard,) in self.conn.execute('SELECT DISTINCT shard FROM pages WHERE shard IS NOT NULL'))
+
+    def close(self):
+        self.conn.close()
+
+
+class ShardWriter:
+
+    # =========================================================================
+    #     Class: ShardWriter( directory , journal , shard_size = 64*2**20,
+    #                         format = 'csv', batch_rows = 8192)
+    #
+    #               directory: Output directory for the molten data shards
+    #               journal: Journal the pages are recorded in
+    #               shard_size: Shard size (bytes) at which a new shard starts
+    #               format: Shard format, 'csv' or 'parquet'
+    #               batch_rows: Rows per parquet row group
+    #
+    #     Description:  Streams molten [ID, Key, Value] rows to disk while
+    #     the scrape runs.  Rows are appended to an open shard file, which is
+    #     renamed to part-NNNNN.csv (or .parquet) once it reaches shard_size,
+    #     and the journal then records which shard holds each page.  Pages
+    #     recorded but not yet in a finished shard (e.g. after a crash, or
+    #     pages re-recorded by a refresh/replay) are written again into a
+    #     newer shard, which supersedes the older copy when the shards are
+    #     read (cleanpy.readshards keeps each ID from its newest shard only).
+    #
+    #     Details: Parquet shards store ID and Key dictionary-encoded and
+    #     Value as large strings (zstd compressed), so they load without
+    #     pandas' slow python-engine csv path.
+    # =========================================================================
+
+    def __init__(self, directory, journal, shard_size = 64*2**20, format = 'csv', batch_rows = 8192):
+        if (format == 'parquet') and (pq is None):
+            raise ImportError('pyarrow is required to write parquet shards')
+
+        self.directory = directory
+        self.journal = journal
+        self.shard_size = shard_size
+        self.format = format
+        self.batch_rows = batch_rows
+        self.file = None
+        self.page_ids = []
+        self.batch = []
+        os.makedirs(directory, exist_ok = True)
+
+        #Remove unfinished shard left by an interrupted run
+        for name in os.listdir(directory):
+            if name.endswith('.tmp'):
+                os.remove(os.path.join(directory, name))
+
+        #Number new shards after the newest existing one
+        self.index = 0
+        for name in os.listdir(directory):
+            if name.startswith('part-'):
+                self.index = max(self.index, int(name[5:10]) + 1)
+
+        #Write pages recorded but not yet in a finished shard
+        for page_id in journal.unsharded():
+            self.write(page_id, journal.rows(page_id))
+
+    def write(self, page_id, rows):
+        #Start a new shard if needed
+        if self.file is None:
+            self.name = 'part-%05d.%s' % (self.index, self.format)
+            self.path = os.path.join(self.directory, self.name + '.tmp')
+            if self.format == 'parquet':
+                self.file = pq.ParquetWriter(self.path, MOLTEN_SCHEMA, compression = 'zstd')
+            else:
+                self.file = open(self.path, 'w', encoding = 'utf-8', newline = '')
+                self.writer = csv.writer(self.file)
+                self.writer.writerow(['ID', 'Key', 'Value'])
+
+        #Append page rows
+        if self.format == 'parquet':
+            self.batch.extend(rows)
+            if len(self.batch) >= self.batch_rows:
+                self.writebatch()
+        else:
+            self.writer.writerows(rows)
+        self.page_ids.append(page_id)
+
+        #Finish shard once it reaches the size limit
+        if os.path.getsize(self.path) >= self.shard_size:
+            self.flush()
+
+    def writebatch(self):
+        #Write buffered rows to the open parquet shard as one row group
+        if len(self.batch) == 0:
+            return
+        ids, keys, vals = zip(*self.batch)
+        table = pa.table([pa.array(ids, pa.string()).dictionary_encode(),
+                          pa.array(keys, pa.string()).dictionary_encode(),
+                          pa.array([None if val is None else str(val) for val in vals], pa.large_string())],
+                         schema = MOLTEN_SCHEMA)
+        self.file.write_table(table)
+        self.batch = []
+
+    def flush(self):
+        #Finish the open shard and record which pages it holds
+        if self.file is None:
+            return
+        if self.format == 'parquet':
+            self.writebatch()
+        self.file.close()
+        os.replace(self.path, os.path.join(self.directory, self.name))
+        self.journal.shard(self.page_ids, self.name)
+        self.file = None
+        self.page_ids = []
+        self.index = self.index + 1
+
+    def close(self):
+        #Finish the open shard and remove shards fully superseded by newer ones
+        self.flush()
+        shards = self.journal.shards()
+        for name in os.listdir(self.directory):
+            if name.startswith('part-') and (name not in shards):
+                os.remove(os.path.join(self.directory, name))
+
+
+class Archive:
+
+    # =========================================================================
+    #     Class: Archive( path , level = 10)
+    #
+    #               path: SQLite file to store pages in
+    #               level: Compression level
+    #
+    #     Description:  Compressed, content-addressed archive of raw page
+    #     responses.  Page bodies are stored once per SHA-256 digest
+    #     (compressed with zstd, or zlib if zstandard is not installed), and
+    #     every fetch is logged by URL and fetch time with a pointer to its
+    #     body.  Re-fetching an unchanged page only adds a log entry.
+    # =========================================================================
+
+    def __init__(self, path, level = 10):
+        #Pages are stored from the scrape pipeline's writer thread
+        self.conn = sqlite3.connect(path, check_same_thread = False)
+        self.conn.execute('PRAGMA journal_mode = WAL')
+        self.conn.execute('PRAGMA synchronous = NORMAL')
+        with self.conn:
+            self.conn.execute('CREATE TABLE IF NOT EXISTS bodies (sha TEXT PRIMARY KEY, codec TEXT, data BLOB)')
+            self.conn.execute('CREATE TABLE IF NOT EXISTS fetches (url TEXT, fetched REAL, status INTEGER, encoding TEXT, sha TEXT)')
+            self.conn.execute('CREATE INDEX IF NOT EXISTS fetches_url ON fetches (url, fetched)')
+
+        #Set compressor
+        if zstandard is not None:
+            self.codec = 'zstd'
+            self.compressor = zstandard.ZstdCompressor(level = level)
+        else:
+            self.codec = 'zlib'
+            self.compressor = None
+        self.level = level
+
+    def store(self, url, req):
+        #Compress and store the body under its digest, then log the fetch
+        body = req.content
+        sha = hashlib.sha256(body).hexdigest()
+        if self.codec == 'zstd':
+            data = self.compressor.compress(body)
+        else:
+            data = zlib.compress(body, min(self.level, 9))
+
+        with self.conn:
+            self.conn.execute('INSERT OR IGNORE INTO bodies (sha, codec, data) VALUES (?, ?, ?)', (sha, self.codec, data))
+            self.conn.execute('INSERT INTO fetches (url, fetched, status, encoding, sha) VALUES (?, ?, ?, ?, ?)',
+                              (url, time.time(), req.status_code, req.encoding or req.apparent_encoding, sha))
+
+    def latest(self):
+        #Iterate through the latest successful fetch of each URL
+        return self.conn.execute('''SELECT f.url, f.encoding, b.codec, b.data
+                                     FROM fetches f JOIN bodies b ON f.sha = b.sha
+                                     WHERE f.status = 200 AND f.fetched =
+                                        (SELECT MAX(fetched) FROM fetches WHERE url = f.url AND status = 200)
+                                     ORDER BY f.rowid''')
+
+    def count(self):
+        #Return number of URLs with a successful fetch
+        return self.conn.execute('SELECT COUNT(DISTINCT url) FROM fetches WHERE status = 200').fetchone()[0]
+
+    def close(self):
+        self.conn.close()
+
+
+def decompress( codec , data ):
+    #Decompress an archived page body
+    if codec == 'zstd':
+        return zstandard.ZstdDecompressor().decompress(data)
+    return zlib.decompress(data)
+
+
+def decodepage( encoding , codec , data ):
+    #Return the HTML text of an archived page body
+    return decompress(codec, data).decode(encoding or 'utf-8', errors = 'replace')
+
+
+def _replaybatch( extract , batch ):
+    #Decompress and extract a batch of archived pages (runs in a worker)
+    results = []
+    for url, encoding, codec, data in batch:
+        start = time.perf_counter()
+        html = decodepage(encoding, codec, data)
+        rows, timings, missing = _extractpage(extract, url, html)
+        timings['decode'] = time.perf_counter() - start - sum(timings.values())
+        results.append((url, rows, timings, missing))
+    return results
+
+
+def replaypages( archive , extract , callback , processes = None, batch_size = 64,
+                 telemetry = None):
+
+    # =========================================================================
+    #     Function: replaypages( archive , extract , callback ,
+    #                            processes = None, batch_size = 64,
+    #                            telemetry = None)
+    #
+    #               archive: Archive to replay
+    #               extract: Extraction function (as in scrapepages)
+    #               callback: Function called as callback(index, url, rows)
+    #                         for each page as it is extracted
+    #               processes: Number of worker processes (all cores if None)
+    #               batch_size: Number of pages sent to a worker at once
+    #               telemetry: Telemetry to record decode/parse/extract/write
+    #                          timers and progress in (none kept if None)
+    #
+    #     Description:  Re-run extraction over the latest archived copy of
+    #     every page, with no network.  Pages are sent to a process pool in
+    #     batches, with only a few batches in flight per worker so memory
+    #     stays flat however large the archive is.
+    #
+    #     Argument/Return:  Pages are handed to the callback in completion
+    #     order.  Returns the number of pages replayed.
+    # =========================================================================
+
+    if processes is None:
+        processes = os.cpu_count()
+    if telemetry is None:
+        telemetry = Telemetry(interval = float('inf'))
+
+    pages = archive.latest()
+    index = 0
+    pending = set()
+
+    with processpool(processes) as executor:
+        while True:
+            #Keep two batches per worker in flight
+            while len(pending) < 2*processes:
+                batch = pages.fetchmany(batch_size)
+                if len(batch) == 0:
+                    break
+                pending.add(executor.submit(_replaybatch, extract, batch))
+
+            if len(pending) == 0:
+                break
+
+            #Hand completed batches to the callback
+            completed, pending = wait(pending, return_when = FIRST_COMPLETED)
+            for future in completed:
+                for url, rows, timings, missing in future.result():
+                    for stage, seconds in timings.items():
+                        telemetry.time(stage, seconds)
+                    for key in missing:
+                        telemetry.error('missing %s' % (key))
+                    start = time.monotonic()
+                    callback(index, url, rows)
+                    telemetry.time('write', time.monotonic() - start)
+                    telemetry.page()
+                    index = index + 1
+
+    return index
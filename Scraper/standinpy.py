@@ -0,0 +1,353 @@
+# -*- coding: utf-8 -*-
+"""
+WTA Stand-in Server
+Author: Joseph DeGregorio
+
+Description:  Local HTTP stand-in for the parts of www.wta.org the scrapers
+use (the hike listing, the trip report listing, hike pages and trip report
+pages), so scraper throughput can be measured and tuned offline.  Pages are
+served from the scrapers' page archives when they exist, otherwise from
+synthetic pages with the same markup.  Response latency, server errors and
+429 rate limiting are configurable, and conditional requests (ETag /
+Last-Modified) and gzip are supported like the real site.
+
+"""
+import collections
+import datetime
+import gzip
+import hashlib
+import random
+import threading
+import time
+import urllib.parse
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import scrapepy
+
+#Listing page paths and the hike listing page size
+HIKE_LISTING = '/go-outside/hikes'
+REPORT_LISTING = '/@@search_tripreport_listing'
+HIKE_LISTING_SIZE = 30
+
+#Page path prefixes
+HIKE_PATH = '/go-hiking/hikes/'
+REPORT_PATH = '/go-hiking/trip-reports/trip_report.'
+
+#Boilerplate outside the wrapper division (navigation, scripts, footer) that
+#pads synthetic pages to the size of real pages
+BOILERPLATE = ('<div class="portlet"><ul class="nav">' +
+               ''.join('<li><a href="/section-%d" class="nav-link">Section %d</a></li>' % (i, i) for i in range(20)) +
+               '</ul><script type="text/javascript">var config = {"analytics": true, "region": "wa"};</script></div>\n')
+
+#Synthetic page values
+REGIONS = ['Snoqualmie Region -- North Bend Area', 'Mount Rainier Area -- Sunrise/White River',
+           'Central Cascades -- Leavenworth Area', 'North Cascades -- Mountain Loop Highway',
+           'Olympic Peninsula -- Hood Canal', 'Puget Sound and Islands -- Seattle-Tacoma Area']
+FEATURES = ['Dogs allowed on leash', 'Dogs not allowed', 'Established campsites', 'Fall foliage', 'Good for kids',
+            'Lakes', 'Rivers', 'Mountain views', 'Summits', 'Ridges/passes', 'Old growth', 'Wildflowers/Meadows',
+            'Wildlife', 'Waterfalls']
+DISTANCES = [', roundtrip', ', one-way', ' of trails']
+PASSES = ['Discover Pass', 'Northwest Forest Pass', 'National Park Pass', 'No pass required']
+CONDITIONS = ['Trail in good condition', 'Muddy or wet trail', 'Trees down across trail',
+              'Snow on trail', 'Overgrown in places', 'Bridge out', 'Bugs were bad']
+WORDS = ['trail', 'snow', 'lake', 'views', 'muddy', 'bridge', 'summit', 'trees', 'creek', 'parking']
+
+
+def padpage( body , padding ):
+    #Wrap a wrapper division in a page padded with boilerplate (split between
+    #whole blocks, so the wrapper never lands inside a boilerplate tag)
+    n = max(padding // len(BOILERPLATE), 0)
+    half = n // 2
+    return ('<html><head><title>Washington Trails Association</title></head><body>\n' +
+            BOILERPLATE*half + body + BOILERPLATE*(n - half) + '</body></html>\n')
+
+
+def hikepage( hike_id , padding = 100000, seed = 0):
+
+    # =========================================================================
+    #     Function: hikepage( hike_id , padding = 100000, seed = 0)
+    #
+    #               hike_id: Hike ID (last part of the hike URL)
+    #               padding: Bytes of boilerplate around the hike wrapper
+    #               seed: Seed for the page values
+    #
+    #     Description:  Synthetic hike page with the markup of a real one.
+    # =========================================================================
+
+    rng = random.Random('%s-%s' % (seed, hike_id))
+    features = rng.sample(FEATURES, rng.randint(0, 4))
+    location = rng.choice(REGIONS)
+    distance = rng.choice(DISTANCES)
+    votes = 1 if rng.random() < 0.2 else rng.randint(0, 500)
+    body = ('<div id="hike-wrapper">\n'
+            '<h1 class="documentFirstHeading">%s</h1>\n'
+            '<div id="hike-region"><span>%s</span></div>\n'
+            '<div class="hike-stat" id=""><h4 id="">Location</h4><div id="">%s</div></div>\n'
+            '<div class="hike-stat" id=""><h4 id="">Length</h4><div id="distance"><span>%.1f miles%s</span></div></div>\n'
+            '<div class="hike-stat" id=""><h4 id="">Elevation</h4><div id="">Gain: %d ft.</div><div id="">Highest Point: %d feet</div></div>\n'
+            '<div class="current-rating">%.2f out of 5</div><div class="rating-count">(%d %s)</div>\n'
+            '<div id="hike-features">%s</div>\n'
+            '<a title="Learn more about the various types of recreation passes in Washington">%s</a>\n'
+            '%s'
+            '<span class="ReportCount">%d</span>\n'
+            '<div id="hike-body-text">%s</div>\n'
+            '<div id="driving-directions"><p>Take I-90 east to exit %d.</p><p>Turn left and continue %d miles.</p></div>\n'
+            '<div class="latlong"><span>%.4f</span><span>%.4f</span></div>\n'
+            '<div id="trailhead-details"><p>%s Trailhead</p><p>See weather forecast</p></div>\n'
+            '</div>\n') % (hike_id.replace('-', ' ').title(),
+                           location.partition(' -- ')[0],
+                           location,
+                           rng.uniform(1, 20), distance,
+                           rng.randint(100, 5000), rng.randint(500, 8000),
+                           rng.uniform(0, 5), votes, 'vote' if votes == 1 else 'votes',
+                           ''.join('<div class="%s" data-title="%s"></div>' % ('feature alpha ' if i == 0 else 'feature ', f)
+                                   for i, f in enumerate(features)),
+                           rng.choice(PASSES),
+                           '<div class="alert orange"><span>Road closed</span></div>\n' if rng.random() < 0.1 else '',
+                           rng.randint(0, 2000),
+                           ''.join('<p>%s</p>' % (' '.join(rng.choice(WORDS) for _ in range(40))) for _ in range(rng.randint(1, 5))),
+                           rng.randint(1, 200), rng.randint(1, 30),
+                           rng.uniform(45.6, 49.0), rng.uniform(-124.5, -117.0),
+                           hike_id.replace('-', ' ').title())
+    return padpage(body, padding)
+
+
+def reportpage( report_id , hike_id , date , padding = 100000, seed = 0):
+
+    # =========================================================================
+    #     Function: reportpage( report_id , hike_id , date , padding = 100000,
+    #                           seed = 0)
+    #
+    #               report_id: Report ID (part of the report URL after
+    #                          "trip_report.")
+    #               hike_id: Hike ID the report is for
+    #               date: Report date (YYYY-MM-DD)
+    #               padding: Bytes of boilerplate around the report wrapper
+    #               seed: Seed for the page values
+    #
+    #     Description:  Synthetic trip report page with the markup of a real
+    #     one.
+    # =========================================================================
+
+    rng = random.Random('%s-%s' % (seed, report_id))
+    conditions = ',    '.join(rng.sample(CONDITIONS, rng.randint(1, 3)))
+    body = ('<div id="report-wrapper">\n'
+            '<h1 class="documentFirstHeading"><a href="https://www.wta.org%s%s">%s</a></h1>\n'
+            '<span itemprop="author"><a href="https://www.wta.org/@@/user%d">Hiker %d</a></span>\n'
+            '<span class="elapsed-time" datetime="%s">%s</span>\n'
+            '<div class="trip-condition"><h4>Type of Hike</h4><span>Day hike</span></div>\n'
+            '<div class="trip-condition"><h4>Trail Conditions</h4><span>%s</span></div>\n'
+            '<div class="trip-condition"><h4>Road</h4><span>Road suitable for all vehicles</span></div>\n'
+            '<div id="trip-features">%s</div>\n'
+            '<div id="tripreport-body-text">%s</div>\n'
+            '%s'
+            '<span class="total-thumbs-up">%d</span>\n'
+            '</div>\n') % (HIKE_PATH, hike_id, hike_id.replace('-', ' ').title(),
+                           rng.randint(0, 20000), rng.randint(0, 20000),
+                           date, date,
+                           conditions,
+                           '<div data-title="Hiked with kids"></div>' if rng.random() < 0.2 else '',
+                           ''.join('<p>%s</p>' % (' '.join(rng.choice(WORDS) for _ in range(60))) for _ in range(rng.randint(1, 6))),
+                           '<div class="captioned-image"></div>'*rng.randint(0, 8),
+                           rng.randint(0, 10))
+    return padpage(body, padding)
+
+
+def synthpages( n_hikes = 600, n_reports = 3000, padding = 100000, seed = 0):
+
+    # =========================================================================
+    #     Function: synthpages( n_hikes = 600, n_reports = 3000,
+    #                           padding = 100000, seed = 0)
+    #
+    #     Description:  Synthetic hike and report pages.
+    #
+    #     Argument/Return:  Returns (pages, hikes, reports), where pages maps
+    #     page paths to HTML, hikes lists the hike paths in listing order and
+    #     reports lists (report path, date) newest first.
+    # =========================================================================
+
+    rng = random.Random(seed)
+    pages = {}
+    hikes = []
+    reports = []
+    hike_ids = ['hike-%d' % (i) for i in range(n_hikes)]
+
+    for hike_id in hike_ids:
+        pages[HIKE_PATH + hike_id] = hikepage(hike_id, padding, seed)
+        hikes.append(HIKE_PATH + hike_id)
+
+    for i in range(n_reports):
+        date = (datetime.date(2018, 8, 31) - datetime.timedelta(days = i // 5)).isoformat()
+        report_id = '%s.%d' % (date, 1000000 - i)
+        pages[REPORT_PATH + report_id] = reportpage(report_id, rng.choice(hike_ids), date, padding, seed)
+        reports.append((REPORT_PATH + report_id, date))
+
+    return pages, hikes, reports
+
+
+def archivepages( hike_archive , report_archive ):
+
+    # =========================================================================
+    #     Function: archivepages( hike_archive , report_archive )
+    #
+    #               hike_archive: Path of the hike page archive
+    #               report_archive: Path of the report page archive
+    #
+    #     Description:  Recorded hike and report pages from the page
+    #     scrapers' archives (the latest copy of each page).
+    #
+    #     Argument/Return:  Returns (pages, hikes, reports) as in synthpages.
+    #     Reports are dated by their report ID.
+    # =========================================================================
+
+    pages = {}
+    hikes = []
+    reports = []
+
+    for path, listing in [(hike_archive, hikes), (report_archive, reports)]:
+        archive = scrapepy.Archive(path)
+        for url, encoding, codec, data in archive.latest():
+            page = urllib.parse.urlsplit(url).path
+            pages[page] = scrapepy.decodepage(encoding, codec, data)
+            listing.append(page)
+        archive.close()
+
+    reports = [(page, page.rpartition('trip_report.')[2][:10]) for page in reports]
+    reports.sort(key = lambda report: report[0].rpartition('trip_report.')[2], reverse = True)
+
+    return pages, hikes, reports
+
+
+class StandinHandler(BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        server = self.server
+        url = urllib.parse.urlsplit(self.path)
+        query = dict(urllib.parse.parse_qsl(url.query))
+
+        #Simulated response time
+        if server.latency or server.jitter:
+            time.sleep(max(server.latency + random.uniform(-server.jitter, server.jitter), 0))
+
+        #Rate limiting and server errors
+        if server.throttled():
+            return self.respond(429, b'Too Many Requests', {'Retry-After': str(server.retry_after)})
+        if random.random() < server.error_rate:
+            return self.respond(random.choice([500, 502, 503]), b'Server Error')
+
+        #Listing pages
+        if url.path in (HIKE_LISTING, REPORT_LISTING):
+            start = int(query.get('b_start:int', 0))
+            if url.path == HIKE_LISTING:
+                size = HIKE_LISTING_SIZE
+                items = ['<a class="listitem-title" href="%s%s">Hike</a>\n' % (server.base_url, page)
+                         for page in server.hikes[start:start + size]]
+            else:
+                size = int(query.get('b_size', 100))
+                items = ['<div class="item"><a class="listitem-title" href="%s%s">Report</a>'
+                         '<span class="elapsed-time" datetime="%s">%s</span></div>\n' % (server.base_url, page, date, date)
+                         for page, date in server.reports[start:start + size]]
+            return self.respond(200, ('<html><body>%s</body></html>' % (''.join(items))).encode('utf-8'))
+
+        #Hike and report pages (with conditional requests)
+        page = server.page(url.path)
+        if page is None:
+            return self.respond(404, b'Not Found')
+        body, etag = page
+        headers = {'ETag': etag, 'Last-Modified': server.modified, 'Content-Type': 'text/html; charset=utf-8'}
+        if (self.headers.get('If-None-Match') == etag) or (self.headers.get('If-Modified-Since') == server.modified):
+            return self.respond(304, b'', headers)
+        return self.respond(200, body, headers)
+
+    def respond(self, status, body, headers = None):
+        #Send a response (gzipped if accepted)
+        if body and ('gzip' in self.headers.get('Accept-Encoding', '')):
+            body = gzip.compress(body, 6)
+            headers = dict(headers or {}, **{'Content-Encoding': 'gzip'})
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        self.server.count(status)
+
+    def log_message(self, *args):
+        pass
+
+
+class StandinServer(ThreadingHTTPServer):
+
+    # =========================================================================
+    #     Class: StandinServer( pages , hikes , reports , port = 0,
+    #                           latency = 0.05, jitter = 0.02,
+    #                           error_rate = 0, rate_limit = 0,
+    #                           retry_after = 1)
+    #
+    #               pages: Dictionary of page path to HTML
+    #               hikes: Hike paths in listing order
+    #               reports: (report path, date) in listing order
+    #               port: Port to listen on (any free port if 0)
+    #               latency: Mean response time (seconds)
+    #               jitter: Response time spread (+/- seconds)
+    #               error_rate: Fraction of requests answered with a 5xx
+    #               rate_limit: Requests per second above which requests
+    #                           are answered with 429 (no limit if 0)
+    #               retry_after: Retry-After (seconds) sent with 429s
+    #
+    #     Description:  Threaded stand-in for www.wta.org on localhost.  Use
+    #     start() to serve from a background thread; base_url is then the
+    #     address to use in place of https://www.wta.org.  Responses are
+    #     counted by status in stats.
+    # =========================================================================
+
+    daemon_threads = True
+
+    def __init__(self, pages, hikes, reports, port = 0, latency = 0.05, jitter = 0.02,
+                 error_rate = 0, rate_limit = 0, retry_after = 1):
+        super().__init__(('127.0.0.1', port), StandinHandler)
+        self.pages = {path: (html.encode('utf-8'), '"%s"' % (hashlib.sha1(html.encode('utf-8')).hexdigest()))
+                      for path, html in pages.items()}
+        self.hikes = hikes
+        self.reports = reports
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_limit = rate_limit
+        self.retry_after = retry_after
+        self.modified = formatdate(usegmt = True)
+        self.base_url = 'http://127.0.0.1:%d' % (self.server_address[1])
+        self.lock = threading.Lock()
+        self.recent = collections.deque()
+        self.stats = collections.Counter()
+        self.thread = None
+
+    def page(self, path):
+        return self.pages.get(path)
+
+    def throttled(self):
+        #Count requests over the last second against the rate limit
+        if not self.rate_limit:
+            return False
+        now = time.monotonic()
+        with self.lock:
+            self.recent.append(now)
+            while self.recent[0] < now - 1:
+                self.recent.popleft()
+            return len(self.recent) > self.rate_limit
+
+    def count(self, status):
+        with self.lock:
+            self.stats[status] = self.stats[status] + 1
+
+    def start(self):
+        self.thread = threading.Thread(target = self.serve_forever, daemon = True)
+        self.thread.start()
+        return self.base_url
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()